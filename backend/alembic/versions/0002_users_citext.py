@@ -0,0 +1,33 @@
+"""用户名和邮箱改用CITEXT
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS citext")
+
+    # 长度限制保留为CHECK约束，唯一索引随类型一起变为大小写不敏感
+    op.alter_column('users', 'username', type_=postgresql.CITEXT(), existing_nullable=False)
+    op.alter_column('users', 'email', type_=postgresql.CITEXT(), existing_nullable=False)
+    op.create_check_constraint('ck_users_username_length', 'users', 'char_length(username) <= 50')
+    op.create_check_constraint('ck_users_email_length', 'users', 'char_length(email) <= 100')
+
+
+def downgrade() -> None:
+    op.drop_constraint('ck_users_email_length', 'users', type_='check')
+    op.drop_constraint('ck_users_username_length', 'users', type_='check')
+    op.alter_column('users', 'email', type_=sa.String(length=100), existing_nullable=False)
+    op.alter_column('users', 'username', type_=sa.String(length=50), existing_nullable=False)
@@ -8,8 +8,8 @@ import sqlalchemy as sa
 from sqlalchemy.dialects import postgresql
 
 # revision identifiers
-revision = '003'
-down_revision = '002'
+revision = '0003'
+down_revision = '0002'
 branch_labels = None
 depends_on = None
 
@@ -0,0 +1,37 @@
+"""
+模板 GIN 索引迁移
+tags 改用 GIN 索引，metadata 增加 jsonb_path_ops GIN 索引
+"""
+
+from alembic import op
+
+# revision identifiers
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """升级数据库结构"""
+    
+    # btree 无法加速 @> / && 查询，替换为 GIN
+    op.drop_index('idx_template_tags', 'templates')
+    op.create_index(
+        'idx_template_tags', 'templates', ['tags'],
+        postgresql_using='gin',
+        postgresql_with={'fastupdate': 'on'}
+    )
+    
+    # metadata 只做包含查询，jsonb_path_ops 比默认 jsonb_ops 更小、维护更快
+    op.create_index(
+        'idx_template_metadata', 'templates', ['metadata'],
+        postgresql_using='gin',
+        postgresql_ops={'metadata': 'jsonb_path_ops'}
+    )
+
+def downgrade():
+    """降级数据库结构"""
+    
+    op.drop_index('idx_template_metadata', 'templates')
+    op.drop_index('idx_template_tags', 'templates')
+    op.create_index('idx_template_tags', 'templates', ['tags'])
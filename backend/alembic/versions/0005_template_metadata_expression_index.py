@@ -0,0 +1,26 @@
+"""
+模板元数据表达式索引迁移
+为 metadata -> 'industry' 增加定向 GIN 索引
+"""
+
+from alembic import op
+
+# revision identifiers
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """升级数据库结构"""
+    
+    # 整体 GIN 无法服务嵌套键查询，热点路径单独建更小的表达式索引
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_template_meta_industry
+        ON templates USING GIN ((metadata -> 'industry') jsonb_path_ops)
+    """)
+
+def downgrade():
+    """降级数据库结构"""
+    
+    op.execute("DROP INDEX IF EXISTS idx_template_meta_industry")
@@ -0,0 +1,68 @@
+"""
+模板评分聚合触发器迁移
+rating / rating_count / rating_sum 由 template_ratings 上的触发器增量维护
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """升级数据库结构"""
+    
+    # 1. 评分总和列，保证增量计算无舍入误差
+    op.add_column('templates', sa.Column('rating_sum', sa.Integer(), nullable=True, server_default='0'))
+    
+    # 2. 回填现有聚合值
+    op.execute("""
+        UPDATE templates t SET
+            rating_sum = COALESCE((SELECT sum(r.rating) FROM template_ratings r WHERE r.template_id = t.id), 0),
+            rating_count = (SELECT count(*) FROM template_ratings r WHERE r.template_id = t.id)
+    """)
+    op.execute("""
+        UPDATE templates SET
+            rating = CASE WHEN rating_count > 0 THEN round(rating_sum::numeric / rating_count, 2) ELSE 0 END
+    """)
+    
+    # 3. 触发器函数：UPDATE 视为先移除旧评分再加入新评分
+    op.execute("""
+        CREATE OR REPLACE FUNCTION template_rating_agg() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE templates SET
+                    rating_sum = rating_sum - OLD.rating,
+                    rating_count = rating_count - 1,
+                    rating = CASE WHEN rating_count > 1
+                        THEN round((rating_sum - OLD.rating)::numeric / (rating_count - 1), 2)
+                        ELSE 0 END
+                WHERE id = OLD.template_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE templates SET
+                    rating_sum = rating_sum + NEW.rating,
+                    rating_count = rating_count + 1,
+                    rating = round((rating_sum + NEW.rating)::numeric / (rating_count + 1), 2)
+                WHERE id = NEW.template_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    
+    op.execute("""
+        CREATE TRIGGER trg_template_rating_agg
+        AFTER INSERT OR DELETE OR UPDATE OF rating, template_id ON template_ratings
+        FOR EACH ROW EXECUTE FUNCTION template_rating_agg()
+    """)
+
+def downgrade():
+    """降级数据库结构"""
+    
+    op.execute("DROP TRIGGER IF EXISTS trg_template_rating_agg ON template_ratings")
+    op.execute("DROP FUNCTION IF EXISTS template_rating_agg()")
+    op.drop_column('templates', 'rating_sum')
@@ -0,0 +1,48 @@
+"""
+模板部分索引迁移
+列表查询几乎都带 is_public 条件，用部分索引替代整表单列索引
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """升级数据库结构"""
+    
+    # 热门：ORDER BY usage_count DESC, rating DESC
+    op.create_index('idx_template_public_usage', 'templates', ['usage_count', 'rating'],
+                    postgresql_where=sa.text('is_public'))
+    # 按评分排序
+    op.create_index('idx_template_public_rating', 'templates', ['rating'],
+                    postgresql_where=sa.text('is_public'))
+    # 最新：ORDER BY created_at DESC
+    op.create_index('idx_template_public_created', 'templates', ['created_at'],
+                    postgresql_where=sa.text('is_public'))
+    # 推荐：is_public AND is_featured ORDER BY created_at DESC
+    op.create_index('idx_template_featured_created', 'templates', ['created_at'],
+                    postgresql_where=sa.text('is_public AND is_featured'))
+    
+    # 删除被替代的整表单列索引
+    op.drop_index('idx_template_usage', 'templates')
+    op.drop_index('idx_template_rating', 'templates')
+    op.drop_index('idx_template_featured', 'templates')
+    op.drop_index('idx_template_public', 'templates')
+
+def downgrade():
+    """降级数据库结构"""
+    
+    op.create_index('idx_template_public', 'templates', ['is_public'])
+    op.create_index('idx_template_featured', 'templates', ['is_featured'])
+    op.create_index('idx_template_rating', 'templates', ['rating'])
+    op.create_index('idx_template_usage', 'templates', ['usage_count'])
+    
+    op.drop_index('idx_template_featured_created', 'templates')
+    op.drop_index('idx_template_public_created', 'templates')
+    op.drop_index('idx_template_public_rating', 'templates')
+    op.drop_index('idx_template_public_usage', 'templates')
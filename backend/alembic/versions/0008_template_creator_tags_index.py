@@ -0,0 +1,26 @@
+"""
+模板创建者+标签组合索引迁移
+借助 btree_gin 扩展在同一个 GIN 索引中组合 creator_id 与 tags
+"""
+
+from alembic import op
+
+# revision identifiers
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """升级数据库结构"""
+    
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    op.create_index(
+        'idx_template_creator_tags', 'templates', ['creator_id', 'tags'],
+        postgresql_using='gin'
+    )
+
+def downgrade():
+    """降级数据库结构"""
+    
+    op.drop_index('idx_template_creator_tags', 'templates')
@@ -0,0 +1,81 @@
+"""
+模板评分列改为 SMALLINT 迁移
+rating 以 评分×100 的整数存储（0-500），触发器同步改为整数计算
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """升级数据库结构"""
+    
+    op.alter_column(
+        'templates', 'rating',
+        type_=sa.SmallInteger(),
+        postgresql_using='round(rating * 100)::smallint',
+        server_default=None
+    )
+    
+    # 触发器改为计算 round(sum * 100 / count)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION template_rating_agg() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE templates SET
+                    rating_sum = rating_sum - OLD.rating,
+                    rating_count = rating_count - 1,
+                    rating = CASE WHEN rating_count > 1
+                        THEN round((rating_sum - OLD.rating) * 100.0 / (rating_count - 1))
+                        ELSE 0 END
+                WHERE id = OLD.template_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE templates SET
+                    rating_sum = rating_sum + NEW.rating,
+                    rating_count = rating_count + 1,
+                    rating = round((rating_sum + NEW.rating) * 100.0 / (rating_count + 1))
+                WHERE id = NEW.template_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+def downgrade():
+    """降级数据库结构"""
+    
+    op.alter_column(
+        'templates', 'rating',
+        type_=sa.Numeric(3, 2),
+        postgresql_using='rating / 100.0'
+    )
+    
+    op.execute("""
+        CREATE OR REPLACE FUNCTION template_rating_agg() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE templates SET
+                    rating_sum = rating_sum - OLD.rating,
+                    rating_count = rating_count - 1,
+                    rating = CASE WHEN rating_count > 1
+                        THEN round((rating_sum - OLD.rating)::numeric / (rating_count - 1), 2)
+                        ELSE 0 END
+                WHERE id = OLD.template_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE templates SET
+                    rating_sum = rating_sum + NEW.rating,
+                    rating_count = rating_count + 1,
+                    rating = round((rating_sum + NEW.rating)::numeric / (rating_count + 1), 2)
+                WHERE id = NEW.template_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
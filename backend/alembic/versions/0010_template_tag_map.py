@@ -0,0 +1,102 @@
+"""
+模板标签规范化迁移
+templates.tags 数组拆分为 template_tag_map 关联表，标签使用次数由触发器维护
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """升级数据库结构"""
+    
+    # 1. 创建关联表
+    op.create_table('template_tag_map',
+        sa.Column('template_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('tag_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.ForeignKeyConstraint(['template_id'], ['templates.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['tag_id'], ['template_tags.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('template_id', 'tag_id')
+    )
+    op.create_index('idx_tag_map_tag_template', 'template_tag_map', ['tag_id', 'template_id'])
+    
+    # 2. 补齐数组中出现但尚未登记的标签
+    op.execute("""
+        INSERT INTO template_tags (id, name, usage_count, is_featured)
+        SELECT gen_random_uuid(), t.name, 0, false
+        FROM (SELECT DISTINCT unnest(tags) AS name FROM templates) t
+        WHERE t.name IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM template_tags tt WHERE tt.name = t.name)
+    """)
+    
+    # 3. 迁移关联关系
+    op.execute("""
+        INSERT INTO template_tag_map (template_id, tag_id)
+        SELECT DISTINCT t.id, tt.id
+        FROM templates t
+        CROSS JOIN LATERAL unnest(t.tags) AS u(name)
+        JOIN template_tags tt ON tt.name = u.name
+    """)
+    
+    # 4. 按关联表重算标签使用次数
+    op.execute("""
+        UPDATE template_tags tt SET
+            usage_count = (SELECT count(*) FROM template_tag_map m WHERE m.tag_id = tt.id)
+    """)
+    
+    # 5. 触发器维护使用次数
+    op.execute("""
+        CREATE OR REPLACE FUNCTION template_tag_usage() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE template_tags SET usage_count = COALESCE(usage_count, 0) + 1 WHERE id = NEW.tag_id;
+            ELSE
+                UPDATE template_tags SET usage_count = COALESCE(usage_count, 0) - 1 WHERE id = OLD.tag_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_template_tag_usage
+        AFTER INSERT OR DELETE ON template_tag_map
+        FOR EACH ROW EXECUTE FUNCTION template_tag_usage()
+    """)
+    
+    # 6. 删除数组列及其索引
+    op.drop_index('idx_template_creator_tags', 'templates')
+    op.drop_index('idx_template_tags', 'templates')
+    op.drop_column('templates', 'tags')
+
+def downgrade():
+    """降级数据库结构"""
+    
+    op.add_column('templates', sa.Column('tags', postgresql.ARRAY(sa.String()), nullable=True))
+    op.execute("""
+        UPDATE templates t SET
+            tags = COALESCE((
+                SELECT array_agg(tt.name ORDER BY tt.name)
+                FROM template_tag_map m JOIN template_tags tt ON tt.id = m.tag_id
+                WHERE m.template_id = t.id
+            ), '{}')
+    """)
+    op.create_index(
+        'idx_template_tags', 'templates', ['tags'],
+        postgresql_using='gin',
+        postgresql_with={'fastupdate': 'on'}
+    )
+    op.create_index(
+        'idx_template_creator_tags', 'templates', ['creator_id', 'tags'],
+        postgresql_using='gin'
+    )
+    
+    op.execute("DROP TRIGGER IF EXISTS trg_template_tag_usage ON template_tag_map")
+    op.execute("DROP FUNCTION IF EXISTS template_tag_usage()")
+    op.drop_index('idx_tag_map_tag_template', 'template_tag_map')
+    op.drop_table('template_tag_map')
@@ -0,0 +1,90 @@
+"""
+API指标User-Agent去重迁移
+api_metrics.user_agent 文本列拆分为 user_agents 去重表，明细只保存整数ID
+
+监控表由 init_db 的 create_all 建立，不在 0001 中；仅转换已按旧结构建出的表，
+新库由 create_all 直接按新结构建表。
+"""
+
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+def _ua_hash(user_agent: str) -> bytes:
+    """与 MonitoringService._get_user_agent_id 相同的 blake2b 64位摘要"""
+    return hashlib.blake2b(user_agent.encode("utf-8", "replace"), digest_size=8).digest()
+
+def upgrade():
+    """升级数据库结构"""
+
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table('api_metrics'):
+        return
+    if 'user_agent' not in {c['name'] for c in inspector.get_columns('api_metrics')}:
+        return
+
+    # 1. 创建去重表（应用启动时 create_all 可能已建好）
+    if not inspector.has_table('user_agents'):
+        op.create_table('user_agents',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('ua_hash', sa.LargeBinary(length=8), nullable=False),
+            sa.Column('ua_text', sa.Text(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('ua_hash')
+        )
+
+    # 2. 添加ID列
+    op.add_column('api_metrics', sa.Column('user_agent_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        'api_metrics_user_agent_id_fkey', 'api_metrics', 'user_agents',
+        ['user_agent_id'], ['id'], ondelete='SET NULL'
+    )
+
+    # 3. 按应用相同的摘要登记去重后的User-Agent
+    user_agents = bind.execute(sa.text("""
+        SELECT DISTINCT user_agent FROM api_metrics
+        WHERE user_agent IS NOT NULL AND user_agent <> ''
+    """)).scalars().all()
+    if user_agents:
+        bind.execute(
+            sa.text("""
+                INSERT INTO user_agents (ua_hash, ua_text) VALUES (:ua_hash, :ua_text)
+                ON CONFLICT (ua_hash) DO NOTHING
+            """),
+            [{"ua_hash": _ua_hash(ua), "ua_text": ua} for ua in user_agents]
+        )
+
+    # 4. 回填ID
+    op.execute("""
+        UPDATE api_metrics m SET user_agent_id = ua.id
+        FROM user_agents ua
+        WHERE ua.ua_text = m.user_agent
+    """)
+
+    # 5. 删除文本列
+    op.drop_column('api_metrics', 'user_agent')
+
+def downgrade():
+    """降级数据库结构"""
+
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('api_metrics'):
+        return
+
+    op.add_column('api_metrics', sa.Column('user_agent', sa.Text(), nullable=True))
+    op.execute("""
+        UPDATE api_metrics m SET user_agent = ua.ua_text
+        FROM user_agents ua
+        WHERE ua.id = m.user_agent_id
+    """)
+    op.drop_constraint('api_metrics_user_agent_id_fkey', 'api_metrics', type_='foreignkey')
+    op.drop_column('api_metrics', 'user_agent_id')
+    op.drop_table('user_agents')
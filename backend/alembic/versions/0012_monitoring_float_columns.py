@@ -0,0 +1,68 @@
+"""
+监控指标列类型迁移
+指标值、响应时间、告警阈值由 numeric 改为 double precision，
+AI调用成本由 numeric 美元改为 bigint 微美元（1e-6 USD）
+
+监控表由 init_db 的 create_all 建立；仅转换仍为 numeric 的列。
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+# (表, 列, 原 numeric 精度)
+FLOAT_COLUMNS = (
+    ('system_metrics', 'metric_value', (15, 4)),
+    ('api_metrics', 'response_time', (10, 4)),
+    ('ai_model_metrics', 'response_time', (10, 4)),
+    ('alert_rules', 'threshold', (15, 4)),
+    ('alerts', 'current_value', (15, 4)),
+    ('alerts', 'threshold_value', (15, 4)),
+)
+
+def _data_type(bind, table: str, column: str):
+    """查询列的当前类型，表或列不存在时返回 None"""
+    return bind.execute(sa.text("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = :table AND column_name = :column
+    """), {"table": table, "column": column}).scalar()
+
+def upgrade():
+    """升级数据库结构"""
+
+    bind = op.get_bind()
+
+    # 1. 成本换算为整数微美元
+    if _data_type(bind, 'ai_model_metrics', 'cost') == 'numeric':
+        op.execute("""
+            ALTER TABLE ai_model_metrics
+            ALTER COLUMN cost TYPE bigint USING round(cost * 1000000)::bigint
+        """)
+
+    # 2. 其余指标列改为 double precision
+    for table, column, _ in FLOAT_COLUMNS:
+        if _data_type(bind, table, column) == 'numeric':
+            op.execute(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE double precision")
+
+def downgrade():
+    """降级数据库结构"""
+
+    bind = op.get_bind()
+
+    for table, column, (precision, scale) in FLOAT_COLUMNS:
+        if _data_type(bind, table, column) == 'double precision':
+            op.execute(
+                f"ALTER TABLE {table} ALTER COLUMN {column} TYPE numeric({precision}, {scale}) "
+                f"USING round({column}::numeric, {scale})"
+            )
+
+    if _data_type(bind, 'ai_model_metrics', 'cost') == 'bigint':
+        op.execute("""
+            ALTER TABLE ai_model_metrics
+            ALTER COLUMN cost TYPE numeric(10, 6) USING cost / 1000000.0
+        """)
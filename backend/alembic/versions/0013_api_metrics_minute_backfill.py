@@ -0,0 +1,54 @@
+"""
+API指标分钟汇总回填迁移
+建立 api_metrics_minute（若尚未由 create_all 建立），并按 api_metrics 明细回填历史分钟汇总
+
+明细是权威数据：已有汇总行按明细重算覆盖，明细已清理的分钟保留原汇总。
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """升级数据库结构"""
+
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('api_metrics'):
+        return
+
+    # 1. 创建汇总表
+    if not inspector.has_table('api_metrics_minute'):
+        op.create_table('api_metrics_minute',
+            sa.Column('endpoint', sa.String(length=200), nullable=False),
+            sa.Column('minute_ts', sa.DateTime(timezone=True), nullable=False),
+            sa.Column('request_count', sa.Integer(), nullable=False),
+            sa.Column('response_time_sum', sa.Float(), nullable=False),
+            sa.Column('error_count', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('endpoint', 'minute_ts')
+        )
+        op.create_index('idx_api_metrics_minute_ts', 'api_metrics_minute', ['minute_ts'])
+
+    # 2. 按明细回填
+    op.execute("""
+        INSERT INTO api_metrics_minute (endpoint, minute_ts, request_count, response_time_sum, error_count)
+        SELECT m.endpoint, date_trunc('minute', m."timestamp"),
+               count(*), sum(m.response_time), count(*) FILTER (WHERE m.status_code >= 400)
+        FROM api_metrics m
+        WHERE m."timestamp" IS NOT NULL
+        GROUP BY 1, 2
+        ON CONFLICT (endpoint, minute_ts) DO UPDATE SET
+            request_count = EXCLUDED.request_count,
+            response_time_sum = EXCLUDED.response_time_sum,
+            error_count = EXCLUDED.error_count
+    """)
+
+def downgrade():
+    """降级数据库结构"""
+
+    # 汇总表由模型定义，create_all 会重新建立；降级只撤销回填无意义，保留数据
+    pass
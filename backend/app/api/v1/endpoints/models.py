@@ -111,20 +111,14 @@ async def analyze_cost(
     cost_analysis = {}
     
     for model in models:
-        if model in ai_client.supported_models.get("openai", {}) or model in ai_client.supported_models.get("anthropic", {}):
+        model_info = ai_client.get_model_info(model)
+        if model_info is not None:
             # 计算token数量
             token_count = ai_client.count_tokens(text, model)
             
             # 获取成本信息
-            cost_per_1k = 0
-            provider = ""
-            
-            if model in ai_client.supported_models.get("openai", {}):
-                cost_per_1k = ai_client.supported_models["openai"][model]["cost_per_1k"]
-                provider = "openai"
-            elif model in ai_client.supported_models.get("anthropic", {}):
-                cost_per_1k = ai_client.supported_models["anthropic"][model]["cost_per_1k"]
-                provider = "anthropic"
+            cost_per_1k = model_info["cost_per_1k"]
+            provider = model_info["provider"]
             
             # 估算成本（输入 + 预估输出）
             estimated_output_tokens = min(token_count, 500)  # 假设输出不超过500 tokens
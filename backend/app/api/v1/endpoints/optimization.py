@@ -7,6 +7,7 @@ from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
 from uuid import UUID
 import asyncio
+import numpy as np
 
 from config.database import get_db
 from app.models.user import User, UserPreference
@@ -485,33 +486,41 @@ async def get_user_optimization_stats(
     db: Session = Depends(get_db)
 ):
     """获取用户的优化统计信息"""
-    # 获取用户的所有分析结果
-    user_analyses = db.query(AnalysisResult).join(
+    # 获取用户的所有分析结果（只取统计需要的列；后续多次使用，需完整列表）
+    user_analyses = db.query(
+        AnalysisResult.id,
+        AnalysisResult.overall_score,
+        AnalysisResult.created_at
+    ).join(
         AnalysisResult.prompt
     ).filter(
         AnalysisResult.prompt.has(user_id=current_user.id)
     ).all()
 
-    # 获取所有相关的优化建议
+    # 流式统计相关的优化建议，不加载完整的建议对象
     analysis_ids = [a.id for a in user_analyses]
-    all_suggestions = db.query(OptimizationSuggestion).filter(
+    suggestion_rows = db.query(
+        OptimizationSuggestion.suggestion_type,
+        OptimizationSuggestion.is_applied
+    ).filter(
         OptimizationSuggestion.analysis_id.in_(analysis_ids)
-    ).all()
+    ).yield_per(200)
 
     # 统计数据
     total_analyses = len(user_analyses)
-    total_suggestions = len(all_suggestions)
-    applied_suggestions = len([s for s in all_suggestions if s.is_applied])
+    total_suggestions = 0
+    applied_suggestions = 0
+    type_counts = {}
+    for suggestion_type, is_applied in suggestion_rows:
+        total_suggestions += 1
+        if is_applied:
+            applied_suggestions += 1
+        type_counts[suggestion_type] = type_counts.get(suggestion_type, 0) + 1
 
     # 平均分数
     avg_score = np.mean([a.overall_score for a in user_analyses]) if user_analyses else 0
 
     # 最常见的建议类型
-    type_counts = {}
-    for suggestion in all_suggestions:
-        suggestion_type = suggestion.suggestion_type
-        type_counts[suggestion_type] = type_counts.get(suggestion_type, 0) + 1
-
     most_common_type = max(type_counts.items(), key=lambda x: x[1])[0] if type_counts else None
 
     # 改进趋势（简化版）
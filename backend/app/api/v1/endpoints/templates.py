@@ -10,9 +10,10 @@ import asyncio
 
 from config.database import get_db
 from app.models.user import User
-from app.models.template import Template, TemplateRating, TemplateUsage, TemplateCategory, TemplateTag
+from app.models.template import Template, TemplateRating, TemplateCategory, TemplateTag
+from app.services.template_usage import record_template_usage
 from app.api.v1.endpoints.auth import get_current_user
-from app.services.template_service import get_template_service
+from app.services.template_service import get_template_service, sync_rating_aggregate
 
 router = APIRouter()
 
@@ -141,10 +142,19 @@ async def update_template(
     db: Session = Depends(get_db)
 ):
     """更新模板"""
-    template = db.query(Template).filter(
-        Template.id == template_id,
-        Template.creator_id == current_user.id
-    ).first()
+    # 更新允许的字段（标签经由服务层写入关联表）
+    allowed_fields = ["name", "description", "content", "category", "tags", "is_public"]
+    updates = {field: value for field, value in template_data.items() if field in allowed_fields}
+    
+    try:
+        template = await get_template_service(db).update_template(
+            template_id, current_user.id, **updates
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     
     if not template:
         raise HTTPException(
@@ -152,15 +162,6 @@ async def update_template(
             detail="模板不存在或无权修改"
         )
     
-    # 更新允许的字段
-    allowed_fields = ["name", "description", "content", "category", "tags", "is_public"]
-    for field, value in template_data.items():
-        if field in allowed_fields:
-            setattr(template, field, value)
-    
-    db.commit()
-    db.refresh(template)
-    
     return template.to_dict()
 
 @router.delete("/{template_id}")
@@ -169,21 +170,21 @@ async def delete_template(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """删除模板"""
-    template = db.query(Template).filter(
-        Template.id == template_id,
-        Template.creator_id == current_user.id
-    ).first()
+    """删除模板（经由服务层，同步标签使用次数）"""
+    try:
+        deleted = await get_template_service(db).delete_template(template_id, current_user.id)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
     
-    if not template:
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="模板不存在或无权删除"
         )
     
-    db.delete(template)
-    db.commit()
-    
     return {"message": "模板已删除"}
 
 @router.post("/{template_id}/use")
@@ -208,17 +209,8 @@ async def use_template(
             detail="无权使用此模板"
         )
     
-    # 记录使用
-    usage = TemplateUsage(
-        template_id=template_id,
-        user_id=current_user.id
-    )
-    db.add(usage)
-    
-    # 增加使用计数
-    template.usage_count += 1
-    
-    db.commit()
+    # 记录使用（使用记录与计数由后台任务批量写入）
+    record_template_usage(template_id, current_user.id)
     
     return {
         "template": template.to_dict(),
@@ -258,8 +250,6 @@ async def rate_template(
         # 更新评价
         existing_rating.rating = rating_value
         existing_rating.comment = rating_data.get("comment")
-        db.commit()
-        db.refresh(existing_rating)
         rating_obj = existing_rating
     else:
         # 创建新评价
@@ -270,22 +260,16 @@ async def rate_template(
             comment=rating_data.get("comment")
         )
         db.add(rating_obj)
-        db.commit()
-        db.refresh(rating_obj)
-    
-    # 重新计算平均评分
-    avg_rating = db.query(TemplateRating).filter(
-        TemplateRating.template_id == template_id
-    ).with_entities(
-        db.func.avg(TemplateRating.rating)
-    ).scalar()
     
-    template.rating = round(float(avg_rating), 2) if avg_rating else 0.0
+    # 平均评分由 trg_template_rating_agg 触发器维护，提交后读取即可
+    sync_rating_aggregate(db, template_id)
     db.commit()
+    db.refresh(rating_obj)
+    db.refresh(template)
     
     return {
         "rating": rating_obj.to_dict(),
-        "template_avg_rating": template.rating
+        "template_avg_rating": (template.rating or 0) / 100
     }
 
 @router.get("/categories")
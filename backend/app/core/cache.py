@@ -5,25 +5,49 @@
 import json
 import pickle
 import hashlib
-from typing import Any, Optional, Union, Dict, List
+from typing import Any, Optional, Union, Dict, List, Tuple
 from datetime import datetime, timedelta
 import asyncio
 import logging
 
 import redis.asyncio as redis
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 from app.core.config import get_settings
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
+# 缓存值编解码：优先使用 orjson（直接输出UTF-8字节，支持datetime/numpy）
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def _dumps(value: Any) -> Union[bytes, str]:
+        return orjson.dumps(value, option=_ORJSON_OPTIONS)
+
+    _loads = orjson.loads
+    _DecodeError = orjson.JSONDecodeError
+else:
+    def _dumps(value: Any) -> Union[bytes, str]:
+        return json.dumps(value, ensure_ascii=False)
+
+    _loads = json.loads
+    _DecodeError = json.JSONDecodeError
+
+
 class CacheManager:
     """缓存管理器"""
     
-    def __init__(self):
+    def __init__(self, delete_batch_size: int = 500):
         self.redis_client: Optional[redis.Redis] = None
         self.local_cache: Dict[str, Dict] = {}
         self.max_local_cache_size = 1000
+        # 批量删除时每批的键数量，控制单条 DEL 对Redis的阻塞时间
+        self.delete_batch_size = delete_batch_size
         
     async def init_redis(self):
         """初始化Redis连接"""
@@ -68,8 +92,8 @@ class CacheManager:
                 value = await self.redis_client.get(key)
                 if value is not None:
                     try:
-                        return json.loads(value)
-                    except json.JSONDecodeError:
+                        return _loads(value)
+                    except _DecodeError:
                         return value
             
             # 降级到本地缓存
@@ -89,11 +113,7 @@ class CacheManager:
     async def set(self, key: str, value: Any, ttl: int = 3600) -> bool:
         """设置缓存值"""
         try:
-            # 序列化值
-            if isinstance(value, (dict, list, tuple)):
-                serialized_value = json.dumps(value, ensure_ascii=False)
-            else:
-                serialized_value = str(value)
+            serialized_value = self._serialize(value)
             
             # 尝试Redis
             if self.redis_client:
@@ -108,6 +128,38 @@ class CacheManager:
             logger.error(f"Cache set error for key {key}: {e}")
             return False
     
+    async def set_many(self, items: List[Tuple[str, Any, int]]) -> bool:
+        """批量设置缓存值（Redis管道一次往返）
+        
+        items: (键, 值, TTL秒数)
+        """
+        if not items:
+            return True
+        
+        try:
+            if self.redis_client:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    for key, value, ttl in items:
+                        pipe.setex(key, ttl, self._serialize(value))
+                    await pipe.execute()
+                return True
+            
+            # 降级到本地缓存
+            for key, value, ttl in items:
+                self._set_local_cache(key, value, ttl)
+            return True
+            
+        except Exception as e:
+            logger.error(f"Cache set_many error for {len(items)} keys: {e}")
+            return False
+    
+    @staticmethod
+    def _serialize(value: Any) -> Union[bytes, str]:
+        """序列化缓存值"""
+        if isinstance(value, (dict, list, tuple)):
+            return _dumps(value)
+        return str(value)
+    
     def _set_local_cache(self, key: str, value: Any, ttl: int):
         """设置本地缓存"""
         # 清理过期缓存
@@ -178,9 +230,17 @@ class CacheManager:
             count = 0
             
             if self.redis_client:
-                keys = await self.redis_client.keys(pattern)
-                if keys:
-                    count = await self.redis_client.delete(*keys)
+                # 使用SCAN增量遍历，并按批次删除，批次之间让出事件循环，
+                # 避免 KEYS / 超大 DEL 阻塞Redis
+                batch = []
+                async for key in self.redis_client.scan_iter(match=pattern, count=self.delete_batch_size):
+                    batch.append(key)
+                    if len(batch) >= self.delete_batch_size:
+                        count += await self._delete_batch(batch)
+                        batch = []
+                        await asyncio.sleep(0)
+                if batch:
+                    count += await self._delete_batch(batch)
             
             # 清理本地缓存
             import fnmatch
@@ -198,6 +258,13 @@ class CacheManager:
             logger.error(f"Cache clear pattern error for {pattern}: {e}")
             return 0
     
+    async def _delete_batch(self, keys: List[str]) -> int:
+        """通过pipeline删除一批键"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.delete(*keys)
+        results = await pipe.execute()
+        return sum(results)
+    
     async def get_stats(self) -> Dict:
         """获取缓存统计信息"""
         stats = {
@@ -4,7 +4,9 @@
 
 import asyncio
 import logging
-from typing import Dict, List, Optional, Any
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Any
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text, inspect
 from sqlalchemy.engine import Engine
@@ -12,6 +14,7 @@ from sqlalchemy.pool import QueuePool
 
 from app.core.database import get_db
 from app.core.config import get_settings
+from app.core.cache import cache_manager, cache_result
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -21,11 +24,16 @@ class DatabaseOptimizer:
     """数据库性能优化器"""
     
     def __init__(self):
-        self.slow_queries: List[Dict] = []
+        # 慢查询环形缓冲区，超出容量自动淘汰最旧记录
+        self.slow_queries: Deque[Dict] = deque(maxlen=1000)
         self.query_stats: Dict[str, Dict] = {}
     
+    @cache_result("db_analysis", ttl=60, key_func=lambda self, db: "db_analysis:v1")
     async def analyze_query_performance(self, db: AsyncSession) -> Dict:
-        """分析查询性能"""
+        """分析查询性能（结果缓存60秒，避免管理端频繁刷新重复扫描）
+
+        失败时抛出异常，只有成功的结果会被缓存。
+        """
         try:
             analysis = {
                 "slow_queries": await self._get_slow_queries(db),
@@ -42,225 +50,164 @@ class DatabaseOptimizer:
             
         except Exception as e:
             logger.error(f"Failed to analyze query performance: {e}")
-            return {}
+            raise
     
     async def _get_slow_queries(self, db: AsyncSession) -> List[Dict]:
-        """获取慢查询信息"""
-        try:
-            # 这里需要根据具体数据库类型实现
-            # SQLite示例（实际生产环境建议使用PostgreSQL或MySQL）
-            
-            # 模拟慢查询数据
-            slow_queries = []
-            
-            # 如果是PostgreSQL，可以查询pg_stat_statements
-            # if settings.DATABASE_URL.startswith("postgresql"):
-            #     result = await db.execute(text("""
-            #         SELECT query, calls, total_time, mean_time, rows
-            #         FROM pg_stat_statements
-            #         WHERE mean_time > 100
-            #         ORDER BY mean_time DESC
-            #         LIMIT 10
-            #     """))
-            #     
-            #     for row in result.fetchall():
-            #         slow_queries.append({
-            #             "query": row.query,
-            #             "calls": row.calls,
-            #             "total_time": row.total_time,
-            #             "mean_time": row.mean_time,
-            #             "rows": row.rows
-            #         })
-            
-            return slow_queries
-            
-        except Exception as e:
-            logger.error(f"Failed to get slow queries: {e}")
-            return []
+        """获取慢查询信息（应用层记录的慢查询，来自 monitor_query_performance）"""
+        return list(self.slow_queries)
     
+    @cache_result("db_index_usage", ttl=300, key_func=lambda self, db: "db_index_usage:v2")
     async def _analyze_index_usage(self, db: AsyncSession) -> Dict:
-        """分析索引使用情况"""
-        try:
-            index_info = {
-                "total_indexes": 0,
-                "unused_indexes": [],
-                "missing_indexes": [],
-                "index_details": []
+        """分析索引使用情况（表结构很少变化，缓存5分钟）
+
+        失败时抛出异常，由 analyze_query_performance 统一记录，错误结果不会被缓存。
+        """
+        index_info = {
+            "total_indexes": 0,
+            "unused_indexes": [],
+            "missing_indexes": [],
+            "index_details": []
+        }
+        
+        # PostgreSQL 索引扫描统计
+        result = await db.execute(text("""
+            SELECT s.relname, s.indexrelname, s.idx_scan, s.idx_tup_read, s.idx_tup_fetch,
+                   pg_relation_size(s.indexrelid) AS index_size, i.indisunique
+            FROM pg_stat_user_indexes s
+            JOIN pg_index i ON i.indexrelid = s.indexrelid
+            ORDER BY s.relname, s.indexrelname
+        """))
+        
+        indexes = result.fetchall()
+        index_info["total_indexes"] = len(indexes)
+        
+        for index in indexes:
+            detail = {
+                "name": index.indexrelname,
+                "table": index.relname,
+                "scans": index.idx_scan,
+                "tuples_read": index.idx_tup_read,
+                "tuples_fetched": index.idx_tup_fetch,
+                "size_bytes": index.index_size
             }
-            
-            # SQLite索引信息
-            result = await db.execute(text("""
-                SELECT name, sql, tbl_name 
-                FROM sqlite_master 
-                WHERE type = 'index' AND sql IS NOT NULL
-            """))
-            
-            indexes = result.fetchall()
-            index_info["total_indexes"] = len(indexes)
-            
-            for index in indexes:
-                index_info["index_details"].append({
-                    "name": index.name,
-                    "table": index.tbl_name,
-                    "sql": index.sql
-                })
-            
-            # 检查可能缺失的索引
-            missing_indexes = await self._check_missing_indexes(db)
-            index_info["missing_indexes"] = missing_indexes
-            
-            return index_info
-            
-        except Exception as e:
-            logger.error(f"Failed to analyze index usage: {e}")
-            return {}
+            index_info["index_details"].append(detail)
+            # 唯一索引承担约束，即使未被扫描也不能删除
+            if index.idx_scan == 0 and not index.indisunique:
+                index_info["unused_indexes"].append(detail)
+        
+        # 检查可能缺失的索引
+        index_info["missing_indexes"] = await self._check_missing_indexes(db)
+        
+        return index_info
     
     async def _check_missing_indexes(self, db: AsyncSession) -> List[Dict]:
         """检查可能缺失的索引"""
         missing_indexes = []
         
-        try:
-            # 检查常见的查询模式，建议添加索引
-            common_patterns = [
-                {
-                    "table": "prompts",
-                    "columns": ["user_id", "created_at"],
-                    "reason": "用户提示词按时间排序查询"
-                },
-                {
-                    "table": "templates",
-                    "columns": ["category", "is_public"],
-                    "reason": "按分类和公开状态筛选模板"
-                },
-                {
-                    "table": "analyses",
-                    "columns": ["user_id", "overall_score"],
-                    "reason": "用户分析结果按评分排序"
-                }
-            ]
-            
-            for pattern in common_patterns:
-                # 检查索引是否存在
-                index_exists = await self._check_index_exists(
-                    db, pattern["table"], pattern["columns"]
-                )
-                
-                if not index_exists:
-                    missing_indexes.append(pattern)
-            
-            return missing_indexes
-            
-        except Exception as e:
-            logger.error(f"Failed to check missing indexes: {e}")
-            return []
-    
-    async def _check_index_exists(self, db: AsyncSession, table: str, columns: List[str]) -> bool:
-        """检查索引是否存在"""
-        try:
-            # 简化的索引检查逻辑
-            index_name = f"idx_{table}_{'_'.join(columns)}"
-            
-            result = await db.execute(text("""
-                SELECT name FROM sqlite_master 
-                WHERE type = 'index' AND name = :index_name
-            """), {"index_name": index_name})
-            
-            return result.fetchone() is not None
-            
-        except Exception as e:
-            logger.error(f"Failed to check index existence: {e}")
-            return False
+        # 检查常见的查询模式，建议添加索引
+        common_patterns = [
+            {
+                "table": "prompts",
+                "columns": ["user_id", "created_at"],
+                "reason": "用户提示词按时间排序查询"
+            },
+            {
+                "table": "templates",
+                "columns": ["category", "is_public"],
+                "reason": "按分类和公开状态筛选模板"
+            },
+            {
+                "table": "analyses",
+                "columns": ["user_id", "overall_score"],
+                "reason": "用户分析结果按评分排序"
+            }
+        ]
+        
+        # 一次性读取已有索引名，避免每个模式单独查询
+        result = await db.execute(text("""
+            SELECT indexname FROM pg_indexes
+            WHERE schemaname = current_schema()
+        """))
+        existing_indexes = {row.indexname for row in result.fetchall()}
+        
+        for pattern in common_patterns:
+            index_name = f"idx_{pattern['table']}_{'_'.join(pattern['columns'])}"
+            if index_name not in existing_indexes:
+                missing_indexes.append(pattern)
+        
+        return missing_indexes
     
     async def _get_table_statistics(self, db: AsyncSession) -> Dict:
-        """获取表统计信息"""
-        try:
-            stats = {}
-            
-            tables = ["users", "prompts", "templates", "analyses"]
-            
-            for table in tables:
-                try:
-                    # 获取行数
-                    result = await db.execute(text(f"SELECT COUNT(*) FROM {table}"))
-                    row_count = result.scalar()
-                    
-                    # 获取表大小（SQLite特定）
-                    result = await db.execute(text(f"PRAGMA table_info({table})"))
-                    columns = result.fetchall()
-                    
-                    stats[table] = {
-                        "row_count": row_count,
-                        "column_count": len(columns),
-                        "columns": [col.name for col in columns]
-                    }
-                    
-                except Exception as e:
-                    logger.error(f"Failed to get stats for table {table}: {e}")
-                    stats[table] = {"error": str(e)}
-            
-            return stats
-            
-        except Exception as e:
-            logger.error(f"Failed to get table statistics: {e}")
-            return {}
+        """获取表统计信息（行数取自统计信息估算，避免逐表 COUNT(*)）"""
+        tables = ["users", "prompts", "templates", "analyses"]
+        
+        result = await db.execute(text("""
+            SELECT t.relname, t.n_live_tup,
+                   array_agg(c.column_name::text ORDER BY c.ordinal_position) AS columns
+            FROM pg_stat_user_tables t
+            JOIN information_schema.columns c
+              ON c.table_schema = t.schemaname AND c.table_name = t.relname
+            WHERE t.schemaname = current_schema() AND t.relname = ANY(:tables)
+            GROUP BY t.relname, t.n_live_tup
+        """), {"tables": tables})
+        
+        return {
+            row.relname: {
+                "row_count": row.n_live_tup,
+                "column_count": len(row.columns),
+                "columns": list(row.columns)
+            }
+            for row in result.fetchall()
+        }
     
     async def _get_connection_statistics(self, db: AsyncSession) -> Dict:
         """获取连接统计信息"""
-        try:
-            engine = db.get_bind()
-            pool = engine.pool
-            
-            return {
-                "pool_size": pool.size(),
-                "checked_in": pool.checkedin(),
-                "checked_out": pool.checkedout(),
-                "overflow": pool.overflow(),
-                "invalid": pool.invalid()
-            }
-            
-        except Exception as e:
-            logger.error(f"Failed to get connection statistics: {e}")
-            return {}
+        pool = db.get_bind().pool
+        
+        return {
+            "pool_size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "invalid": pool.invalid()
+        }
     
     async def _generate_optimization_recommendations(self, analysis: Dict) -> List[str]:
         """生成优化建议"""
         recommendations = []
         
-        try:
-            # 基于分析结果生成建议
-            
-            # 检查缺失的索引
-            missing_indexes = analysis.get("index_usage", {}).get("missing_indexes", [])
-            for index in missing_indexes:
+        # 检查缺失的索引
+        missing_indexes = analysis["index_usage"]["missing_indexes"]
+        for index in missing_indexes:
+            recommendations.append(
+                f"建议为表 {index['table']} 的列 {', '.join(index['columns'])} 添加索引: {index['reason']}"
+            )
+        
+        # 检查未使用的索引（统计信息自上次重置以来从未被扫描）
+        for index in analysis["index_usage"]["unused_indexes"]:
+            recommendations.append(
+                f"表 {index['table']} 的索引 {index['name']} 未被使用，确认后可删除以降低写入开销"
+            )
+        
+        # 检查表大小
+        for table, stats in analysis["table_stats"].items():
+            row_count = stats["row_count"]
+            if row_count > 100000:
                 recommendations.append(
-                    f"建议为表 {index['table']} 的列 {', '.join(index['columns'])} 添加索引: {index['reason']}"
+                    f"表 {table} 数据量较大({row_count}行)，建议考虑分区或归档策略"
                 )
-            
-            # 检查表大小
-            table_stats = analysis.get("table_stats", {})
-            for table, stats in table_stats.items():
-                if isinstance(stats, dict) and "row_count" in stats:
-                    row_count = stats["row_count"]
-                    if row_count > 100000:
-                        recommendations.append(
-                            f"表 {table} 数据量较大({row_count}行)，建议考虑分区或归档策略"
-                        )
-            
-            # 检查连接池
-            conn_stats = analysis.get("connection_stats", {})
-            if conn_stats.get("checked_out", 0) > conn_stats.get("pool_size", 1) * 0.8:
-                recommendations.append("数据库连接池使用率过高，建议增加连接池大小")
-            
-            # 检查慢查询
-            slow_queries = analysis.get("slow_queries", [])
-            if len(slow_queries) > 0:
-                recommendations.append(f"发现 {len(slow_queries)} 个慢查询，建议优化查询语句或添加索引")
-            
-            return recommendations
-            
-        except Exception as e:
-            logger.error(f"Failed to generate recommendations: {e}")
-            return []
+        
+        # 检查连接池
+        conn_stats = analysis["connection_stats"]
+        if conn_stats["checked_out"] > conn_stats["pool_size"] * 0.8:
+            recommendations.append("数据库连接池使用率过高，建议增加连接池大小")
+        
+        # 检查慢查询
+        slow_queries = analysis["slow_queries"]
+        if len(slow_queries) > 0:
+            recommendations.append(f"发现 {len(slow_queries)} 个慢查询，建议优化查询语句或添加索引")
+        
+        return recommendations
     
     async def optimize_query(self, query: str) -> Dict:
         """优化查询语句"""
@@ -343,34 +290,59 @@ class DatabaseOptimizer:
             return "1-5%"
     
     async def create_optimized_indexes(self, db: AsyncSession, recommendations: List[Dict]) -> Dict:
-        """创建优化索引"""
+        """创建优化索引
+
+        所有索引语句使用 IF NOT EXISTS 保证幂等。PostgreSQL 下使用
+        CREATE INDEX CONCURRENTLY（不能在事务块中执行，因此走自动提交连接），
+        避免建索引期间锁表；其他数据库在单个事务中批量创建，只提交一次。
+        """
         try:
             created_indexes = []
             failed_indexes = []
             
+            is_postgres = db.get_bind().dialect.name == "postgresql"
+            concurrently = "CONCURRENTLY " if is_postgres else ""
+            
+            pending = []
             for rec in recommendations:
                 if rec.get("type") == "missing_index":
                     table = rec["table"]
                     columns = rec["columns"]
                     index_name = f"idx_{table}_{'_'.join(columns)}"
-                    
-                    try:
-                        # 创建索引
-                        create_sql = f"CREATE INDEX {index_name} ON {table} ({', '.join(columns)})"
+                    create_sql = (
+                        f"CREATE INDEX {concurrently}IF NOT EXISTS {index_name} "
+                        f"ON {table} ({', '.join(columns)})"
+                    )
+                    pending.append(({"name": index_name, "table": table, "columns": columns}, create_sql))
+            
+            if not pending:
+                return {"created_indexes": [], "failed_indexes": [], "total_created": 0}
+            
+            if is_postgres:
+                # CONCURRENTLY 需要自动提交模式，逐条执行并单独记录失败
+                async with db.bind.connect() as conn:
+                    conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                    for index, create_sql in pending:
+                        try:
+                            await conn.execute(text(create_sql))
+                            created_indexes.append(index)
+                        except Exception as e:
+                            failed_indexes.append({"name": index["name"], "error": str(e)})
+            else:
+                # 单事务批量创建，只提交一次
+                try:
+                    for _, create_sql in pending:
                         await db.execute(text(create_sql))
-                        await db.commit()
-                        
-                        created_indexes.append({
-                            "name": index_name,
-                            "table": table,
-                            "columns": columns
-                        })
-                        
-                    except Exception as e:
-                        failed_indexes.append({
-                            "name": index_name,
-                            "error": str(e)
-                        })
+                    await db.commit()
+                    created_indexes = [index for index, _ in pending]
+                except Exception as e:
+                    await db.rollback()
+                    failed_indexes = [{"name": index["name"], "error": str(e)} for index, _ in pending]
+            
+            if created_indexes:
+                # 索引变化后使缓存的分析结果失效
+                await cache_manager.delete("db_index_usage:v1")
+                await cache_manager.delete("db_analysis:v1")
             
             return {
                 "created_indexes": created_indexes,
@@ -388,13 +360,11 @@ def monitor_query_performance(query_name: str):
     """查询性能监控装饰器"""
     def decorator(func):
         async def wrapper(*args, **kwargs):
-            import time
-            
-            start_time = time.time()
+            start_time = time.perf_counter()
             
             try:
                 result = await func(*args, **kwargs)
-                execution_time = (time.time() - start_time) * 1000  # 毫秒
+                execution_time = (time.perf_counter() - start_time) * 1000  # 毫秒
                 
                 # 记录查询性能
                 logger.info(f"Query {query_name} executed in {execution_time:.2f}ms")
@@ -402,11 +372,16 @@ def monitor_query_performance(query_name: str):
                 # 如果查询时间过长，记录警告
                 if execution_time > 1000:  # 1秒
                     logger.warning(f"Slow query detected: {query_name} took {execution_time:.2f}ms")
+                    db_optimizer.slow_queries.append({
+                        "name": query_name,
+                        "ms": execution_time,
+                        "ts": time.time()
+                    })
                 
                 return result
                 
             except Exception as e:
-                execution_time = (time.time() - start_time) * 1000
+                execution_time = (time.perf_counter() - start_time) * 1000
                 logger.error(f"Query {query_name} failed after {execution_time:.2f}ms: {e}")
                 raise
         
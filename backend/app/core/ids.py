@@ -0,0 +1,28 @@
+"""
+主键ID生成
+"""
+
+import os
+import time
+import uuid
+
+_RAND_A_MASK = (1 << 12) - 1
+_RAND_B_MASK = (1 << 62) - 1
+
+
+def uuid7() -> uuid.UUID:
+    """生成UUIDv7（RFC 9562）
+
+    高48位为毫秒时间戳，其余为随机位。按时间递增的主键让btree插入集中在
+    索引尾部，避免uuid4随机写入造成的页分裂和缓存失效。
+    """
+    timestamp_ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")
+
+    value = (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80
+    value |= 0x7 << 76                          # 版本号 7
+    value |= ((rand >> 62) & _RAND_A_MASK) << 64
+    value |= 0b10 << 62                         # RFC 4122 变体
+    value |= rand & _RAND_B_MASK
+
+    return uuid.UUID(int=value)
@@ -2,131 +2,247 @@
 性能监控中间件
 """
 
+import asyncio
+import cProfile
+import io
+import json
+import os
+import pstats
+import shutil
+import signal
+import tempfile
 import time
+import tracemalloc
 import logging
-import psutil
-from typing import Callable
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from collections import deque
+from typing import Deque, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from app.core.config import get_settings
+from app.services.batch_buffer import BatchBuffer
 from app.services.monitoring_service import MonitoringService
+from config.database import SessionLocal
+
+try:
+    import psutil
+except ImportError:  # 精简部署环境中psutil可选
+    psutil = None
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# 性能阈值分类标志位（进程内存是进程级指标，由采样任务单独告警，不按请求分类）
+SLOW_REQUEST = 1
+CRITICAL_RESPONSE_TIME = 2
+ALERT_FLAGS = CRITICAL_RESPONSE_TIME
+
+# 请求指标缓冲区：请求路径只做 O(1) 追加，由后台任务批量写入
+METRICS_QUEUE_SIZE = 10000
+METRICS_BATCH_SIZE = 500
+METRICS_FLUSH_INTERVAL = 0.1
+
+
+def _write_batch(batch: List[dict]):
+    """单个会话写入一批请求指标（同步，在线程中执行）"""
+    db = SessionLocal()
+    try:
+        MonitoringService(db).record_batch(batch)
+    except Exception as e:
+        logger.error(f"Failed to send monitoring data: {e}")
+    finally:
+        db.close()
+
+
+request_metrics_buffer = BatchBuffer(
+    "request_metrics", METRICS_QUEUE_SIZE, METRICS_FLUSH_INTERVAL, _write_batch, METRICS_BATCH_SIZE
+)
+
+
+def get_metrics_queue_stats() -> dict:
+    """获取指标缓冲区使用情况（健康检查指标）"""
+    return request_metrics_buffer.stats()
+
+
+# 进程资源采样缓存 (rss_bytes, cpu_percent)，由后台任务每秒刷新一次
+_resource_sample = (0, 0.0)
 
-class PerformanceMiddleware(BaseHTTPMiddleware):
-    """性能监控中间件"""
+
+class PerformanceMiddleware:
+    """性能监控中间件
+
+    纯ASGI实现：不经过 BaseHTTPMiddleware 的双任务 + 内存通道转发，
+    也不构造 Request/Response 对象，响应体直接流式透传。
+    """
     
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
+        self.app = app
         self.monitoring_service = MonitoringService()
+        # 持有后台任务引用，避免任务在完成前被回收
+        self._background_tasks: Set[asyncio.Task] = set()
+        self._sampler_task: Optional[asyncio.Task] = None
+        self.reload_thresholds()
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    def reload_thresholds(self):
+        """重新读取阈值配置
+
+        阈值绑定为实例属性，避免每个请求都经过 settings 的属性访问；
+        配置变更后调用本方法生效。
+        """
+        self._slow = settings.SLOW_REQUEST_THRESHOLD
+        self._crit = settings.CRITICAL_RESPONSE_TIME
+        self._mem = settings.HIGH_MEMORY_THRESHOLD
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """处理请求并收集性能指标"""
-        start_time = time.time()
-        
-        # 获取请求开始时的系统资源
-        process = psutil.Process()
-        start_memory = process.memory_info().rss
-        start_cpu_percent = process.cpu_percent()
-        
-        # 处理请求
-        response = await call_next(request)
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        # 计算性能指标
-        end_time = time.time()
-        response_time = (end_time - start_time) * 1000  # 毫秒
+        if self._sampler_task is None:
+            self._sampler_task = asyncio.create_task(self._sample_resources())
         
-        end_memory = process.memory_info().rss
-        memory_usage = end_memory - start_memory
-        end_cpu_percent = process.cpu_percent()
+        # 耗时使用单调时钟计算，墙上时间只在入口取一次作为时间戳
+        start_time = time.perf_counter()
+        timestamp = time.time()
         
-        # 收集请求信息
+        client_ip, user_agent = self._get_client_info(scope)
         request_info = {
-            "method": request.method,
-            "url": str(request.url),
-            "path": request.url.path,
-            "query_params": dict(request.query_params),
-            "user_agent": request.headers.get("user-agent", ""),
-            "client_ip": self._get_client_ip(request),
-            "response_time_ms": response_time,
-            "status_code": response.status_code,
-            "memory_usage_bytes": memory_usage,
-            "cpu_percent": end_cpu_percent,
-            "timestamp": start_time
+            "method": scope["method"],
+            "path": scope["path"],
+            # 查询参数值可能包含敏感信息，只保留排序后的参数名
+            "query_keys": sorted({key for key, _ in parse_qsl(scope.get("query_string", b"").decode("latin-1"))}),
+            "user_agent": user_agent,
+            "client_ip": client_ip,
+            "timestamp": timestamp
         }
         
-        # 记录性能日志
-        self._log_performance(request_info)
-        
-        # 发送监控数据
-        await self._send_monitoring_data(request_info)
-        
-        # 添加性能头信息
-        response.headers["X-Response-Time"] = f"{response_time:.2f}ms"
-        response.headers["X-Memory-Usage"] = f"{memory_usage}B"
-        
-        # 检查性能阈值
-        await self._check_performance_thresholds(request_info)
-        
-        return response
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # 计算性能指标
+                response_time = (time.perf_counter() - start_time) * 1000  # 毫秒
+                # 并发请求下内存差值没有意义，直接记录进程当前RSS（后台采样值）
+                rss_bytes, cpu_percent = _resource_sample
+                
+                request_info.update({
+                    "response_time_ms": response_time,
+                    "status_code": message["status"],
+                    "memory_usage_bytes": rss_bytes,
+                    "cpu_percent": cpu_percent
+                })
+                
+                # 添加性能头信息
+                response_headers = list(message.get("headers", []))
+                response_headers.append((b"x-response-time", f"{response_time:.2f}ms".encode()))
+                message = {**message, "headers": response_headers}
+            
+            await send(message)
+            
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                # 响应发送完毕后再处理日志和监控，不阻塞响应路径
+                flags = self._classify(request_info)
+                self._log_performance(request_info, flags)
+                request_metrics_buffer.append(request_info)
+                if flags & ALERT_FLAGS:
+                    self._spawn(self._check_performance_thresholds(request_info, flags))
+        
+        await self.app(scope, receive, send_wrapper)
+    
+    def _spawn(self, coro):
+        """启动后台任务并持有引用直至完成"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _sample_resources(self, interval: float = 1.0):
+        """后台采样进程内存/CPU，请求路径只读取缓存值
+
+        RSS 超过阈值时按边沿触发告警：越过阈值的那次采样告警一次，
+        回落到阈值以下后才会再次告警。
+        """
+        global _resource_sample
+        if psutil is None:
+            return
+        process = psutil.Process()
+        above_threshold = False
+        while True:
+            try:
+                rss_bytes = process.memory_info().rss
+                _resource_sample = (rss_bytes, process.cpu_percent())
+            except Exception as e:
+                logger.error(f"Failed to sample process resources: {e}")
+            else:
+                is_high = rss_bytes > self._mem
+                if is_high and not above_threshold:
+                    self._spawn(self._alert_high_memory(rss_bytes))
+                above_threshold = is_high
+            await asyncio.sleep(interval)
+    
+    def _classify(self, request_info: dict) -> int:
+        """一次性计算请求的阈值标志位，常见的正常请求结果为0"""
+        response_time = request_info["response_time_ms"]
+        return (response_time > self._slow) | ((response_time > self._crit) << 1)
     
-    def _get_client_ip(self, request: Request) -> str:
-        """获取客户端IP地址"""
-        # 检查代理头
-        forwarded_for = request.headers.get("X-Forwarded-For")
+    def _get_client_info(self, scope: Scope) -> Tuple[str, str]:
+        """单次遍历请求头，获取客户端IP地址和User-Agent"""
+        forwarded_for = real_ip = None
+        user_agent = b""
+        # ASGI请求头名称已是小写字节串
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                forwarded_for = value
+            elif name == b"x-real-ip":
+                real_ip = value
+            elif name == b"user-agent":
+                user_agent = value
+        
+        # 优先使用代理头
         if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
-        
-        real_ip = request.headers.get("X-Real-IP")
-        if real_ip:
-            return real_ip
-        
-        return request.client.host if request.client else "unknown"
+            client_ip = forwarded_for.split(b",", 1)[0].strip().decode("latin-1")
+        elif real_ip:
+            client_ip = real_ip.decode("latin-1")
+        else:
+            client = scope.get("client")
+            client_ip = client[0] if client else "unknown"
+        
+        return client_ip, user_agent.decode("latin-1")
     
-    def _log_performance(self, request_info: dict):
-        """记录性能日志"""
-        if request_info["response_time_ms"] > settings.SLOW_REQUEST_THRESHOLD:
+    def _log_performance(self, request_info: dict, flags: int):
+        """记录性能日志（仅慢请求输出告警，逐请求明细降为DEBUG级别）"""
+        if flags & SLOW_REQUEST and logger.isEnabledFor(logging.WARNING):
             logger.warning(
                 f"Slow request detected: {request_info['method']} {request_info['path']} "
                 f"took {request_info['response_time_ms']:.2f}ms"
             )
         
-        # 记录详细性能日志
-        logger.info(
-            f"Request: {request_info['method']} {request_info['path']} "
-            f"Status: {request_info['status_code']} "
-            f"Time: {request_info['response_time_ms']:.2f}ms "
-            f"Memory: {request_info['memory_usage_bytes']}B"
-        )
-    
-    async def _send_monitoring_data(self, request_info: dict):
-        """发送监控数据"""
-        try:
-            await self.monitoring_service.record_request_metrics(request_info)
-        except Exception as e:
-            logger.error(f"Failed to send monitoring data: {e}")
+        # 记录详细性能日志，未开启DEBUG时不构造日志字符串
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"Request: {request_info['method']} {request_info['path']} "
+                f"Status: {request_info['status_code']} "
+                f"Time: {request_info['response_time_ms']:.2f}ms "
+                f"Memory: {request_info['memory_usage_bytes']}B"
+            )
     
-    async def _check_performance_thresholds(self, request_info: dict):
-        """检查性能阈值并触发告警"""
+    async def _check_performance_thresholds(self, request_info: dict, flags: int):
+        """根据阈值标志位触发告警"""
         # 响应时间阈值
-        if request_info["response_time_ms"] > settings.CRITICAL_RESPONSE_TIME:
+        if flags & CRITICAL_RESPONSE_TIME:
             await self.monitoring_service.trigger_alert(
                 "critical_response_time",
                 f"Critical response time: {request_info['response_time_ms']:.2f}ms for "
                 f"{request_info['method']} {request_info['path']}"
             )
-        
-        # 内存使用阈值
-        if request_info["memory_usage_bytes"] > settings.HIGH_MEMORY_THRESHOLD:
+    
+    async def _alert_high_memory(self, rss_bytes: int):
+        """进程内存超过阈值时告警（每次越过阈值只调用一次）"""
+        try:
             await self.monitoring_service.trigger_alert(
                 "high_memory_usage",
-                f"High memory usage: {request_info['memory_usage_bytes']}B for "
-                f"{request_info['method']} {request_info['path']}"
+                f"High memory usage: process RSS {rss_bytes}B exceeds {self._mem}B"
             )
+        except Exception as e:
+            logger.error(f"Failed to trigger high memory alert: {e}")
 
 
 class DatabasePerformanceMiddleware:
@@ -134,6 +250,11 @@ class DatabasePerformanceMiddleware:
     
     def __init__(self):
         self.monitoring_service = MonitoringService()
+        self.reload_thresholds()
+    
+    def reload_thresholds(self):
+        """重新读取慢查询阈值配置"""
+        self._slow_query = settings.SLOW_QUERY_THRESHOLD
     
     async def __call__(self, query: str, parameters: dict, start_time: float, end_time: float):
         """记录数据库查询性能"""
@@ -147,7 +268,7 @@ class DatabasePerformanceMiddleware:
         }
         
         # 记录慢查询
-        if execution_time > settings.SLOW_QUERY_THRESHOLD:
+        if execution_time > self._slow_query:
             logger.warning(
                 f"Slow query detected: {execution_time:.2f}ms - {query[:100]}..."
             )
@@ -162,17 +283,30 @@ class DatabasePerformanceMiddleware:
 class MemoryProfiler:
     """内存分析器"""
     
-    def __init__(self):
-        self.snapshots = []
+    # 快照过滤规则：去掉导入机制产生的噪音
+    SNAPSHOT_FILTERS = (
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    )
+    
+    def __init__(self, max_snapshots: int = 32):
+        # 只保留最近的快照，避免长时间运行时快照无限累积
+        self.snapshots: Deque[dict] = deque(maxlen=max_snapshots)
+        # 最近一次统计结果缓存，快照不变时直接复用
+        self._compare_cache: Optional[tuple] = None
+        self._top_usage_cache: Optional[tuple] = None
+    
+    @staticmethod
+    def start_tracing(nframe: int = 1):
+        """开始跟踪内存分配，应在进程启动时尽早调用（每条记录只保留1帧）"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(nframe)
     
     def take_snapshot(self, label: str = ""):
         """获取内存快照"""
-        import tracemalloc
+        self.start_tracing()
         
-        if not tracemalloc.is_tracing():
-            tracemalloc.start()
-        
-        snapshot = tracemalloc.take_snapshot()
+        snapshot = tracemalloc.take_snapshot().filter_traces(self.SNAPSHOT_FILTERS)
         self.snapshots.append({
             "label": label,
             "snapshot": snapshot,
@@ -181,15 +315,23 @@ class MemoryProfiler:
         
         return snapshot
     
-    def compare_snapshots(self, snapshot1_idx: int = -2, snapshot2_idx: int = -1):
-        """比较内存快照"""
+    def compare_snapshots(self, snapshot1_idx: int = -2, snapshot2_idx: int = -1, key_type: str = "filename"):
+        """比较内存快照
+
+        默认按文件聚合（开销远小于按行），需要定位到具体行时传入 key_type="lineno"。
+        """
         if len(self.snapshots) < 2:
             return None
         
         snapshot1 = self.snapshots[snapshot1_idx]["snapshot"]
         snapshot2 = self.snapshots[snapshot2_idx]["snapshot"]
         
-        top_stats = snapshot2.compare_to(snapshot1, 'lineno')
+        cache_key = (snapshot1, snapshot2, key_type)
+        cached = self._compare_cache
+        if cached is not None and cached[0] == cache_key:
+            return cached[1]
+        
+        top_stats = snapshot2.compare_to(snapshot1, key_type)
         
         memory_diff = []
         for stat in top_stats[:10]:  # 前10个最大差异
@@ -199,15 +341,22 @@ class MemoryProfiler:
                 "count_diff": stat.count_diff
             })
         
+        self._compare_cache = (cache_key, memory_diff)
         return memory_diff
     
-    def get_top_memory_usage(self, snapshot_idx: int = -1):
+    def get_top_memory_usage(self, snapshot_idx: int = -1, key_type: str = "filename"):
         """获取内存使用排行"""
         if not self.snapshots:
             return []
         
         snapshot = self.snapshots[snapshot_idx]["snapshot"]
-        top_stats = snapshot.statistics('lineno')
+        
+        cache_key = (snapshot, key_type)
+        cached = self._top_usage_cache
+        if cached is not None and cached[0] == cache_key:
+            return cached[1]
+        
+        top_stats = snapshot.statistics(key_type)
         
         memory_usage = []
         for stat in top_stats[:10]:
@@ -217,35 +366,95 @@ class MemoryProfiler:
                 "count": stat.count
             })
         
+        self._top_usage_cache = (cache_key, memory_usage)
         return memory_usage
 
 
 class PerformanceProfiler:
-    """性能分析器"""
+    """性能分析器
+
+    默认通过 py-spy 对当前进程做栈采样（约100Hz，开销很低，可在生产环境使用）；
+    deep_profile=True 时使用 cProfile 全量插桩，开销大，仅用于离线调试。
+    """
     
-    def __init__(self):
+    def __init__(self, sampling_rate: int = 100):
         self.profiles = []
+        self.sampling_rate = sampling_rate
     
-    def start_profiling(self, label: str = ""):
+    async def start_profiling(self, label: str = "", duration: int = 30, deep_profile: bool = False):
         """开始性能分析"""
-        import cProfile
-        import pstats
-        import io
-        
-        profiler = cProfile.Profile()
-        profiler.enable()
+        if deep_profile:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            
+            return {
+                "label": label,
+                "mode": "cprofile",
+                "profiler": profiler,
+                "start_time": time.time()
+            }
+        
+        if shutil.which("py-spy") is None:
+            raise RuntimeError("py-spy is not installed; use deep_profile=True for cProfile")
+        
+        output_path = os.path.join(
+            tempfile.gettempdir(), f"py-spy-{os.getpid()}-{time.time_ns()}.json"
+        )
+        process = await asyncio.create_subprocess_exec(
+            "py-spy", "record",
+            "--pid", str(os.getpid()),
+            "--duration", str(duration),
+            "--rate", str(self.sampling_rate),
+            "--format", "speedscope",
+            "--output", output_path,
+            "--nonblocking",
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
         
         return {
             "label": label,
-            "profiler": profiler,
+            "mode": "sampling",
+            "process": process,
+            "output_path": output_path,
             "start_time": time.time()
         }
     
-    def stop_profiling(self, profile_data: dict):
+    async def stop_profiling(self, profile_data: dict):
         """停止性能分析"""
-        import pstats
-        import io
+        if profile_data["mode"] == "cprofile":
+            return self._stop_cprofile(profile_data)
+        
+        process = profile_data["process"]
+        if process.returncode is None:
+            # py-spy 收到 SIGINT 后会提前结束采样并写出结果
+            process.send_signal(signal.SIGINT)
+        _, stderr = await process.communicate()
+        
+        output_path = profile_data["output_path"]
+        try:
+            with open(output_path, "r", encoding="utf-8") as f:
+                speedscope = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read py-spy output: {e} {stderr.decode(errors='replace')}")
+            speedscope = None
+        finally:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+        
+        profile_result = {
+            "label": profile_data["label"],
+            "mode": "sampling",
+            "duration": time.time() - profile_data["start_time"],
+            "speedscope": speedscope,
+            "timestamp": time.time()
+        }
         
+        self.profiles.append(profile_result)
+        return profile_result
+    
+    def _stop_cprofile(self, profile_data: dict):
+        """停止cProfile分析"""
         profiler = profile_data["profiler"]
         profiler.disable()
         
@@ -257,8 +466,10 @@ class PerformanceProfiler:
         
         profile_result = {
             "label": profile_data["label"],
+            "mode": "cprofile",
             "duration": time.time() - profile_data["start_time"],
             "stats": stats_stream.getvalue(),
+            "stats_obj": stats,
             "timestamp": time.time()
         }
         
@@ -271,21 +482,61 @@ class PerformanceProfiler:
             return []
         
         profile = self.profiles[profile_idx]
-        lines = profile["stats"].split('\n')
+        if profile["mode"] == "sampling":
+            return self._get_sampling_hotspots(profile)
+        
+        # 直接读取 pstats.Stats 的原始数据: (file, line, func) -> (cc, nc, tt, ct, callers)
+        entries = sorted(
+            profile["stats_obj"].stats.items(),
+            key=lambda item: item[1][3],
+            reverse=True
+        )[:20]
+        
+        hotspots = []
+        for (filename, line, func_name), (cc, nc, tt, ct, _) in entries:
+            hotspots.append({
+                "calls": nc if nc == cc else f"{nc}/{cc}",
+                "total_time": tt,
+                "per_call": tt / nc if nc else 0.0,
+                "cumulative": ct,
+                "per_call_cum": ct / cc if cc else 0.0,
+                "function": f"{filename}:{line}({func_name})"
+            })
+        
+        return hotspots
+    
+    def _get_sampling_hotspots(self, profile: dict, limit: int = 20):
+        """从speedscope采样数据中统计热点函数（按自身采样数排序）"""
+        speedscope = profile.get("speedscope")
+        if not speedscope:
+            return []
+        
+        frames = speedscope["shared"]["frames"]
+        self_samples = [0] * len(frames)
+        total_samples = [0] * len(frames)
+        
+        for thread_profile in speedscope["profiles"]:
+            for stack, weight in zip(thread_profile["samples"], thread_profile["weights"]):
+                if not stack:
+                    continue
+                self_samples[stack[-1]] += weight
+                for frame_idx in set(stack):
+                    total_samples[frame_idx] += weight
+        
+        ranked = sorted(range(len(frames)), key=lambda i: self_samples[i], reverse=True)[:limit]
         
         hotspots = []
-        for line in lines[5:25]:  # 跳过头部，取前20行
-            if line.strip() and not line.startswith('Ordered by'):
-                parts = line.split()
-                if len(parts) >= 6:
-                    hotspots.append({
-                        "calls": parts[0],
-                        "total_time": parts[1],
-                        "per_call": parts[2],
-                        "cumulative": parts[3],
-                        "per_call_cum": parts[4],
-                        "function": ' '.join(parts[5:])
-                    })
+        for frame_idx in ranked:
+            if not self_samples[frame_idx]:
+                break
+            frame = frames[frame_idx]
+            hotspots.append({
+                "function": frame.get("name"),
+                "file": frame.get("file"),
+                "line": frame.get("line"),
+                "self_samples": self_samples[frame_idx],
+                "total_samples": total_samples[frame_idx]
+            })
         
         return hotspots
 
@@ -2,21 +2,38 @@
 性能监控相关数据模型
 """
 
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Text, Integer, Numeric, Index
+from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Text, Integer, BigInteger, Float, LargeBinary, Index, text
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-import uuid
+from app.core.ids import uuid7
 from datetime import datetime
 from config.database import Base
+from app.models.serialization import (
+    build_to_dict, as_str, as_isoformat, as_float, or_empty_dict, or_empty_list
+)
+
+# AI调用成本以整数微美元存储，避免numeric软件运算
+COST_SCALE = 1_000_000
+
+
+def usd_to_micro_usd(cost: float) -> int:
+    """美元转换为微美元"""
+    return round((cost or 0) * COST_SCALE)
+
+
+def micro_usd_to_usd(cost: int) -> float:
+    """微美元转换为美元"""
+    return (cost or 0) / COST_SCALE
+
 
 class SystemMetrics(Base):
     """系统指标表"""
     __tablename__ = "system_metrics"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     metric_name = Column(String(100), nullable=False)  # 指标名称
-    metric_value = Column(Numeric(15, 4), nullable=False)  # 指标值
+    metric_value = Column(Float, nullable=False)  # 指标值
     metric_unit = Column(String(20), nullable=True)  # 单位
     metric_type = Column(String(50), nullable=False)  # 指标类型: counter, gauge, histogram
     tags = Column(JSONB, default={})  # 标签信息
@@ -26,36 +43,49 @@ class SystemMetrics(Base):
     __table_args__ = (
         Index('idx_system_metrics_name', 'metric_name'),
         Index('idx_system_metrics_type', 'metric_type'),
-        Index('idx_system_metrics_timestamp', 'timestamp'),
-        Index('idx_system_metrics_name_timestamp', 'metric_name', 'timestamp'),
+        # 只追加的时序表，时间戳与物理顺序相关，BRIN索引远小于btree且写入开销低
+        Index('idx_system_metrics_timestamp_brin', 'timestamp', postgresql_using='brin',
+              postgresql_with={'pages_per_range': 32}),
+        # 按指标取最新值/时间范围查询：timestamp 降序并包含 metric_value，可走仅索引扫描
+        Index('idx_system_metrics_name_timestamp', 'metric_name', text('timestamp DESC'),
+              postgresql_include=['metric_value']),
+        # jsonb_path_ops GIN 比默认 jsonb_ops 更小，适合 @> 包含查询
+        Index('idx_system_metrics_tags_gin', 'tags', postgresql_using='gin',
+              postgresql_ops={'tags': 'jsonb_path_ops'}),
+    )
+
+    to_dict = build_to_dict(
+        ("metric_name", "metric_unit", "metric_type"),
+        (
+            ("id", "id", as_str),
+            ("metric_value", "metric_value", as_float),
+            ("tags", "tags", or_empty_dict),
+            ("timestamp", "timestamp", as_isoformat),
+        )
     )
 
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            "id": str(self.id),
-            "metric_name": self.metric_name,
-            "metric_value": float(self.metric_value),
-            "metric_unit": self.metric_unit,
-            "metric_type": self.metric_type,
-            "tags": self.tags or {},
-            "timestamp": self.timestamp.isoformat() if self.timestamp else None
-        }
+class UserAgent(Base):
+    """User-Agent去重表，API指标只保存整数ID"""
+    __tablename__ = "user_agents"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    ua_hash = Column(LargeBinary(8), nullable=False, unique=True)  # blake2b 64位摘要
+    ua_text = Column(Text, nullable=False)
 
 class APIMetrics(Base):
     """API调用指标表"""
     __tablename__ = "api_metrics"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     endpoint = Column(String(200), nullable=False)  # API端点
     method = Column(String(10), nullable=False)  # HTTP方法
     status_code = Column(Integer, nullable=False)  # 响应状态码
-    response_time = Column(Numeric(10, 4), nullable=False)  # 响应时间(秒)
+    response_time = Column(Float, nullable=False)  # 响应时间(秒)
     request_size = Column(Integer, default=0)  # 请求大小(字节)
     response_size = Column(Integer, default=0)  # 响应大小(字节)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
     ip_address = Column(String(45), nullable=True)  # IP地址
-    user_agent = Column(Text, nullable=True)  # 用户代理
+    user_agent_id = Column(Integer, ForeignKey("user_agents.id", ondelete="SET NULL"), nullable=True)  # 用户代理(去重表ID)
     error_message = Column(Text, nullable=True)  # 错误信息
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     
@@ -66,40 +96,52 @@ class APIMetrics(Base):
     __table_args__ = (
         Index('idx_api_metrics_endpoint', 'endpoint'),
         Index('idx_api_metrics_status', 'status_code'),
-        Index('idx_api_metrics_timestamp', 'timestamp'),
+        Index('idx_api_metrics_timestamp_brin', 'timestamp', postgresql_using='brin',
+              postgresql_with={'pages_per_range': 32}),
         Index('idx_api_metrics_user', 'user_id'),
-        Index('idx_api_metrics_endpoint_timestamp', 'endpoint', 'timestamp'),
+        Index('idx_api_metrics_endpoint_timestamp', 'endpoint', text('timestamp DESC'),
+              postgresql_include=['response_time', 'status_code']),
+    )
+
+    to_dict = build_to_dict(
+        ("endpoint", "method", "status_code", "request_size", "response_size",
+         "ip_address", "error_message"),
+        (
+            ("id", "id", as_str),
+            ("response_time", "response_time", as_float),
+            ("user_id", "user_id", as_str),
+            ("timestamp", "timestamp", as_isoformat),
+        )
     )
 
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            "id": str(self.id),
-            "endpoint": self.endpoint,
-            "method": self.method,
-            "status_code": self.status_code,
-            "response_time": float(self.response_time),
-            "request_size": self.request_size,
-            "response_size": self.response_size,
-            "user_id": str(self.user_id) if self.user_id else None,
-            "ip_address": self.ip_address,
-            "error_message": self.error_message,
-            "timestamp": self.timestamp.isoformat() if self.timestamp else None
-        }
+class APIMetricsMinute(Base):
+    """API指标分钟级汇总表，进程内按刷新周期聚合后批量累加，摘要与时间序列查询无需扫描明细"""
+    __tablename__ = "api_metrics_minute"
+
+    endpoint = Column(String(200), primary_key=True)  # API端点
+    minute_ts = Column(DateTime(timezone=True), primary_key=True)  # 所在分钟(UTC，截断到整分钟)
+    request_count = Column(Integer, nullable=False, default=0)  # 请求数
+    response_time_sum = Column(Float, nullable=False, default=0)  # 响应时间合计(秒)
+    error_count = Column(Integer, nullable=False, default=0)  # 状态码>=400的请求数
+
+    # 索引
+    __table_args__ = (
+        Index('idx_api_metrics_minute_ts', 'minute_ts'),
+    )
 
 class AIModelMetrics(Base):
     """AI模型调用指标表"""
     __tablename__ = "ai_model_metrics"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     model_name = Column(String(100), nullable=False)  # 模型名称
     provider = Column(String(50), nullable=False)  # 提供商: openai, anthropic
     operation = Column(String(50), nullable=False)  # 操作类型: completion, analysis
     input_tokens = Column(Integer, default=0)  # 输入token数
     output_tokens = Column(Integer, default=0)  # 输出token数
     total_tokens = Column(Integer, default=0)  # 总token数
-    cost = Column(Numeric(10, 6), default=0.0)  # 成本(美元)
-    response_time = Column(Numeric(10, 4), nullable=False)  # 响应时间(秒)
+    cost = Column(BigInteger, default=0)  # 成本(微美元，1e-6 USD)
+    response_time = Column(Float, nullable=False)  # 响应时间(秒)
     success = Column(Boolean, default=True)  # 是否成功
     error_type = Column(String(100), nullable=True)  # 错误类型
     error_message = Column(Text, nullable=True)  # 错误信息
@@ -114,41 +156,36 @@ class AIModelMetrics(Base):
         Index('idx_ai_metrics_model', 'model_name'),
         Index('idx_ai_metrics_provider', 'provider'),
         Index('idx_ai_metrics_operation', 'operation'),
-        Index('idx_ai_metrics_timestamp', 'timestamp'),
+        Index('idx_ai_metrics_timestamp_brin', 'timestamp', postgresql_using='brin',
+              postgresql_with={'pages_per_range': 32}),
         Index('idx_ai_metrics_user', 'user_id'),
         Index('idx_ai_metrics_success', 'success'),
     )
 
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            "id": str(self.id),
-            "model_name": self.model_name,
-            "provider": self.provider,
-            "operation": self.operation,
-            "input_tokens": self.input_tokens,
-            "output_tokens": self.output_tokens,
-            "total_tokens": self.total_tokens,
-            "cost": float(self.cost),
-            "response_time": float(self.response_time),
-            "success": self.success,
-            "error_type": self.error_type,
-            "error_message": self.error_message,
-            "user_id": str(self.user_id) if self.user_id else None,
-            "timestamp": self.timestamp.isoformat() if self.timestamp else None
-        }
+    to_dict = build_to_dict(
+        ("model_name", "provider", "operation", "input_tokens", "output_tokens",
+         "total_tokens", "success", "error_type", "error_message"),
+        (
+            ("id", "id", as_str),
+            ("cost", "cost", micro_usd_to_usd),
+            ("response_time", "response_time", as_float),
+            ("user_id", "user_id", as_str),
+            ("timestamp", "timestamp", as_isoformat),
+        )
+    )
 
 class UserActivityMetrics(Base):
     """用户活动指标表"""
     __tablename__ = "user_activity_metrics"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     activity_type = Column(String(50), nullable=False)  # 活动类型
     activity_detail = Column(String(200), nullable=True)  # 活动详情
     resource_type = Column(String(50), nullable=True)  # 资源类型: prompt, template, analysis
     resource_id = Column(UUID(as_uuid=True), nullable=True)  # 资源ID
-    metadata = Column(JSONB, default={})  # 额外元数据
+    # 属性名不能使用 metadata（与声明式基类的 Base.metadata 冲突），数据库列名保持不变
+    extra_metadata = Column("metadata", JSONB, default={})  # 额外元数据
     session_id = Column(String(100), nullable=True)  # 会话ID
     ip_address = Column(String(45), nullable=True)  # IP地址
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
@@ -160,36 +197,35 @@ class UserActivityMetrics(Base):
     __table_args__ = (
         Index('idx_user_activity_user', 'user_id'),
         Index('idx_user_activity_type', 'activity_type'),
-        Index('idx_user_activity_timestamp', 'timestamp'),
+        Index('idx_user_activity_timestamp_brin', 'timestamp', postgresql_using='brin',
+              postgresql_with={'pages_per_range': 32}),
         Index('idx_user_activity_resource', 'resource_type', 'resource_id'),
         Index('idx_user_activity_session', 'session_id'),
+        Index('idx_user_activity_metadata_gin', 'metadata', postgresql_using='gin',
+              postgresql_ops={'metadata': 'jsonb_path_ops'}),
     )
 
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            "id": str(self.id),
-            "user_id": str(self.user_id),
-            "activity_type": self.activity_type,
-            "activity_detail": self.activity_detail,
-            "resource_type": self.resource_type,
-            "resource_id": str(self.resource_id) if self.resource_id else None,
-            "metadata": self.metadata or {},
-            "session_id": self.session_id,
-            "ip_address": self.ip_address,
-            "timestamp": self.timestamp.isoformat() if self.timestamp else None
-        }
+    to_dict = build_to_dict(
+        ("activity_type", "activity_detail", "resource_type", "session_id", "ip_address"),
+        (
+            ("id", "id", as_str),
+            ("user_id", "user_id", as_str),
+            ("resource_id", "resource_id", as_str),
+            ("metadata", "extra_metadata", or_empty_dict),
+            ("timestamp", "timestamp", as_isoformat),
+        )
+    )
 
 class AlertRule(Base):
     """告警规则表"""
     __tablename__ = "alert_rules"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     name = Column(String(200), nullable=False)  # 规则名称
     description = Column(Text, nullable=True)  # 规则描述
     metric_name = Column(String(100), nullable=False)  # 监控指标
     condition = Column(String(20), nullable=False)  # 条件: >, <, >=, <=, ==, !=
-    threshold = Column(Numeric(15, 4), nullable=False)  # 阈值
+    threshold = Column(Float, nullable=False)  # 阈值
     duration = Column(Integer, default=300)  # 持续时间(秒)
     severity = Column(String(20), default="warning")  # 严重程度: info, warning, error, critical
     is_active = Column(Boolean, default=True)  # 是否启用
@@ -209,34 +245,28 @@ class AlertRule(Base):
         Index('idx_alert_rules_severity', 'severity'),
     )
 
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            "id": str(self.id),
-            "name": self.name,
-            "description": self.description,
-            "metric_name": self.metric_name,
-            "condition": self.condition,
-            "threshold": float(self.threshold),
-            "duration": self.duration,
-            "severity": self.severity,
-            "is_active": self.is_active,
-            "notification_channels": self.notification_channels or [],
-            "created_by": str(self.created_by) if self.created_by else None,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None
-        }
+    to_dict = build_to_dict(
+        ("name", "description", "metric_name", "condition", "duration", "severity", "is_active"),
+        (
+            ("id", "id", as_str),
+            ("threshold", "threshold", as_float),
+            ("notification_channels", "notification_channels", or_empty_list),
+            ("created_by", "created_by", as_str),
+            ("created_at", "created_at", as_isoformat),
+            ("updated_at", "updated_at", as_isoformat),
+        )
+    )
 
 class Alert(Base):
     """告警记录表"""
     __tablename__ = "alerts"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     rule_id = Column(UUID(as_uuid=True), ForeignKey("alert_rules.id", ondelete="CASCADE"), nullable=False)
     status = Column(String(20), default="firing")  # 状态: firing, resolved
     message = Column(Text, nullable=False)  # 告警消息
-    current_value = Column(Numeric(15, 4), nullable=False)  # 当前值
-    threshold_value = Column(Numeric(15, 4), nullable=False)  # 阈值
+    current_value = Column(Float, nullable=False)  # 当前值
+    threshold_value = Column(Float, nullable=False)  # 阈值
     severity = Column(String(20), nullable=False)  # 严重程度
     fired_at = Column(DateTime(timezone=True), server_default=func.now())  # 触发时间
     resolved_at = Column(DateTime(timezone=True), nullable=True)  # 解决时间
@@ -253,20 +283,20 @@ class Alert(Base):
         Index('idx_alerts_status', 'status'),
         Index('idx_alerts_severity', 'severity'),
         Index('idx_alerts_fired_at', 'fired_at'),
+        # 未解决告警只占极少数，部分索引让按规则查找 firing 告警只需读一页
+        Index('idx_alerts_rule_firing', 'rule_id', postgresql_where=text("status = 'firing'")),
     )
 
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            "id": str(self.id),
-            "rule_id": str(self.rule_id),
-            "status": self.status,
-            "message": self.message,
-            "current_value": float(self.current_value),
-            "threshold_value": float(self.threshold_value),
-            "severity": self.severity,
-            "fired_at": self.fired_at.isoformat() if self.fired_at else None,
-            "resolved_at": self.resolved_at.isoformat() if self.resolved_at else None,
-            "acknowledged_at": self.acknowledged_at.isoformat() if self.acknowledged_at else None,
-            "acknowledged_by": str(self.acknowledged_by) if self.acknowledged_by else None
-        }
+    to_dict = build_to_dict(
+        ("status", "message", "severity"),
+        (
+            ("id", "id", as_str),
+            ("rule_id", "rule_id", as_str),
+            ("current_value", "current_value", as_float),
+            ("threshold_value", "threshold_value", as_float),
+            ("fired_at", "fired_at", as_isoformat),
+            ("resolved_at", "resolved_at", as_isoformat),
+            ("acknowledged_at", "acknowledged_at", as_isoformat),
+            ("acknowledged_by", "acknowledged_by", as_str),
+        )
+    )
@@ -6,14 +6,15 @@ from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Text, Inte
 from sqlalchemy.dialects.postgresql import UUID, JSONB, ARRAY
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-import uuid
+from app.core.ids import uuid7
 from config.database import Base
+from app.models.serialization import build_to_dict, as_str, as_isoformat
 
 class Prompt(Base):
     """提示词模型"""
     __tablename__ = "prompts"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     title = Column(String(200), nullable=True)
     content = Column(Text, nullable=False)
@@ -31,26 +32,21 @@ class Prompt(Base):
     def __repr__(self):
         return f"<Prompt(id={self.id}, title={self.title}, user_id={self.user_id})>"
 
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            "id": str(self.id),
-            "user_id": str(self.user_id),
-            "title": self.title,
-            "content": self.content,
-            "category": self.category,
-            "tags": self.tags,
-            "is_template": self.is_template,
-            "is_public": self.is_public,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None
-        }
+    to_dict = build_to_dict(
+        ("title", "content", "category", "tags", "is_template", "is_public"),
+        (
+            ("id", "id", as_str),
+            ("user_id", "user_id", as_str),
+            ("created_at", "created_at", as_isoformat),
+            ("updated_at", "updated_at", as_isoformat),
+        )
+    )
 
 class AnalysisResult(Base):
     """分析结果模型"""
     __tablename__ = "analysis_results"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     prompt_id = Column(UUID(as_uuid=True), ForeignKey("prompts.id", ondelete="CASCADE"), nullable=False)
     overall_score = Column(Integer, nullable=False)  # 0-100
     semantic_clarity = Column(Integer, nullable=False)  # 0-100
@@ -68,26 +64,21 @@ class AnalysisResult(Base):
     def __repr__(self):
         return f"<AnalysisResult(id={self.id}, prompt_id={self.prompt_id}, score={self.overall_score})>"
 
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            "id": str(self.id),
-            "prompt_id": str(self.prompt_id),
-            "overall_score": self.overall_score,
-            "semantic_clarity": self.semantic_clarity,
-            "structural_integrity": self.structural_integrity,
-            "logical_coherence": self.logical_coherence,
-            "analysis_details": self.analysis_details,
-            "processing_time_ms": self.processing_time_ms,
-            "ai_model_used": self.ai_model_used,
-            "created_at": self.created_at.isoformat() if self.created_at else None
-        }
+    to_dict = build_to_dict(
+        ("overall_score", "semantic_clarity", "structural_integrity", "logical_coherence",
+         "analysis_details", "processing_time_ms", "ai_model_used"),
+        (
+            ("id", "id", as_str),
+            ("prompt_id", "prompt_id", as_str),
+            ("created_at", "created_at", as_isoformat),
+        )
+    )
 
 class OptimizationSuggestion(Base):
     """优化建议模型"""
     __tablename__ = "optimization_suggestions"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     analysis_id = Column(UUID(as_uuid=True), ForeignKey("analysis_results.id", ondelete="CASCADE"), nullable=False)
     suggestion_type = Column(String(50), nullable=False)
     priority = Column(Integer, nullable=False)  # 1-5, 1最高
@@ -103,16 +94,12 @@ class OptimizationSuggestion(Base):
     def __repr__(self):
         return f"<OptimizationSuggestion(id={self.id}, type={self.suggestion_type}, priority={self.priority})>"
 
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            "id": str(self.id),
-            "analysis_id": str(self.analysis_id),
-            "suggestion_type": self.suggestion_type,
-            "priority": self.priority,
-            "description": self.description,
-            "improvement_plan": self.improvement_plan,
-            "expected_impact": self.expected_impact,
-            "is_applied": self.is_applied,
-            "created_at": self.created_at.isoformat() if self.created_at else None
-        }
+    to_dict = build_to_dict(
+        ("suggestion_type", "priority", "description", "improvement_plan",
+         "expected_impact", "is_applied"),
+        (
+            ("id", "id", as_str),
+            ("analysis_id", "analysis_id", as_str),
+            ("created_at", "created_at", as_isoformat),
+        )
+    )
@@ -0,0 +1,65 @@
+"""
+模型序列化工具
+
+to_dict() 的字段表在类定义时解析一次：普通字段通过 attrgetter 一次取出，
+只有需要类型转换的字段（UUID、时间、Numeric 等）才逐个调用转换函数。
+"""
+
+from operator import attrgetter
+from typing import Any, Callable, Dict, Sequence, Tuple
+
+
+def as_str(value: Any):
+    """UUID等转为字符串，None保持不变"""
+    return str(value) if value is not None else None
+
+
+def as_isoformat(value: Any):
+    """时间转为ISO格式字符串，None保持不变"""
+    return value.isoformat() if value is not None else None
+
+
+def as_float(value: Any):
+    """Numeric转为浮点数"""
+    return float(value)
+
+
+def from_hundredths(value: Any):
+    """以百分之一为单位存储的整数转为浮点数，空值为0.0"""
+    return value / 100 if value else 0.0
+
+
+def or_empty_dict(value: Any):
+    """空值转为空字典"""
+    return value or {}
+
+
+def or_empty_list(value: Any):
+    """空值转为空列表"""
+    return value or []
+
+
+def build_to_dict(
+    plain_fields: Sequence[str],
+    converted_fields: Sequence[Tuple[str, str, Callable[[Any], Any]]] = ()
+) -> Callable[[Any], Dict[str, Any]]:
+    """生成模型的 to_dict 方法
+
+    plain_fields: 原样输出的属性名
+    converted_fields: (输出键名, 属性名, 转换函数)
+    """
+    plain_keys = tuple(plain_fields)
+    get_plain = attrgetter(*plain_keys) if len(plain_keys) > 1 else None
+    converted = tuple(converted_fields)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        if get_plain is not None:
+            result = dict(zip(plain_keys, get_plain(self)))
+        else:
+            result = {key: getattr(self, key) for key in plain_keys}
+        for key, attr, convert in converted:
+            result[key] = convert(getattr(self, attr))
+        return result
+
+    return to_dict
@@ -2,39 +2,46 @@
 模板相关数据模型
 """
 
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Text, Integer, Numeric, Index
-from sqlalchemy.dialects.postgresql import UUID, ARRAY, JSONB
-from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
 import uuid
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import DDL, String, Boolean, DateTime, ForeignKey, Text, Integer, SmallInteger, Index, event
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.sql import func, text
+from app.core.ids import uuid7
 from config.database import Base
+from app.models.serialization import (
+    build_to_dict, as_str, as_isoformat, from_hundredths, or_empty_dict
+)
 
 class Template(Base):
     """模板模型"""
     __tablename__ = "templates"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    creator_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
-    name = Column(String(200), nullable=False)
-    description = Column(Text, nullable=True)
-    content = Column(Text, nullable=False)
-    category = Column(String(50), nullable=True)
-    tags = Column(ARRAY(String), default=[])
-    usage_count = Column(Integer, default=0)
-    rating = Column(Numeric(3, 2), default=0.00)  # 0.00-5.00
-    rating_count = Column(Integer, default=0)  # 评分人数
-    is_featured = Column(Boolean, default=False)
-    is_public = Column(Boolean, default=True)
-    is_verified = Column(Boolean, default=False)  # 官方认证
-    difficulty_level = Column(String(20), default="beginner")  # beginner, intermediate, advanced
-    language = Column(String(10), default="zh-CN")  # 语言标识
-    industry = Column(String(50), nullable=True)  # 行业分类
-    use_case = Column(String(100), nullable=True)  # 使用场景
-    metadata = Column(JSONB, default={})  # 扩展元数据
-    version = Column(String(20), default="1.0.0")  # 版本号
-    parent_id = Column(UUID(as_uuid=True), ForeignKey("templates.id", ondelete="SET NULL"), nullable=True)  # 父模板ID（用于版本管理）
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    creator_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    name: Mapped[str] = mapped_column(String(200), nullable=False)
+    description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    content: Mapped[str] = mapped_column(Text, nullable=False)
+    category: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+    usage_count: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    rating: Mapped[Optional[int]] = mapped_column(SmallInteger, default=0)  # 评分×100，0-500
+    rating_count: Mapped[Optional[int]] = mapped_column(Integer, default=0)  # 评分人数
+    rating_sum: Mapped[Optional[int]] = mapped_column(Integer, default=0, server_default="0")  # 评分总和（rating/rating_count/rating_sum 由数据库触发器维护）
+    is_featured: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
+    is_public: Mapped[Optional[bool]] = mapped_column(Boolean, default=True)
+    is_verified: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)  # 官方认证
+    difficulty_level: Mapped[Optional[str]] = mapped_column(String(20), default="beginner")  # beginner, intermediate, advanced
+    language: Mapped[Optional[str]] = mapped_column(String(10), default="zh-CN")  # 语言标识
+    industry: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)  # 行业分类
+    use_case: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)  # 使用场景
+    meta: Mapped[Optional[dict]] = mapped_column("metadata", JSONB, default=dict, server_default="{}")  # 扩展元数据（metadata 为保留属性名）
+    version: Mapped[Optional[str]] = mapped_column(String(20), default="1.0.0")  # 版本号
+    parent_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey("templates.id", ondelete="SET NULL"), nullable=True)  # 父模板ID（用于版本管理）
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     # 关系
     creator = relationship("User", back_populates="templates")
@@ -42,47 +49,51 @@ class Template(Base):
     usage_records = relationship("TemplateUsage", back_populates="template", cascade="all, delete-orphan")
     collections = relationship("TemplateCollection", back_populates="template", cascade="all, delete-orphan")
     parent = relationship("Template", remote_side=[id], backref="children")
+    tag_objects = relationship("TemplateTag", secondary="template_tag_map", order_by="TemplateTag.name")
 
     # 索引
     __table_args__ = (
         Index('idx_template_category', 'category'),
-        Index('idx_template_tags', 'tags'),
+        Index('idx_template_metadata', 'metadata', postgresql_using='gin',
+              postgresql_ops={'metadata': 'jsonb_path_ops'}),
+        Index('idx_template_meta_industry', text("(metadata -> 'industry') jsonb_path_ops"),
+              postgresql_using='gin'),
         Index('idx_template_industry', 'industry'),
         Index('idx_template_difficulty', 'difficulty_level'),
-        Index('idx_template_public', 'is_public'),
-        Index('idx_template_featured', 'is_featured'),
-        Index('idx_template_rating', 'rating'),
-        Index('idx_template_usage', 'usage_count'),
+        # 列表查询几乎都带 is_public 条件，用部分索引替代整表单列索引
+        Index('idx_template_public_usage', 'usage_count', 'rating', postgresql_where=text('is_public')),
+        Index('idx_template_public_rating', 'rating', postgresql_where=text('is_public')),
+        Index('idx_template_public_created', 'created_at', postgresql_where=text('is_public')),
+        Index('idx_template_featured_created', 'created_at',
+              postgresql_where=text('is_public AND is_featured')),
     )
 
     def __repr__(self):
         return f"<Template(id={self.id}, name={self.name}, creator_id={self.creator_id})>"
 
+    @property
+    def tags(self) -> List[str]:
+        """标签名称列表"""
+        return [tag.name for tag in self.tag_objects]
+
+    _base_to_dict = build_to_dict(
+        ("name", "description", "category", "tags", "usage_count", "rating_count", "is_featured",
+         "is_public", "is_verified", "difficulty_level", "language", "industry", "use_case",
+         "version"),
+        (
+            ("id", "id", as_str),
+            ("creator_id", "creator_id", as_str),
+            ("rating", "rating", from_hundredths),
+            ("metadata", "meta", or_empty_dict),
+            ("parent_id", "parent_id", as_str),
+            ("created_at", "created_at", as_isoformat),
+            ("updated_at", "updated_at", as_isoformat),
+        )
+    )
+
     def to_dict(self, include_content=True):
         """转换为字典"""
-        result = {
-            "id": str(self.id),
-            "creator_id": str(self.creator_id) if self.creator_id else None,
-            "name": self.name,
-            "description": self.description,
-            "category": self.category,
-            "tags": self.tags or [],
-            "usage_count": self.usage_count,
-            "rating": float(self.rating) if self.rating else 0.0,
-            "rating_count": self.rating_count,
-            "is_featured": self.is_featured,
-            "is_public": self.is_public,
-            "is_verified": self.is_verified,
-            "difficulty_level": self.difficulty_level,
-            "language": self.language,
-            "industry": self.industry,
-            "use_case": self.use_case,
-            "metadata": self.metadata or {},
-            "version": self.version,
-            "parent_id": str(self.parent_id) if self.parent_id else None,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None
-        }
+        result = self._base_to_dict()
 
         if include_content:
             result["content"] = self.content
@@ -93,13 +104,13 @@ class TemplateRating(Base):
     """模板评分模型"""
     __tablename__ = "template_ratings"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    template_id = Column(UUID(as_uuid=True), ForeignKey("templates.id", ondelete="CASCADE"), nullable=False)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    rating = Column(Integer, nullable=False)  # 1-5
-    comment = Column(Text, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    template_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("templates.id", ondelete="CASCADE"), nullable=False)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    rating: Mapped[int] = mapped_column(Integer, nullable=False)  # 1-5
+    comment: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     # 关系
     template = relationship("Template", back_populates="ratings")
@@ -108,26 +119,25 @@ class TemplateRating(Base):
     def __repr__(self):
         return f"<TemplateRating(template_id={self.template_id}, user_id={self.user_id}, rating={self.rating})>"
 
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            "id": str(self.id),
-            "template_id": str(self.template_id),
-            "user_id": str(self.user_id),
-            "rating": self.rating,
-            "comment": self.comment,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None
-        }
+    to_dict = build_to_dict(
+        ("rating", "comment"),
+        (
+            ("id", "id", as_str),
+            ("template_id", "template_id", as_str),
+            ("user_id", "user_id", as_str),
+            ("created_at", "created_at", as_isoformat),
+            ("updated_at", "updated_at", as_isoformat),
+        )
+    )
 
 class TemplateUsage(Base):
     """模板使用记录模型"""
     __tablename__ = "template_usage"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    template_id = Column(UUID(as_uuid=True), ForeignKey("templates.id", ondelete="CASCADE"), nullable=False)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    used_at = Column(DateTime(timezone=True), server_default=func.now())
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    template_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("templates.id", ondelete="CASCADE"), nullable=False)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    used_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
     # 关系
     template = relationship("Template")
@@ -136,26 +146,27 @@ class TemplateUsage(Base):
     def __repr__(self):
         return f"<TemplateUsage(template_id={self.template_id}, user_id={self.user_id})>"
 
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            "id": str(self.id),
-            "template_id": str(self.template_id),
-            "user_id": str(self.user_id),
-            "used_at": self.used_at.isoformat() if self.used_at else None
-        }
+    to_dict = build_to_dict(
+        (),
+        (
+            ("id", "id", as_str),
+            ("template_id", "template_id", as_str),
+            ("user_id", "user_id", as_str),
+            ("used_at", "used_at", as_isoformat),
+        )
+    )
 
 
 class TemplateCollection(Base):
     """模板收藏表"""
     __tablename__ = "template_collections"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    template_id = Column(UUID(as_uuid=True), ForeignKey("templates.id", ondelete="CASCADE"), nullable=False)
-    collection_name = Column(String(100), nullable=True)  # 收藏夹名称
-    notes = Column(Text, nullable=True)  # 个人备注
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    template_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("templates.id", ondelete="CASCADE"), nullable=False)
+    collection_name: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)  # 收藏夹名称
+    notes: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # 个人备注
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
     # 关系
     user = relationship("User")
@@ -168,32 +179,31 @@ class TemplateCollection(Base):
         Index('idx_collection_name', 'collection_name'),
     )
 
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            "id": str(self.id),
-            "user_id": str(self.user_id),
-            "template_id": str(self.template_id),
-            "collection_name": self.collection_name,
-            "notes": self.notes,
-            "created_at": self.created_at.isoformat() if self.created_at else None
-        }
+    to_dict = build_to_dict(
+        ("collection_name", "notes"),
+        (
+            ("id", "id", as_str),
+            ("user_id", "user_id", as_str),
+            ("template_id", "template_id", as_str),
+            ("created_at", "created_at", as_isoformat),
+        )
+    )
 
 
 class TemplateCategory(Base):
     """模板分类表"""
     __tablename__ = "template_categories"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    name = Column(String(100), nullable=False, unique=True)
-    description = Column(Text, nullable=True)
-    icon = Column(String(50), nullable=True)  # 图标名称
-    color = Column(String(20), nullable=True)  # 颜色代码
-    parent_id = Column(UUID(as_uuid=True), ForeignKey("template_categories.id", ondelete="CASCADE"), nullable=True)
-    sort_order = Column(Integer, default=0)  # 排序
-    is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    name: Mapped[str] = mapped_column(String(100), nullable=False, unique=True)
+    description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    icon: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)  # 图标名称
+    color: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)  # 颜色代码
+    parent_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey("template_categories.id", ondelete="CASCADE"), nullable=True)
+    sort_order: Mapped[Optional[int]] = mapped_column(Integer, default=0)  # 排序
+    is_active: Mapped[Optional[bool]] = mapped_column(Boolean, default=True)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     # 关系
     parent = relationship("TemplateCategory", remote_side=[id], backref="children")
@@ -205,33 +215,44 @@ class TemplateCategory(Base):
         Index('idx_category_active', 'is_active'),
     )
 
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            "id": str(self.id),
-            "name": self.name,
-            "description": self.description,
-            "icon": self.icon,
-            "color": self.color,
-            "parent_id": str(self.parent_id) if self.parent_id else None,
-            "sort_order": self.sort_order,
-            "is_active": self.is_active,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None
-        }
+    to_dict = build_to_dict(
+        ("name", "description", "icon", "color", "sort_order", "is_active"),
+        (
+            ("id", "id", as_str),
+            ("parent_id", "parent_id", as_str),
+            ("created_at", "created_at", as_isoformat),
+            ("updated_at", "updated_at", as_isoformat),
+        )
+    )
+
+
+class TemplateTagMap(Base):
+    """模板-标签关联表"""
+    __tablename__ = "template_tag_map"
+
+    template_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("templates.id", ondelete="CASCADE"), primary_key=True)
+    tag_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("template_tags.id", ondelete="CASCADE"), primary_key=True)
+
+    # 索引（主键覆盖按模板查标签，反向索引用于按标签查模板）
+    __table_args__ = (
+        Index('idx_tag_map_tag_template', 'tag_id', 'template_id'),
+    )
+
+    def __repr__(self):
+        return f"<TemplateTagMap(template_id={self.template_id}, tag_id={self.tag_id})>"
 
 
 class TemplateTag(Base):
     """模板标签表"""
     __tablename__ = "template_tags"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    name = Column(String(50), nullable=False, unique=True)
-    description = Column(Text, nullable=True)
-    color = Column(String(20), nullable=True)  # 标签颜色
-    usage_count = Column(Integer, default=0)  # 使用次数
-    is_featured = Column(Boolean, default=False)  # 是否推荐标签
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    name: Mapped[str] = mapped_column(String(50), nullable=False, unique=True)
+    description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    color: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)  # 标签颜色
+    usage_count: Mapped[Optional[int]] = mapped_column(Integer, default=0)  # 使用次数（由 trg_template_tag_usage 触发器维护）
+    is_featured: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)  # 是否推荐标签
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
     # 索引
     __table_args__ = (
@@ -240,14 +261,70 @@ class TemplateTag(Base):
         Index('idx_tag_featured', 'is_featured'),
     )
 
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            "id": str(self.id),
-            "name": self.name,
-            "description": self.description,
-            "color": self.color,
-            "usage_count": self.usage_count,
-            "is_featured": self.is_featured,
-            "created_at": self.created_at.isoformat() if self.created_at else None
-        }
+    to_dict = build_to_dict(
+        ("name", "description", "color", "usage_count", "is_featured"),
+        (
+            ("id", "id", as_str),
+            ("created_at", "created_at", as_isoformat),
+        )
+    )
+
+
+# 评分聚合触发器（与 alembic 0006/0009 一致）：rating / rating_count / rating_sum 随 template_ratings 增量维护。
+# create_all 建表时一并安装；仅 PostgreSQL，其他数据库由 template_service.sync_rating_aggregate 在应用侧重算
+TEMPLATE_RATING_AGG_FUNCTION = DDL("""
+CREATE OR REPLACE FUNCTION template_rating_agg() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE templates SET
+            rating_sum = rating_sum - OLD.rating,
+            rating_count = rating_count - 1,
+            rating = CASE WHEN rating_count > 1
+                THEN round((rating_sum - OLD.rating) * 100.0 / (rating_count - 1))
+                ELSE 0 END
+        WHERE id = OLD.template_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE templates SET
+            rating_sum = rating_sum + NEW.rating,
+            rating_count = rating_count + 1,
+            rating = round((rating_sum + NEW.rating) * 100.0 / (rating_count + 1))
+        WHERE id = NEW.template_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+""")
+
+TEMPLATE_RATING_AGG_TRIGGER = DDL("""
+CREATE TRIGGER trg_template_rating_agg
+AFTER INSERT OR DELETE OR UPDATE OF rating, template_id ON template_ratings
+FOR EACH ROW EXECUTE FUNCTION template_rating_agg()
+""")
+
+event.listen(TemplateRating.__table__, "after_create", TEMPLATE_RATING_AGG_FUNCTION.execute_if(dialect="postgresql"))
+event.listen(TemplateRating.__table__, "after_create", TEMPLATE_RATING_AGG_TRIGGER.execute_if(dialect="postgresql"))
+
+# 标签使用次数触发器（与 alembic 0010 一致）：usage_count 随 template_tag_map 增删维护。
+# 同样仅 PostgreSQL，其他数据库由 template_service.sync_tag_usage 在应用侧重算
+TEMPLATE_TAG_USAGE_FUNCTION = DDL("""
+CREATE OR REPLACE FUNCTION template_tag_usage() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE template_tags SET usage_count = COALESCE(usage_count, 0) + 1 WHERE id = NEW.tag_id;
+    ELSE
+        UPDATE template_tags SET usage_count = COALESCE(usage_count, 0) - 1 WHERE id = OLD.tag_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+""")
+
+TEMPLATE_TAG_USAGE_TRIGGER = DDL("""
+CREATE TRIGGER trg_template_tag_usage
+AFTER INSERT OR DELETE ON template_tag_map
+FOR EACH ROW EXECUTE FUNCTION template_tag_usage()
+""")
+
+event.listen(TemplateTagMap.__table__, "after_create", TEMPLATE_TAG_USAGE_FUNCTION.execute_if(dialect="postgresql"))
+event.listen(TemplateTagMap.__table__, "after_create", TEMPLATE_TAG_USAGE_TRIGGER.execute_if(dialect="postgresql"))
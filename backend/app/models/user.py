@@ -2,58 +2,66 @@
 用户相关数据模型
 """
 
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Text
-from sqlalchemy.dialects.postgresql import UUID, JSONB
-from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
 import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import String, Boolean, DateTime, ForeignKey, Text, CheckConstraint
+from sqlalchemy.dialects.postgresql import UUID, JSONB, CITEXT
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.sql import func
+from app.core.ids import uuid7
 from config.database import Base
+from app.models.serialization import build_to_dict, as_str, as_isoformat
 
 class User(Base):
     """用户模型"""
     __tablename__ = "users"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    username = Column(String(50), unique=True, nullable=False, index=True)
-    email = Column(String(100), unique=True, nullable=False, index=True)
-    password_hash = Column(String(255), nullable=False)
-    role = Column(String(20), default="user", nullable=False)
-    is_active = Column(Boolean, default=True, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    # CITEXT：等值比较大小写不敏感，且仍可走唯一索引
+    username: Mapped[str] = mapped_column(CITEXT, unique=True, nullable=False, index=True)
+    email: Mapped[str] = mapped_column(CITEXT, unique=True, nullable=False, index=True)
+    password_hash: Mapped[str] = mapped_column(String(255), nullable=False)
+    role: Mapped[str] = mapped_column(String(20), default="user", nullable=False)
+    is_active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     # 关系
     preferences = relationship("UserPreference", back_populates="user", uselist=False)
     prompts = relationship("Prompt", back_populates="user")
     templates = relationship("Template", back_populates="creator")
 
+    __table_args__ = (
+        CheckConstraint("char_length(username) <= 50", name="ck_users_username_length"),
+        CheckConstraint("char_length(email) <= 100", name="ck_users_email_length"),
+    )
+
     def __repr__(self):
         return f"<User(id={self.id}, username={self.username}, email={self.email})>"
 
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            "id": str(self.id),
-            "username": self.username,
-            "email": self.email,
-            "role": self.role,
-            "is_active": self.is_active,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None
-        }
+    to_dict = build_to_dict(
+        ("username", "email", "role", "is_active"),
+        (
+            ("id", "id", as_str),
+            ("created_at", "created_at", as_isoformat),
+            ("updated_at", "updated_at", as_isoformat),
+        )
+    )
 
 class UserPreference(Base):
     """用户偏好设置模型"""
     __tablename__ = "user_preferences"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    preferred_ai_model = Column(String(50), default="gpt-3.5-turbo")
-    analysis_depth = Column(String(20), default="standard")
-    notification_settings = Column(JSONB, default={})
-    ui_preferences = Column(JSONB, default={})
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    preferred_ai_model: Mapped[Optional[str]] = mapped_column(String(50), default="gpt-3.5-turbo")
+    analysis_depth: Mapped[Optional[str]] = mapped_column(String(20), default="standard")
+    notification_settings: Mapped[Optional[dict]] = mapped_column(JSONB, default={})
+    ui_preferences: Mapped[Optional[dict]] = mapped_column(JSONB, default={})
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     # 关系
     user = relationship("User", back_populates="preferences")
@@ -61,15 +69,12 @@ class UserPreference(Base):
     def __repr__(self):
         return f"<UserPreference(user_id={self.user_id}, ai_model={self.preferred_ai_model})>"
 
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            "id": str(self.id),
-            "user_id": str(self.user_id),
-            "preferred_ai_model": self.preferred_ai_model,
-            "analysis_depth": self.analysis_depth,
-            "notification_settings": self.notification_settings,
-            "ui_preferences": self.ui_preferences,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None
-        }
+    to_dict = build_to_dict(
+        ("preferred_ai_model", "analysis_depth", "notification_settings", "ui_preferences"),
+        (
+            ("id", "id", as_str),
+            ("user_id", "user_id", as_str),
+            ("created_at", "created_at", as_isoformat),
+            ("updated_at", "updated_at", as_isoformat),
+        )
+    )
@@ -2,7 +2,7 @@
 认证相关数据模式
 """
 
-from pydantic import BaseModel, EmailStr, validator
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional
 from datetime import datetime
 
@@ -13,23 +13,10 @@ class LoginRequest(BaseModel):
 
 class RegisterRequest(BaseModel):
     """注册请求"""
-    username: str
+    # 长度约束由 pydantic-core 直接校验，无需 Python 层 validator
+    username: str = Field(min_length=3, max_length=50, description="用户名，3-50个字符")
     email: EmailStr
-    password: str
-    
-    @validator('username')
-    def validate_username(cls, v):
-        if len(v) < 3:
-            raise ValueError('用户名至少需要3个字符')
-        if len(v) > 50:
-            raise ValueError('用户名不能超过50个字符')
-        return v
-    
-    @validator('password')
-    def validate_password(cls, v):
-        if len(v) < 6:
-            raise ValueError('密码至少需要6个字符')
-        return v
+    password: str = Field(min_length=6, description="密码，至少6个字符")
 
 class UserResponse(BaseModel):
     """用户响应"""
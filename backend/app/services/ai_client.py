@@ -5,14 +5,33 @@ AI服务客户端 - 集成OpenAI和Anthropic API
 import os
 import asyncio
 import json
-from typing import Dict, List, Optional, Any, Union
+import logging
+import threading
+from typing import AsyncIterator, Dict, List, Mapping, Optional, Any, Tuple, Union
 from dataclasses import dataclass
+from functools import lru_cache
+from time import monotonic, perf_counter
+from types import MappingProxyType
 import openai
 import anthropic
 import tiktoken
+import httpx
 from openai import AsyncOpenAI
 from anthropic import AsyncAnthropic
 
+try:
+    from tokenizers import Tokenizer
+except ImportError:  # tokenizers 随 transformers 安装，缺失时退回估算
+    Tokenizer = None
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
 @dataclass
 class AIResponse:
     """AI响应数据结构"""
@@ -22,25 +41,92 @@ class AIResponse:
     finish_reason: str
     response_time: float
 
+# 社区整理的Claude分词器，与Claude 3系列模型的实际分词并不一致，计数仅为近似值
+CLAUDE_TOKENIZER_NAME = "Xenova/claude-tokenizer"
+# 加载失败后再次尝试的间隔（秒）
+CLAUDE_TOKENIZER_RETRY_INTERVAL = 300
+
 class AIClientError(Exception):
     """AI客户端异常"""
     pass
 
+@lru_cache(maxsize=32)
+def _get_encoding(model: str) -> "tiktoken.Encoding":
+    """获取并缓存模型对应的tiktoken编码器"""
+    return tiktoken.encoding_for_model(model)
+
+_claude_tokenizer: Optional["Tokenizer"] = None
+_claude_tokenizer_lock = threading.Lock()
+_claude_tokenizer_next_attempt = 0.0
+
+def load_claude_tokenizer() -> bool:
+    """加载Claude分词器（首次会从Hugging Face Hub下载，阻塞，需在线程中调用）
+
+    应用启动时调用；失败后间隔 CLAUDE_TOKENIZER_RETRY_INTERVAL 秒才允许再次尝试。
+    """
+    global _claude_tokenizer, _claude_tokenizer_next_attempt
+    if _claude_tokenizer is not None:
+        return True
+    if Tokenizer is None:
+        return False
+    # 其他线程正在加载时直接返回
+    if not _claude_tokenizer_lock.acquire(blocking=False):
+        return False
+    try:
+        if monotonic() < _claude_tokenizer_next_attempt:
+            return False
+        try:
+            _claude_tokenizer = Tokenizer.from_pretrained(CLAUDE_TOKENIZER_NAME)
+            return True
+        except Exception as e:
+            _claude_tokenizer_next_attempt = monotonic() + CLAUDE_TOKENIZER_RETRY_INTERVAL
+            logger.warning(f"Claude分词器加载失败，暂按字符数估算: {e}")
+            return False
+    finally:
+        _claude_tokenizer_lock.release()
+
+def _get_claude_tokenizer() -> Optional["Tokenizer"]:
+    """获取已加载的Claude分词器
+
+    未加载时返回None，并在到达重试时间后于后台线程中重新加载，不阻塞调用方。
+    """
+    if (
+        _claude_tokenizer is None
+        and Tokenizer is not None
+        and monotonic() >= _claude_tokenizer_next_attempt
+        and not _claude_tokenizer_lock.locked()
+    ):
+        threading.Thread(target=load_claude_tokenizer, daemon=True).start()
+    return _claude_tokenizer
+
+# 共享HTTP连接池上限（OpenAI与Anthropic客户端共用）
+AI_MAX_CONNECTIONS = 100
+
 class AIClient:
     """统一的AI服务客户端"""
     
     def __init__(self):
+        # 共享连接池，批量请求复用keep-alive连接；可用时启用HTTP/2多路复用
+        self.http_client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=AI_MAX_CONNECTIONS,
+                max_keepalive_connections=AI_MAX_CONNECTIONS
+            ),
+            timeout=httpx.Timeout(600.0, connect=5.0)
+        )
+        
         # OpenAI配置
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.openai_client = None
         if self.openai_api_key:
-            self.openai_client = AsyncOpenAI(api_key=self.openai_api_key)
+            self.openai_client = AsyncOpenAI(api_key=self.openai_api_key, http_client=self.http_client)
         
         # Anthropic配置
         self.anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
         self.anthropic_client = None
         if self.anthropic_api_key:
-            self.anthropic_client = AsyncAnthropic(api_key=self.anthropic_api_key)
+            self.anthropic_client = AsyncAnthropic(api_key=self.anthropic_api_key, http_client=self.http_client)
         
         # 支持的模型配置
         self.supported_models = {
@@ -55,28 +141,43 @@ class AIClient:
                 "claude-3-opus": {"max_tokens": 200000, "cost_per_1k": 0.015},
             }
         }
+        
+        # 展平为 模型名 -> 配置（含provider），客户端在初始化后不再变化，可用模型一次算好
+        self._model_info = MappingProxyType({
+            model: MappingProxyType({**info, "provider": provider})
+            for provider, models in self.supported_models.items()
+            for model, info in models.items()
+        })
+        configured = {
+            "openai": self.openai_client is not None,
+            "anthropic": self.anthropic_client is not None
+        }
+        self._available_models = tuple(
+            model for model, info in self._model_info.items() if configured[info["provider"]]
+        )
     
-    def get_available_models(self) -> List[str]:
+    def get_available_models(self) -> Tuple[str, ...]:
         """获取可用的AI模型列表"""
-        available = []
-        
-        if self.openai_client:
-            available.extend(self.supported_models["openai"].keys())
-        
-        if self.anthropic_client:
-            available.extend(self.supported_models["anthropic"].keys())
-        
-        return available
+        return self._available_models
+    
+    def get_model_info(self, model: str) -> Optional[Mapping[str, Any]]:
+        """获取模型配置（max_tokens、cost_per_1k、provider），不支持的模型返回None"""
+        return self._model_info.get(model)
     
     def count_tokens(self, text: str, model: str = "gpt-3.5-turbo") -> int:
         """计算文本的token数量"""
+        if not text:
+            return 0
+        
         try:
             if model.startswith("gpt"):
-                encoding = tiktoken.encoding_for_model(model)
-                return len(encoding.encode(text))
+                return len(_get_encoding(model).encode(text))
             elif model.startswith("claude"):
-                # Anthropic的token计算（近似）
-                return len(text) // 4  # 粗略估算：4个字符约等于1个token
+                tokenizer = _get_claude_tokenizer()
+                if tokenizer is not None:
+                    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+                # 分词器不可用时粗略估算：4个字符约等于1个token
+                return len(text) // 4
             else:
                 return len(text.split())  # 简单的单词计数
         except Exception:
@@ -93,21 +194,21 @@ class AIClient:
         if not self.openai_client:
             raise AIClientError("OpenAI API key not configured")
         
-        if model not in self.supported_models["openai"]:
+        info = self._model_info.get(model)
+        if info is None or info["provider"] != "openai":
             raise AIClientError(f"Unsupported OpenAI model: {model}")
         
-        import time
-        start_time = time.time()
+        start_time = perf_counter()
         
         try:
             response = await self.openai_client.chat.completions.create(
                 model=model,
                 messages=messages,
                 temperature=temperature,
-                max_tokens=max_tokens or self.supported_models["openai"][model]["max_tokens"] // 2
+                max_tokens=max_tokens or info["max_tokens"] // 2
             )
             
-            response_time = time.time() - start_time
+            response_time = perf_counter() - start_time
             
             return AIResponse(
                 content=response.choices[0].message.content,
@@ -135,22 +236,15 @@ class AIClient:
         if not self.anthropic_client:
             raise AIClientError("Anthropic API key not configured")
         
-        if model not in self.supported_models["anthropic"]:
+        info = self._model_info.get(model)
+        if info is None or info["provider"] != "anthropic":
             raise AIClientError(f"Unsupported Anthropic model: {model}")
         
-        import time
-        start_time = time.time()
+        start_time = perf_counter()
         
         try:
             # 转换消息格式（Anthropic格式稍有不同）
-            system_message = ""
-            user_messages = []
-            
-            for msg in messages:
-                if msg["role"] == "system":
-                    system_message = msg["content"]
-                else:
-                    user_messages.append(msg)
+            system_message, user_messages = self._split_system_message(messages)
             
             response = await self.anthropic_client.messages.create(
                 model=model,
@@ -160,7 +254,7 @@ class AIClient:
                 messages=user_messages
             )
             
-            response_time = time.time() - start_time
+            response_time = perf_counter() - start_time
             
             return AIResponse(
                 content=response.content[0].text,
@@ -187,11 +281,7 @@ class AIClient:
     ) -> AIResponse:
         """统一的文本生成接口"""
         
-        # 构建消息
-        messages = []
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        messages.append({"role": "user", "content": prompt})
+        messages = self._build_messages(prompt, system_prompt)
         
         # 根据模型选择对应的API
         if model.startswith("gpt"):
@@ -201,6 +291,81 @@ class AIClient:
         else:
             raise AIClientError(f"Unsupported model: {model}")
     
+    async def stream_completion(
+        self,
+        prompt: str,
+        model: str = "gpt-3.5-turbo",
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """流式文本生成，逐段产出生成内容
+        
+        调用方停止迭代时底层连接随之关闭，不再继续消耗token。
+        """
+        messages = self._build_messages(prompt, system_prompt)
+        info = self._model_info.get(model)
+        if info is None:
+            raise AIClientError(f"Unsupported model: {model}")
+        
+        if info["provider"] == "openai":
+            if not self.openai_client:
+                raise AIClientError("OpenAI API key not configured")
+            try:
+                stream = await self.openai_client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens or info["max_tokens"] // 2,
+                    stream=True
+                )
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            except Exception as e:
+                raise AIClientError(f"OpenAI API call failed: {str(e)}")
+        else:
+            if not self.anthropic_client:
+                raise AIClientError("Anthropic API key not configured")
+            system_message, user_messages = self._split_system_message(messages)
+            try:
+                stream = await self.anthropic_client.messages.create(
+                    model=model,
+                    max_tokens=max_tokens or 1000,
+                    temperature=temperature,
+                    system=system_message if system_message else None,
+                    messages=user_messages,
+                    stream=True
+                )
+                async for event in stream:
+                    if event.type == "content_block_delta":
+                        yield event.delta.text
+            except Exception as e:
+                raise AIClientError(f"Anthropic API call failed: {str(e)}")
+    
+    @staticmethod
+    def _build_messages(prompt: str, system_prompt: Optional[str]) -> List[Dict[str, str]]:
+        """构建消息列表"""
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+    
+    @staticmethod
+    def _split_system_message(messages: List[Dict[str, str]]) -> Tuple[str, List[Dict[str, str]]]:
+        """拆分系统消息（Anthropic格式中system单独传递）"""
+        system_message = ""
+        user_messages = []
+        
+        for msg in messages:
+            if msg["role"] == "system":
+                system_message = msg["content"]
+            else:
+                user_messages.append(msg)
+        
+        return system_message, user_messages
+    
     async def batch_generate(
         self,
         prompts: List[str],
@@ -209,22 +374,55 @@ class AIClient:
         temperature: float = 0.7,
         max_concurrent: int = 5
     ) -> List[AIResponse]:
-        """批量生成（并发控制）"""
+        """批量生成（并发控制），结果顺序与输入一致"""
+        results: List[Optional[AIResponse]] = [None] * len(prompts)
+        async for index, response in self.batch_generate_stream(
+            prompts, model, system_prompt, temperature, max_concurrent
+        ):
+            results[index] = response
+        return results
+    
+    async def batch_generate_stream(
+        self,
+        prompts: List[str],
+        model: str = "gpt-3.5-turbo",
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        max_concurrent: int = 5
+    ) -> AsyncIterator[Tuple[int, AIResponse]]:
+        """批量生成，按完成顺序逐个产出 (输入索引, 响应)
         
-        semaphore = asyncio.Semaphore(max_concurrent)
+        固定数量的worker从共享迭代器中取任务，不会一次性创建全部协程。
+        """
+        pending = iter(enumerate(prompts))
+        results: asyncio.Queue = asyncio.Queue()
         
-        async def generate_single(prompt: str) -> AIResponse:
-            async with semaphore:
-                return await self.generate_completion(
-                    prompt, model, system_prompt, temperature
-                )
+        async def worker():
+            for index, prompt in pending:
+                try:
+                    response = await self.generate_completion(
+                        prompt, model, system_prompt, temperature
+                    )
+                except Exception as e:
+                    response = e
+                await results.put((index, response))
         
-        tasks = [generate_single(prompt) for prompt in prompts]
-        return await asyncio.gather(*tasks)
-
-# 全局AI客户端实例
-ai_client = AIClient()
+        workers = [asyncio.create_task(worker()) for _ in range(min(max_concurrent, len(prompts)))]
+        try:
+            for _ in range(len(prompts)):
+                index, response = await results.get()
+                if isinstance(response, Exception):
+                    raise response
+                yield index, response
+        finally:
+            for task in workers:
+                task.cancel()
 
+@lru_cache(maxsize=1)
 def get_ai_client() -> AIClient:
-    """获取AI客户端实例"""
-    return ai_client
+    """获取AI客户端实例
+    
+    首次调用时才创建（在工作进程的事件循环内），避免导入时创建的
+    HTTP连接池被绑定到其他进程或事件循环。
+    """
+    return AIClient()
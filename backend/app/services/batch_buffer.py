@@ -0,0 +1,108 @@
+"""
+内存缓冲 + 后台批量写入
+
+写入路径只把记录追加到有界缓冲区（O(1)，写满时淘汰最旧的记录并计入丢弃数），
+后台任务按批（最多 batch_size 条或每 flush_interval 秒）在线程中调用 writer 写入。
+后台任务由应用 lifespan 通过 start_batch_buffers / stop_batch_buffers 启停，
+避免任务绑定在创建时恰好所在的事件循环上。
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 所有已创建的缓冲区，由 lifespan 统一启停
+_buffers: List["BatchBuffer"] = []
+
+
+class BatchBuffer:
+    """有界缓冲区及其批量写入任务"""
+
+    def __init__(
+        self,
+        name: str,
+        maxlen: int,
+        flush_interval: float,
+        writer: Callable[[List[Any]], None],
+        batch_size: int = 1000
+    ):
+        self.name = name
+        self.maxlen = maxlen
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # writer 为同步函数，在线程中执行，自行管理会话与异常
+        self.writer = writer
+        self._queue: Deque[Any] = deque(maxlen=maxlen)
+        self._dropped = 0
+        self._task: Optional[asyncio.Task] = None
+        _buffers.append(self)
+
+    def append(self, item: Any):
+        """追加一条记录"""
+        if len(self._queue) == self.maxlen:
+            self._dropped += 1
+        self._queue.append(item)
+
+    def stats(self) -> dict:
+        """获取缓冲区使用情况"""
+        return {
+            "size": len(self._queue),
+            "capacity": self.maxlen,
+            "usage": len(self._queue) / self.maxlen,
+            "dropped": self._dropped
+        }
+
+    def start(self):
+        """在当前事件循环上启动后台写入任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._drain(), name=f"{self.name}-drain")
+
+    async def stop(self):
+        """停止后台写入任务并写入剩余记录"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    async def flush(self):
+        """立即写入缓冲区中的全部记录"""
+        while self._queue:
+            await asyncio.to_thread(self.writer, self._take_batch())
+
+    async def _drain(self):
+        """后台批量写入缓冲区中的记录"""
+        while True:
+            batch = self._take_batch()
+            if batch:
+                try:
+                    await asyncio.to_thread(self.writer, batch)
+                except Exception as e:
+                    logger.error(f"{self.name} 批量写入失败（{len(batch)}条）: {e}")
+            if len(self._queue) < self.batch_size:
+                await asyncio.sleep(self.flush_interval)
+
+    def _take_batch(self) -> List[Any]:
+        """从缓冲区取出一批记录"""
+        return [self._queue.popleft() for _ in range(min(len(self._queue), self.batch_size))]
+
+
+def start_batch_buffers():
+    """启动所有缓冲区的后台写入任务（应用启动时调用）"""
+    for buffer in _buffers:
+        buffer.start()
+
+
+async def stop_batch_buffers():
+    """停止所有后台写入任务并写入剩余记录（应用关闭时调用）"""
+    for buffer in _buffers:
+        try:
+            await buffer.stop()
+        except Exception as e:
+            logger.error(f"{buffer.name} 关闭时写入失败: {e}")
@@ -3,11 +3,17 @@
 """
 
 import asyncio
+import heapq
 import json
 import logging
-from typing import Any, Dict, List, Optional, Union, Callable
-from datetime import datetime, timedelta
-from enum import Enum
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union, Callable
+from enum import Enum, IntEnum
+from operator import itemgetter
+
+import numpy as np
 
 from app.core.cache import cache_manager, CacheManager
 from app.core.config import get_settings
@@ -16,11 +22,31 @@ logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
-class CacheLevel(Enum):
-    """缓存级别"""
-    L1_MEMORY = "l1_memory"      # 内存缓存（最快）
-    L2_REDIS = "l2_redis"        # Redis缓存（快）
-    L3_DATABASE = "l3_database"  # 数据库缓存（慢）
+# L1过期条目的后台清理间隔（秒）
+L1_CLEANUP_INTERVAL = 60
+# 写回队列容量
+WRITEBACK_QUEUE_SIZE = 10000
+# 每个键保留的最近访问记录数
+ACCESS_HISTORY_SIZE = 100
+# 命中统计数组的初始容量（按需翻倍）
+STATS_INITIAL_CAPACITY = 1024
+# 分析报告中列出的访问最多的键数量
+TOP_KEYS_LIMIT = 10
+# L2命中回填到L1所需的最少访问次数
+L1_ADMISSION_MIN_ACCESSES = 2
+# 访问模式表最多跟踪的键数量
+MAX_TRACKED_KEYS = 10000
+# 访问模式快照写入Redis的间隔（秒）及其过期时间
+PATTERN_SNAPSHOT_INTERVAL = 60
+PATTERN_SNAPSHOT_TTL = 3600
+PATTERN_SNAPSHOT_KEY = "cache:access_patterns:snapshot"
+
+
+class CacheLevel(IntEnum):
+    """缓存级别（取值即层级下标，可直接索引按层级排列的元组）"""
+    L1_MEMORY = 0    # 内存缓存（最快）
+    L2_REDIS = 1     # Redis缓存（快）
+    L3_DATABASE = 2  # 数据库缓存（慢）
 
 
 class CacheStrategy(Enum):
@@ -32,33 +58,66 @@ class CacheStrategy(Enum):
     CACHE_ASIDE = "cache_aside"        # 缓存旁路
 
 
+@dataclass
+class L1Entry:
+    """L1缓存条目（过期时间为单调时钟秒数）"""
+    __slots__ = ('value', 'expires_at')
+    value: Any
+    expires_at: float
+
+
+@dataclass
+class AccessPattern:
+    """单个键的访问模式"""
+    __slots__ = ('count', 'last_access', 'access_times')
+    count: int
+    last_access: Optional[float]
+    access_times: deque  # 最近的访问时间（单调时钟秒数），长度上限 ACCESS_HISTORY_SIZE
+
+
 class MultiLevelCache:
     """多层缓存管理器"""
     
     def __init__(self):
         self.cache_manager = cache_manager
-        self.l1_cache: Dict[str, Dict] = {}  # 内存缓存
+        # 内存缓存（按访问顺序排列，队首最久未使用）
+        # 直接以字符串为键：str 的哈希值计算一次后缓存在对象上，预先换算成64位整数键
+        # 仍需对每个新构造的键做一次完整哈希，且要额外校验碰撞，并不会更快
+        self.l1_cache: "OrderedDict[str, L1Entry]" = OrderedDict()
         self.max_l1_size = 1000
-        self.default_ttl = {
-            CacheLevel.L1_MEMORY: 300,    # 5分钟
-            CacheLevel.L2_REDIS: 1800,    # 30分钟
-            CacheLevel.L3_DATABASE: 3600  # 1小时
-        }
-        
-    async def get(self, key: str, levels: List[CacheLevel] = None) -> Any:
-        """多层缓存获取"""
+        self._cleanup_task: Optional[asyncio.Task] = None
+        self._writeback_q: Optional[asyncio.Queue] = None
+        self._writeback_task: Optional[asyncio.Task] = None
+        # 按 CacheLevel 下标排列：L1 5分钟，L2 30分钟，L3 1小时
+        self.default_ttl = (300, 1800, 3600)
+        
+    async def get(self, key: str, levels: List[CacheLevel] = None,
+                  admit_l1: bool = True) -> Any:
+        """多层缓存获取
+
+        admit_l1 为 False 时，低层命中不回填到L1，避免只访问一次的键挤占内存缓存
+        """
         if levels is None:
             levels = [CacheLevel.L1_MEMORY, CacheLevel.L2_REDIS]
         
-        for level in levels:
+        # L1快速路径：命中时直接返回，不进入逐层循环
+        start = 0
+        if levels and levels[0] == CacheLevel.L1_MEMORY:
+            value = self._get_l1_cache(key)
+            if value is not None:
+                return value
+            start = 1
+        
+        for found_index in range(start, len(levels)):
+            level = levels[found_index]
             try:
                 value = await self._get_from_level(key, level)
                 if value is not None:
                     # 回填到更高层缓存
-                    await self._backfill_cache(key, value, level, levels)
+                    await self._backfill_cache(key, value, found_index, levels, admit_l1)
                     return value
             except Exception as e:
-                logger.error(f"Failed to get from {level.value}: {e}")
+                logger.error(f"Failed to get from {level.name}: {e}")
                 continue
         
         return None
@@ -70,10 +129,10 @@ class MultiLevelCache:
             levels = [CacheLevel.L1_MEMORY, CacheLevel.L2_REDIS]
         
         if strategy == CacheStrategy.WRITE_THROUGH:
-            # 写穿透：同时写入所有层
-            for level in levels:
-                level_ttl = ttl or self.default_ttl[level]
-                await self._set_to_level(key, value, level_ttl, level)
+            # 写穿透：同时写入所有层（L2一次往返）
+            await self._set_many([
+                (key, value, ttl or self.default_ttl[level], level) for level in levels
+            ])
                 
         elif strategy == CacheStrategy.WRITE_BACK:
             # 写回：只写入最高层，延迟写入其他层
@@ -82,9 +141,9 @@ class MultiLevelCache:
                 level_ttl = ttl or self.default_ttl[highest_level]
                 await self._set_to_level(key, value, level_ttl, highest_level)
                 
-                # 异步写入其他层
+                # 交给后台写回任务异步写入其他层
                 if len(levels) > 1:
-                    asyncio.create_task(self._delayed_write(key, value, ttl, levels[1:]))
+                    self._enqueue_writeback(key, value, ttl, levels[1:])
                     
         elif strategy == CacheStrategy.WRITE_AROUND:
             # 写绕过：跳过缓存，直接写入数据源
@@ -107,62 +166,103 @@ class MultiLevelCache:
         elif level == CacheLevel.L2_REDIS:
             await self.cache_manager.set(key, value, ttl)
     
+    async def _set_many(self, entries: List[Tuple[str, Any, int, CacheLevel]]):
+        """批量写入多层缓存：L1直接写内存，L2合并为一次管道写入
+        
+        entries: (键, 值, TTL, 层级)
+        """
+        l2_items = []
+        for key, value, ttl, level in entries:
+            if level == CacheLevel.L1_MEMORY:
+                self._set_l1_cache(key, value, ttl)
+            elif level == CacheLevel.L2_REDIS:
+                l2_items.append((key, value, ttl))
+        
+        if l2_items:
+            await self.cache_manager.set_many(l2_items)
+    
     def _get_l1_cache(self, key: str) -> Any:
         """获取L1内存缓存"""
-        if key in self.l1_cache:
-            cache_item = self.l1_cache[key]
-            if cache_item['expires_at'] > datetime.utcnow():
-                return cache_item['value']
+        cache_item = self.l1_cache.get(key)
+        if cache_item is not None:
+            if cache_item.expires_at > time.monotonic():
+                self.l1_cache.move_to_end(key)
+                return cache_item.value
             else:
                 del self.l1_cache[key]
         return None
     
     def _set_l1_cache(self, key: str, value: Any, ttl: int):
         """设置L1内存缓存"""
-        # 清理过期缓存
-        self._cleanup_l1_cache()
-        
-        # 限制缓存大小
-        if len(self.l1_cache) >= self.max_l1_size:
-            oldest_key = min(self.l1_cache.keys(), 
-                           key=lambda k: self.l1_cache[k]['created_at'])
-            del self.l1_cache[oldest_key]
-        
-        self.l1_cache[key] = {
-            'value': value,
-            'created_at': datetime.utcnow(),
-            'expires_at': datetime.utcnow() + timedelta(seconds=ttl)
-        }
+        # 过期条目在读取时惰性删除，其余由后台任务定期清理
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.create_task(self._l1_cleanup_loop())
+        
+        # 先写入并移到队尾，再淘汰超出容量的最久未使用条目；
+        # 每一步都是单个字典操作，覆盖已有键时不会误淘汰其他条目
+        # 过期时间使用单调时钟浮点数，比较时无需构造datetime
+        self.l1_cache[key] = L1Entry(value, time.monotonic() + ttl)
+        self.l1_cache.move_to_end(key)
+        while len(self.l1_cache) > self.max_l1_size:
+            self.l1_cache.popitem(last=False)
+    
+    async def _l1_cleanup_loop(self):
+        """定期清理过期的L1缓存"""
+        while True:
+            await asyncio.sleep(L1_CLEANUP_INTERVAL)
+            self._cleanup_l1_cache()
     
     def _cleanup_l1_cache(self):
         """清理过期的L1缓存"""
-        now = datetime.utcnow()
+        now = time.monotonic()
         expired_keys = [
             key for key, item in self.l1_cache.items()
-            if item['expires_at'] <= now
+            if item.expires_at <= now
         ]
         for key in expired_keys:
             del self.l1_cache[key]
     
-    async def _backfill_cache(self, key: str, value: Any, found_level: CacheLevel, 
-                            all_levels: List[CacheLevel]):
-        """回填缓存到更高层"""
-        found_index = all_levels.index(found_level)
-        
+    async def _backfill_cache(self, key: str, value: Any, found_index: int,
+                            all_levels: List[CacheLevel], admit_l1: bool = True):
+        """回填缓存到更高层（found_index 为命中层级在 all_levels 中的下标）"""
         # 回填到更高层缓存
-        for i in range(found_index):
-            level = all_levels[i]
-            ttl = self.default_ttl[level]
-            await self._set_to_level(key, value, ttl, level)
+        await self._set_many([
+            (key, value, self.default_ttl[level], level) for level in all_levels[:found_index]
+            if admit_l1 or level != CacheLevel.L1_MEMORY
+        ])
     
-    async def _delayed_write(self, key: str, value: Any, ttl: Optional[int], 
+    def _enqueue_writeback(self, key: str, value: Any, ttl: Optional[int],
                            levels: List[CacheLevel]):
-        """延迟写入其他层缓存"""
-        await asyncio.sleep(0.1)  # 短暂延迟
-        
-        for level in levels:
-            level_ttl = ttl or self.default_ttl[level]
-            await self._set_to_level(key, value, level_ttl, level)
+        """放入写回队列，由单个后台任务批量写入"""
+        if self._writeback_task is None:
+            self._writeback_q = asyncio.Queue(maxsize=WRITEBACK_QUEUE_SIZE)
+            self._writeback_task = asyncio.create_task(self._writeback_worker())
+        
+        try:
+            self._writeback_q.put_nowait((key, value, ttl, levels))
+        except asyncio.QueueFull:
+            logger.warning(f"Write-back queue full, dropping write for {key}")
+    
+    async def _writeback_worker(self):
+        """后台写回：每轮取空队列，同一键只写最新值"""
+        while True:
+            key, value, ttl, levels = await self._writeback_q.get()
+            pending = {key: (value, ttl, levels)}
+            try:
+                while True:
+                    key, value, ttl, levels = self._writeback_q.get_nowait()
+                    pending[key] = (value, ttl, levels)
+            except asyncio.QueueEmpty:
+                pass
+            
+            try:
+                await self._set_many([
+                    (key, value, ttl or self.default_ttl[level], level)
+                    for key, (value, ttl, levels) in pending.items()
+                    for level in levels
+                ])
+            except Exception as e:
+                logger.error(f"Write-back failed for {len(pending)} keys: {e}")
     
     async def invalidate(self, key: str, levels: List[CacheLevel] = None):
         """失效缓存"""
@@ -177,7 +277,7 @@ class MultiLevelCache:
                 elif level == CacheLevel.L2_REDIS:
                     await self.cache_manager.delete(key)
             except Exception as e:
-                logger.error(f"Failed to invalidate {level.value}: {e}")
+                logger.error(f"Failed to invalidate {level.name}: {e}")
 
 
 class SmartCacheManager:
@@ -185,18 +285,28 @@ class SmartCacheManager:
     
     def __init__(self):
         self.multi_cache = MultiLevelCache()
-        self.access_patterns: Dict[str, Dict] = {}
-        self.cache_stats: Dict[str, Dict] = {}
+        # 访问模式表（按最近访问排序，超过上限时淘汰最久未访问的键）
+        self.access_patterns: "OrderedDict[str, AccessPattern]" = OrderedDict()
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # 命中统计采用结构数组布局：键 -> 下标，各项计数存放在连续的numpy数组中；
+        # 只统计 access_patterns 中仍在跟踪的键，键被淘汰后其下标进入空闲列表复用
+        self._stat_idx: Dict[str, int] = {}
+        self._stat_free: List[int] = []
+        self._stat_hits = np.zeros(STATS_INITIAL_CAPACITY, dtype=np.int64)
+        self._stat_misses = np.zeros(STATS_INITIAL_CAPACITY, dtype=np.int64)
+        self._stat_rt_sum_ms = np.zeros(STATS_INITIAL_CAPACITY, dtype=np.float64)
     
     async def get_with_analytics(self, key: str, data_loader: Callable = None) -> Any:
         """带分析的缓存获取"""
-        start_time = datetime.utcnow()
+        start_time = time.perf_counter()
         
         # 记录访问模式
         self._record_access(key)
         
-        # 尝试从缓存获取
-        value = await self.multi_cache.get(key)
+        # 尝试从缓存获取（至少第二次访问的键才提升到L1）
+        admit_l1 = self.access_patterns[key].count >= L1_ADMISSION_MIN_ACCESSES
+        value = await self.multi_cache.get(key, admit_l1=admit_l1)
         
         if value is not None:
             # 缓存命中
@@ -205,14 +315,33 @@ class SmartCacheManager:
         
         # 缓存未命中，从数据源加载
         if data_loader:
-            value = await data_loader()
-            if value is not None:
-                # 根据访问模式选择缓存策略
-                strategy = self._choose_cache_strategy(key)
-                levels = self._choose_cache_levels(key)
-                ttl = self._calculate_ttl(key)
-                
-                await self.multi_cache.set(key, value, ttl, levels, strategy)
+            # 同一键已有加载在进行中，等待其结果而不重复加载
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                value = await asyncio.shield(inflight)
+                self._record_cache_miss(key, start_time)
+                return value
+            
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            try:
+                value = await data_loader()
+                if value is not None:
+                    # 根据访问模式选择缓存策略
+                    strategy = self._choose_cache_strategy(key)
+                    levels = self._choose_cache_levels(key)
+                    ttl = self._calculate_ttl(key)
+                    
+                    await self.multi_cache.set(key, value, ttl, levels, strategy)
+                future.set_result(value)
+            except Exception as e:
+                future.set_exception(e)
+                future.exception()  # 标记异常已读取，无等待者时不再告警
+                raise
+            finally:
+                self._inflight.pop(key, None)
+                if not future.done():
+                    future.cancel()  # 加载被取消时通知等待者
             
             self._record_cache_miss(key, start_time)
             return value
@@ -221,57 +350,85 @@ class SmartCacheManager:
     
     def _record_access(self, key: str):
         """记录访问模式"""
-        if key not in self.access_patterns:
-            self.access_patterns[key] = {
-                'count': 0,
-                'last_access': None,
-                'access_times': []
-            }
-        
-        now = datetime.utcnow()
-        pattern = self.access_patterns[key]
-        pattern['count'] += 1
-        pattern['last_access'] = now
-        pattern['access_times'].append(now)
+        if self._snapshot_task is None:
+            self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+        
+        pattern = self.access_patterns.get(key)
+        if pattern is None:
+            while len(self.access_patterns) >= MAX_TRACKED_KEYS:
+                evicted_key, _ = self.access_patterns.popitem(last=False)
+                self._release_stat_index(evicted_key)
+            pattern = self.access_patterns[key] = AccessPattern(
+                0, None, deque(maxlen=ACCESS_HISTORY_SIZE)
+            )
+        else:
+            self.access_patterns.move_to_end(key)
         
-        # 只保留最近100次访问记录
-        if len(pattern['access_times']) > 100:
-            pattern['access_times'] = pattern['access_times'][-100:]
+        now = time.monotonic()
+        pattern.count += 1
+        pattern.last_access = now
+        pattern.access_times.append(now)
+    
+    async def _snapshot_loop(self):
+        """定期把访问计数快照写入Redis，供其他实例参考"""
+        while True:
+            await asyncio.sleep(PATTERN_SNAPSHOT_INTERVAL)
+            await self._snapshot_patterns_to_redis()
     
-    def _record_cache_hit(self, key: str, start_time: datetime):
+    async def _snapshot_patterns_to_redis(self):
+        """写入访问计数快照（仅保存计数，不含访问时间记录）"""
+        snapshot = {key: pattern.count for key, pattern in self.access_patterns.items()}
+        try:
+            await self.multi_cache.cache_manager.set(PATTERN_SNAPSHOT_KEY, snapshot, PATTERN_SNAPSHOT_TTL)
+        except Exception as e:
+            logger.error(f"Failed to snapshot access patterns: {e}")
+    
+    def _record_cache_hit(self, key: str, start_time: float):
         """记录缓存命中"""
-        if key not in self.cache_stats:
-            self.cache_stats[key] = {'hits': 0, 'misses': 0, 'avg_response_time': 0}
-        
-        self.cache_stats[key]['hits'] += 1
-        response_time = (datetime.utcnow() - start_time).total_seconds() * 1000
-        
-        # 更新平均响应时间
-        stats = self.cache_stats[key]
-        total_requests = stats['hits'] + stats['misses']
-        stats['avg_response_time'] = (
-            (stats['avg_response_time'] * (total_requests - 1) + response_time) / total_requests
-        )
+        if key not in self.access_patterns:
+            return  # 加载期间已被淘汰
+        i = self._stat_index(key)
+        self._stat_hits[i] += 1
+        self._stat_rt_sum_ms[i] += (time.perf_counter() - start_time) * 1000
     
-    def _record_cache_miss(self, key: str, start_time: datetime):
+    def _record_cache_miss(self, key: str, start_time: float):
         """记录缓存未命中"""
-        if key not in self.cache_stats:
-            self.cache_stats[key] = {'hits': 0, 'misses': 0, 'avg_response_time': 0}
-        
-        self.cache_stats[key]['misses'] += 1
-        response_time = (datetime.utcnow() - start_time).total_seconds() * 1000
-        
-        # 更新平均响应时间
-        stats = self.cache_stats[key]
-        total_requests = stats['hits'] + stats['misses']
-        stats['avg_response_time'] = (
-            (stats['avg_response_time'] * (total_requests - 1) + response_time) / total_requests
-        )
+        if key not in self.access_patterns:
+            return  # 加载期间已被淘汰
+        i = self._stat_index(key)
+        self._stat_misses[i] += 1
+        self._stat_rt_sum_ms[i] += (time.perf_counter() - start_time) * 1000
+    
+    def _stat_index(self, key: str) -> int:
+        """获取键在统计数组中的下标，新键优先复用空闲下标，否则追加到末尾（容量不足时翻倍）"""
+        i = self._stat_idx.get(key)
+        if i is None:
+            if self._stat_free:
+                i = self._stat_free.pop()
+                self._stat_idx[key] = i
+                return i
+            i = len(self._stat_idx)
+            if i == len(self._stat_hits):
+                capacity = 2 * i
+                self._stat_hits = np.concatenate([self._stat_hits, np.zeros(capacity - i, dtype=np.int64)])
+                self._stat_misses = np.concatenate([self._stat_misses, np.zeros(capacity - i, dtype=np.int64)])
+                self._stat_rt_sum_ms = np.concatenate([self._stat_rt_sum_ms, np.zeros(capacity - i, dtype=np.float64)])
+            self._stat_idx[key] = i
+        return i
+    
+    def _release_stat_index(self, key: str):
+        """键不再跟踪时清零其统计并回收下标"""
+        i = self._stat_idx.pop(key, None)
+        if i is not None:
+            self._stat_hits[i] = 0
+            self._stat_misses[i] = 0
+            self._stat_rt_sum_ms[i] = 0.0
+            self._stat_free.append(i)
     
     def _choose_cache_strategy(self, key: str) -> CacheStrategy:
         """选择缓存策略"""
-        pattern = self.access_patterns.get(key, {})
-        access_count = pattern.get('count', 0)
+        pattern = self.access_patterns.get(key)
+        access_count = pattern.count if pattern is not None else 0
         
         # 根据访问频率选择策略
         if access_count > 100:
@@ -283,8 +440,8 @@ class SmartCacheManager:
     
     def _choose_cache_levels(self, key: str) -> List[CacheLevel]:
         """选择缓存层级"""
-        pattern = self.access_patterns.get(key, {})
-        access_count = pattern.get('count', 0)
+        pattern = self.access_patterns.get(key)
+        access_count = pattern.count if pattern is not None else 0
         
         # 根据访问频率选择缓存层级
         if access_count > 50:
@@ -296,20 +453,16 @@ class SmartCacheManager:
     
     def _calculate_ttl(self, key: str) -> int:
         """计算TTL"""
-        pattern = self.access_patterns.get(key, {})
-        access_times = pattern.get('access_times', [])
+        pattern = self.access_patterns.get(key)
+        access_times = pattern.access_times if pattern is not None else ()
         
         if len(access_times) < 2:
             return 1800  # 默认30分钟
         
-        # 计算访问间隔
-        intervals = []
-        for i in range(1, len(access_times)):
-            interval = (access_times[i] - access_times[i-1]).total_seconds()
-            intervals.append(interval)
+        # 相邻间隔之和等于首尾时间差，平均访问间隔无需逐个计算
+        avg_interval = (access_times[-1] - access_times[0]) / (len(access_times) - 1)
         
         # 基于平均访问间隔计算TTL
-        avg_interval = sum(intervals) / len(intervals)
         
         if avg_interval < 60:      # 1分钟内
             return 300             # 5分钟TTL
@@ -321,9 +474,29 @@ class SmartCacheManager:
             return 7200            # 2小时TTL
     
     async def get_cache_analytics(self) -> Dict:
-        """获取缓存分析数据"""
+        """获取缓存分析数据
+        
+        在事件循环中只复制一份统计快照，聚合计算放到线程中执行，
+        避免大量键时阻塞事件循环，也不受并发记录的影响
+        """
+        keys = list(self._stat_idx)
+        # 下标可能因复用而不连续，按键顺序取出（花式索引即复制）
+        idx = np.fromiter(self._stat_idx.values(), dtype=np.intp, count=len(keys))
+        hits = self._stat_hits[idx]
+        misses = self._stat_misses[idx]
+        rt_sums = self._stat_rt_sum_ms[idx]
+        access_counts = [(key, pattern.count) for key, pattern in self.access_patterns.items()]
+        
+        return await asyncio.to_thread(
+            self._compute_analytics, keys, hits, misses, rt_sums, access_counts
+        )
+    
+    @staticmethod
+    def _compute_analytics(keys: List[str], hits: np.ndarray, misses: np.ndarray,
+                           rt_sums: np.ndarray, access_counts: List[Tuple[str, int]]) -> Dict:
+        """根据统计快照计算缓存分析数据"""
         analytics = {
-            "total_keys": len(self.cache_stats),
+            "total_keys": len(keys),
             "hit_rate": 0,
             "miss_rate": 0,
             "avg_response_time": 0,
@@ -331,43 +504,39 @@ class SmartCacheManager:
             "cache_efficiency": {}
         }
         
-        if not self.cache_stats:
+        if not keys:
             return analytics
         
-        total_hits = sum(stats['hits'] for stats in self.cache_stats.values())
-        total_misses = sum(stats['misses'] for stats in self.cache_stats.values())
+        requests = hits + misses
+        total_hits = int(hits.sum())
+        total_misses = int(misses.sum())
         total_requests = total_hits + total_misses
         
         if total_requests > 0:
             analytics["hit_rate"] = (total_hits / total_requests) * 100
             analytics["miss_rate"] = (total_misses / total_requests) * 100
         
-        # 计算平均响应时间
-        response_times = [stats['avg_response_time'] for stats in self.cache_stats.values()]
-        if response_times:
-            analytics["avg_response_time"] = sum(response_times) / len(response_times)
+        # 计算平均响应时间（各键平均值的均值；登记过的键至少有一次请求）
+        avg_rt = rt_sums / requests
+        analytics["avg_response_time"] = float(avg_rt.mean())
         
         # 获取访问最多的键
-        sorted_keys = sorted(
-            self.access_patterns.items(),
-            key=lambda x: x[1]['count'],
-            reverse=True
-        )
+        top_keys = heapq.nlargest(TOP_KEYS_LIMIT, access_counts, key=itemgetter(1))
         analytics["top_accessed_keys"] = [
-            {"key": key, "count": pattern['count']}
-            for key, pattern in sorted_keys[:10]
+            {"key": key, "count": count}
+            for key, count in top_keys
         ]
         
         # 缓存效率分析
-        for key, stats in self.cache_stats.items():
-            total_key_requests = stats['hits'] + stats['misses']
-            if total_key_requests > 0:
-                hit_rate = (stats['hits'] / total_key_requests) * 100
-                analytics["cache_efficiency"][key] = {
-                    "hit_rate": hit_rate,
-                    "total_requests": total_key_requests,
-                    "avg_response_time": stats['avg_response_time']
-                }
+        hit_rates = (hits / requests * 100).tolist()
+        request_counts = requests.tolist()
+        avg_rts = avg_rt.tolist()
+        for i, key in enumerate(keys):
+            analytics["cache_efficiency"][key] = {
+                "hit_rate": hit_rates[i],
+                "total_requests": request_counts[i],
+                "avg_response_time": avg_rts[i]
+            }
         
         return analytics
 
@@ -0,0 +1,65 @@
+"""
+系统指标批量写入
+
+记录指标时只把一行数据放入内存缓冲区，后台任务按批（最多 METRICS_BATCH_SIZE 条
+或每 METRICS_FLUSH_INTERVAL 秒）用 Core 多行 INSERT 写入 system_metrics，
+避免每条指标一个事务。
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from sqlalchemy import insert
+
+from config.database import SessionLocal
+from app.models.monitoring import SystemMetrics
+from app.services.batch_buffer import BatchBuffer
+
+logger = logging.getLogger(__name__)
+
+METRICS_QUEUE_SIZE = 50000
+METRICS_BATCH_SIZE = 1000
+METRICS_FLUSH_INTERVAL = 5.0
+
+
+def _write_batch(batch: List[dict]):
+    """单个事务写入一批指标"""
+    db = SessionLocal()
+    try:
+        db.execute(insert(SystemMetrics), batch)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"写入系统指标失败（{len(batch)}条）: {e}")
+    finally:
+        db.close()
+
+
+metrics_buffer = BatchBuffer(
+    "system_metrics", METRICS_QUEUE_SIZE, METRICS_FLUSH_INTERVAL, _write_batch, METRICS_BATCH_SIZE
+)
+
+
+def record_system_metric(
+    metric_name: str,
+    metric_value: float,
+    metric_unit: str,
+    metric_type: str,
+    tags: Dict[str, str] = None
+):
+    """记录一条系统指标（仅入队，由后台任务批量写入）"""
+    # 时间戳在入队时确定，不依赖写入时的数据库默认值
+    metrics_buffer.append({
+        "metric_name": metric_name,
+        "metric_value": metric_value,
+        "metric_unit": metric_unit,
+        "metric_type": metric_type,
+        "tags": tags or {},
+        "timestamp": datetime.now(timezone.utc)
+    })
+
+
+def get_metrics_queue_stats() -> dict:
+    """获取指标缓冲区状态"""
+    return metrics_buffer.stats()
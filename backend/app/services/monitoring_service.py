@@ -3,19 +3,208 @@
 """
 
 import asyncio
+import hashlib
+import logging
+import operator
 import psutil
+import sys
 import time
+from collections import OrderedDict
+from functools import lru_cache
 from typing import List, Dict, Optional, Any, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func, desc, asc
-from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, func, desc, asc, insert, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta, timezone
 import json
 
 from app.models.monitoring import (
-    SystemMetrics, APIMetrics, AIModelMetrics,
-    UserActivityMetrics, AlertRule, Alert
+    SystemMetrics, APIMetrics, APIMetricsMinute, AIModelMetrics,
+    UserActivityMetrics, AlertRule, Alert, UserAgent,
+    usd_to_micro_usd, micro_usd_to_usd
 )
 from app.models.user import User
+from app.services.batch_buffer import BatchBuffer
+from app.services.metrics_buffer import record_system_metric
+from config.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# User-Agent哈希 -> 去重表ID 的进程内LRU缓存
+USER_AGENT_CACHE_SIZE = 10000
+_user_agent_cache: "OrderedDict[bytes, int]" = OrderedDict()
+
+# API分钟汇总：请求样本先进入内存缓冲区，每个刷新周期聚合成分钟计数后一次性upsert
+API_ROLLUP_QUEUE_SIZE = 100000
+API_ROLLUP_BATCH_SIZE = 100000
+API_ROLLUP_FLUSH_INTERVAL = 10.0
+
+# 正在告警（status='firing'）的规则ID进程内缓存，定期从数据库重新加载，
+# 以纠正其他工作进程造成的状态变化
+FIRING_RULES_CACHE_TTL = 300
+_firing_rule_ids: Optional[set] = None
+_firing_rule_ids_loaded_at = 0.0
+
+# 告警规则条件 -> 比较函数
+ALERT_CONDITION_OPS = {
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+# 指标摘要支持的时间范围（未知值按1小时处理）
+SUMMARY_TIME_RANGES: Dict[str, timedelta] = {
+    "1h": timedelta(hours=1),
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7),
+    "30d": timedelta(days=30),
+}
+# 时间序列支持的时间范围（未知值按1小时处理）
+TIME_SERIES_RANGES: Dict[str, timedelta] = {
+    "1h": timedelta(hours=1),
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7),
+}
+# 时间序列聚合间隔（秒，未知值按5分钟处理）
+TIME_SERIES_INTERVALS: Dict[str, int] = {
+    "1m": 60,
+    "5m": 300,
+    "1h": 3600,
+}
+
+# 指标摘要查询：三组聚合各为一行的子查询交叉连接。仪表盘频繁轮询，
+# 预先写成固定SQL，省去每次构建和编译表达式树
+METRICS_SUMMARY_SQL = text("""
+    SELECT api.total_requests, api.response_time_sum, api.error_count,
+           ai.total_calls, ai.total_tokens, ai.total_cost, ai.ai_avg_response_time,
+           ua.total_activities, ua.active_users
+    FROM (
+        SELECT COALESCE(SUM(request_count), 0) AS total_requests,
+               COALESCE(SUM(response_time_sum), 0) AS response_time_sum,
+               COALESCE(SUM(error_count), 0) AS error_count
+        FROM api_metrics_minute
+        WHERE minute_ts >= :start_time
+    ) AS api,
+    (
+        SELECT COUNT(id) AS total_calls,
+               COALESCE(SUM(total_tokens), 0) AS total_tokens,
+               COALESCE(SUM(cost), 0) AS total_cost,
+               COALESCE(AVG(response_time), 0) AS ai_avg_response_time
+        FROM ai_model_metrics
+        WHERE "timestamp" >= :start_time
+    ) AS ai,
+    (
+        SELECT COUNT(id) AS total_activities,
+               COUNT(DISTINCT user_id) AS active_users
+        FROM user_activity_metrics
+        WHERE "timestamp" >= :start_time
+    ) AS ua
+""")
+
+# 预热CPU采样：之后以 interval=None 调用即返回距上次调用的使用率，无需阻塞等待
+psutil.cpu_percent(interval=None)
+
+
+def _sample_system() -> Tuple[float, Any, Any, Any, int]:
+    """一次性采集CPU、内存、磁盘、网络与进程数（同步，在线程中执行）"""
+    return (
+        psutil.cpu_percent(interval=None),
+        psutil.virtual_memory(),
+        psutil.disk_usage('/'),
+        psutil.net_io_counters(),
+        len(psutil.pids())
+    )
+
+
+@lru_cache(maxsize=4096)
+def _api_metric_names(endpoint: str) -> Tuple[str, str, str]:
+    """API聚合指标名（响应时间、请求数、错误数），每个端点只构造一次"""
+    return (
+        sys.intern(f"api.{endpoint}.response_time"),
+        sys.intern(f"api.{endpoint}.requests"),
+        sys.intern(f"api.{endpoint}.errors")
+    )
+
+
+@lru_cache(maxsize=1024)
+def _ai_metric_names(provider: str, model_name: str) -> Tuple[str, str, str, str]:
+    """AI模型聚合指标名（token、成本、响应时间、错误数）"""
+    prefix = f"ai.{provider}.{model_name}"
+    return (
+        sys.intern(f"{prefix}.tokens"),
+        sys.intern(f"{prefix}.cost"),
+        sys.intern(f"{prefix}.response_time"),
+        sys.intern(f"{prefix}.errors")
+    )
+
+
+@lru_cache(maxsize=256)
+def _activity_metric_name(activity_type: str) -> str:
+    """用户活动聚合指标名"""
+    return sys.intern(f"user.activity.{activity_type}")
+
+
+def _time_bucket(column, interval_seconds: int):
+    """按秒数间隔对齐到 epoch 的时间桶表达式（PostgreSQL 13 没有 date_bin）"""
+    return func.to_timestamp(
+        func.floor(func.extract('epoch', column) / interval_seconds) * interval_seconds
+    ).label('time_bucket')
+
+
+def _upsert_api_rollup(db: Session, samples):
+    """把API请求样本 (端点, 时间戳秒, 响应时间秒, 状态码) 按分钟聚合后累加到分钟汇总表（不提交事务）"""
+    buckets: Dict[Tuple[str, datetime], List] = {}
+    for endpoint, ts, response_time, status_code in samples:
+        minute_ts = datetime.fromtimestamp(ts - ts % 60, timezone.utc)
+        acc = buckets.setdefault((endpoint, minute_ts), [0, 0.0, 0])
+        acc[0] += 1
+        acc[1] += response_time
+        acc[2] += status_code >= 400
+    if not buckets:
+        return
+
+    # 按主键排序写入，避免并发写入相同行时互相死锁
+    stmt = pg_insert(APIMetricsMinute).values([
+        {
+            "endpoint": endpoint,
+            "minute_ts": minute_ts,
+            "request_count": count,
+            "response_time_sum": response_time_sum,
+            "error_count": error_count
+        }
+        for (endpoint, minute_ts), (count, response_time_sum, error_count) in sorted(buckets.items())
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[APIMetricsMinute.endpoint, APIMetricsMinute.minute_ts],
+        set_={
+            "request_count": APIMetricsMinute.request_count + stmt.excluded.request_count,
+            "response_time_sum": APIMetricsMinute.response_time_sum + stmt.excluded.response_time_sum,
+            "error_count": APIMetricsMinute.error_count + stmt.excluded.error_count
+        }
+    ))
+
+
+def _write_api_rollup(samples: List[Tuple[str, float, float, int]]):
+    """单个事务写入一个刷新周期内的API分钟汇总（同步，在线程中执行）"""
+    db = SessionLocal()
+    try:
+        _upsert_api_rollup(db, samples)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"写入API分钟汇总失败（{len(samples)}个样本）: {e}")
+    finally:
+        db.close()
+
+
+api_rollup_buffer = BatchBuffer(
+    "api_metrics_minute", API_ROLLUP_QUEUE_SIZE, API_ROLLUP_FLUSH_INTERVAL,
+    _write_api_rollup, API_ROLLUP_BATCH_SIZE
+)
 
 
 class MonitoringService:
@@ -27,30 +216,28 @@ class MonitoringService:
     async def collect_system_metrics(self) -> Dict[str, Any]:
         """收集系统指标"""
         try:
+            # 系统调用放到线程中一次完成，不阻塞事件循环
+            cpu_percent, memory, disk, network, process_count = await asyncio.to_thread(_sample_system)
+
             # CPU使用率
-            cpu_percent = psutil.cpu_percent(interval=1)
-            await self._record_metric("system.cpu.usage", cpu_percent, "percent", "gauge")
+            record_system_metric("system.cpu.usage", cpu_percent, "percent", "gauge")
 
             # 内存使用情况
-            memory = psutil.virtual_memory()
-            await self._record_metric("system.memory.usage", memory.percent, "percent", "gauge")
-            await self._record_metric("system.memory.available", memory.available / (1024**3), "GB", "gauge")
-            await self._record_metric("system.memory.total", memory.total / (1024**3), "GB", "gauge")
+            record_system_metric("system.memory.usage", memory.percent, "percent", "gauge")
+            record_system_metric("system.memory.available", memory.available / (1024**3), "GB", "gauge")
+            record_system_metric("system.memory.total", memory.total / (1024**3), "GB", "gauge")
 
             # 磁盘使用情况
-            disk = psutil.disk_usage('/')
             disk_percent = (disk.used / disk.total) * 100
-            await self._record_metric("system.disk.usage", disk_percent, "percent", "gauge")
-            await self._record_metric("system.disk.free", disk.free / (1024**3), "GB", "gauge")
+            record_system_metric("system.disk.usage", disk_percent, "percent", "gauge")
+            record_system_metric("system.disk.free", disk.free / (1024**3), "GB", "gauge")
 
             # 网络IO
-            network = psutil.net_io_counters()
-            await self._record_metric("system.network.bytes_sent", network.bytes_sent, "bytes", "counter")
-            await self._record_metric("system.network.bytes_recv", network.bytes_recv, "bytes", "counter")
+            record_system_metric("system.network.bytes_sent", network.bytes_sent, "bytes", "counter")
+            record_system_metric("system.network.bytes_recv", network.bytes_recv, "bytes", "counter")
 
             # 进程数量
-            process_count = len(psutil.pids())
-            await self._record_metric("system.processes.count", process_count, "count", "gauge")
+            record_system_metric("system.processes.count", process_count, "count", "gauge")
 
             return {
                 "cpu_usage": cpu_percent,
@@ -79,7 +266,7 @@ class MonitoringService:
     ):
         """记录API调用指标"""
         try:
-            metric = APIMetrics(
+            self.db.execute(insert(APIMetrics).values(
                 endpoint=endpoint,
                 method=method,
                 status_code=status_code,
@@ -88,23 +275,95 @@ class MonitoringService:
                 response_size=response_size,
                 user_id=user_id,
                 ip_address=ip_address,
-                user_agent=user_agent,
+                user_agent_id=self._get_user_agent_id(user_agent),
                 error_message=error_message
-            )
-
-            self.db.add(metric)
+            ))
             self.db.commit()
+            api_rollup_buffer.append((endpoint, time.time(), response_time, status_code))
 
-            # 记录聚合指标
-            await self._record_metric(f"api.{endpoint}.response_time", response_time, "seconds", "histogram")
-            await self._record_metric(f"api.{endpoint}.requests", 1, "count", "counter")
+            # 记录聚合指标（进入缓冲区批量写入）
+            response_time_name, requests_name, errors_name = _api_metric_names(endpoint)
+            record_system_metric(response_time_name, response_time, "seconds", "histogram")
+            record_system_metric(requests_name, 1, "count", "counter")
 
             if status_code >= 400:
-                await self._record_metric(f"api.{endpoint}.errors", 1, "count", "counter")
+                record_system_metric(errors_name, 1, "count", "counter")
 
         except Exception as e:
+            self.db.rollback()
+            # 回滚可能撤销了本事务中新增的User-Agent记录
+            _user_agent_cache.clear()
             print(f"记录API指标失败: {e}")
 
+    def record_batch(self, batch: List[Dict[str, Any]]):
+        """批量记录中间件采集的API请求指标（单条多行INSERT）
+
+        同步执行：由后台写入任务在线程中调用，每批使用独立的会话。
+        """
+        if not batch:
+            return
+
+        try:
+            rows = [
+                {
+                    "endpoint": request_info["path"],
+                    "method": request_info["method"],
+                    "status_code": request_info["status_code"],
+                    "response_time": request_info["response_time_ms"] / 1000,  # 秒
+                    "user_id": request_info.get("user_id"),
+                    "ip_address": request_info.get("client_ip"),
+                    "user_agent_id": self._get_user_agent_id(request_info.get("user_agent"))
+                }
+                for request_info in batch
+            ]
+
+            self.db.execute(insert(APIMetrics).values(rows))
+            self.db.commit()
+
+            for request_info in batch:
+                api_rollup_buffer.append((
+                    request_info["path"],
+                    request_info["timestamp"],
+                    request_info["response_time_ms"] / 1000,
+                    request_info["status_code"]
+                ))
+
+        except Exception as e:
+            self.db.rollback()
+            # 回滚可能撤销了本事务中新增的User-Agent记录
+            _user_agent_cache.clear()
+            print(f"批量记录API指标失败: {e}")
+
+    def _get_user_agent_id(self, user_agent: Optional[str]) -> Optional[int]:
+        """获取User-Agent去重表ID，进程内LRU缓存命中时不访问数据库"""
+        if not user_agent:
+            return None
+
+        ua_hash = hashlib.blake2b(user_agent.encode("utf-8", "replace"), digest_size=8).digest()
+        user_agent_id = _user_agent_cache.get(ua_hash)
+        if user_agent_id is not None:
+            _user_agent_cache.move_to_end(ua_hash)
+            return user_agent_id
+
+        row = self.db.query(UserAgent.id).filter(UserAgent.ua_hash == ua_hash).first()
+        if row is None:
+            try:
+                with self.db.begin_nested():
+                    user_agent_obj = UserAgent(ua_hash=ua_hash, ua_text=user_agent)
+                    self.db.add(user_agent_obj)
+                user_agent_id = user_agent_obj.id
+            except IntegrityError:
+                # 并发写入同一User-Agent时回退为查询
+                row = self.db.query(UserAgent.id).filter(UserAgent.ua_hash == ua_hash).first()
+                user_agent_id = row.id
+        else:
+            user_agent_id = row.id
+
+        _user_agent_cache[ua_hash] = user_agent_id
+        if len(_user_agent_cache) > USER_AGENT_CACHE_SIZE:
+            _user_agent_cache.popitem(last=False)
+        return user_agent_id
+
     async def record_ai_model_metrics(
         self,
         model_name: str,
@@ -123,33 +382,33 @@ class MonitoringService:
         try:
             total_tokens = input_tokens + output_tokens
 
-            metric = AIModelMetrics(
+            self.db.execute(insert(AIModelMetrics).values(
                 model_name=model_name,
                 provider=provider,
                 operation=operation,
                 input_tokens=input_tokens,
                 output_tokens=output_tokens,
                 total_tokens=total_tokens,
-                cost=cost,
+                cost=usd_to_micro_usd(cost),
                 response_time=response_time,
                 success=success,
                 error_type=error_type,
                 error_message=error_message,
                 user_id=user_id
-            )
-
-            self.db.add(metric)
+            ))
             self.db.commit()
 
-            # 记录聚合指标
-            await self._record_metric(f"ai.{provider}.{model_name}.tokens", total_tokens, "tokens", "counter")
-            await self._record_metric(f"ai.{provider}.{model_name}.cost", cost, "USD", "counter")
-            await self._record_metric(f"ai.{provider}.{model_name}.response_time", response_time, "seconds", "histogram")
+            # 记录聚合指标（进入缓冲区批量写入）
+            tokens_name, cost_name, response_time_name, errors_name = _ai_metric_names(provider, model_name)
+            record_system_metric(tokens_name, total_tokens, "tokens", "counter")
+            record_system_metric(cost_name, cost, "USD", "counter")
+            record_system_metric(response_time_name, response_time, "seconds", "histogram")
 
             if not success:
-                await self._record_metric(f"ai.{provider}.{model_name}.errors", 1, "count", "counter")
+                record_system_metric(errors_name, 1, "count", "counter")
 
         except Exception as e:
+            self.db.rollback()
             print(f"记录AI模型指标失败: {e}")
 
     async def record_user_activity(
@@ -165,24 +424,23 @@ class MonitoringService:
     ):
         """记录用户活动"""
         try:
-            activity = UserActivityMetrics(
+            self.db.execute(insert(UserActivityMetrics).values(
                 user_id=user_id,
                 activity_type=activity_type,
                 activity_detail=activity_detail,
                 resource_type=resource_type,
                 resource_id=resource_id,
-                metadata=metadata or {},
+                extra_metadata=metadata or {},
                 session_id=session_id,
                 ip_address=ip_address
-            )
-
-            self.db.add(activity)
+            ))
             self.db.commit()
 
-            # 记录聚合指标
-            await self._record_metric(f"user.activity.{activity_type}", 1, "count", "counter")
+            # 记录聚合指标（进入缓冲区批量写入）
+            record_system_metric(_activity_metric_name(activity_type), 1, "count", "counter")
 
         except Exception as e:
+            self.db.rollback()
             print(f"记录用户活动失败: {e}")
 
     async def get_metrics_summary(
@@ -194,67 +452,43 @@ class MonitoringService:
         try:
             # 计算时间范围
             end_time = datetime.utcnow()
-            if time_range == "1h":
-                start_time = end_time - timedelta(hours=1)
-            elif time_range == "24h":
-                start_time = end_time - timedelta(hours=24)
-            elif time_range == "7d":
-                start_time = end_time - timedelta(days=7)
-            elif time_range == "30d":
-                start_time = end_time - timedelta(days=30)
-            else:
-                start_time = end_time - timedelta(hours=1)
+            start_time = end_time - SUMMARY_TIME_RANGES.get(time_range, SUMMARY_TIME_RANGES["1h"])
 
             summary = {}
 
-            # API指标摘要
-            api_stats = self.db.query(
-                func.count(APIMetrics.id).label('total_requests'),
-                func.avg(APIMetrics.response_time).label('avg_response_time'),
-                func.count(APIMetrics.id).filter(APIMetrics.status_code >= 400).label('error_count')
-            ).filter(
-                APIMetrics.timestamp >= start_time
-            ).first()
+            # API（读取分钟级汇总表）、AI模型、用户活动三组聚合一次往返取回
+            stats = (await asyncio.to_thread(
+                self.db.execute, METRICS_SUMMARY_SQL, {"start_time": start_time}
+            )).one()
 
+            # API指标摘要（聚合值已在SQL中COALESCE为0，无需逐项判空）
+            total_requests = stats.total_requests
             summary['api'] = {
-                'total_requests': api_stats.total_requests or 0,
-                'avg_response_time': float(api_stats.avg_response_time or 0),
-                'error_count': api_stats.error_count or 0,
-                'error_rate': (api_stats.error_count or 0) / max(api_stats.total_requests or 1, 1) * 100
+                'total_requests': total_requests,
+                'avg_response_time': stats.response_time_sum / max(total_requests, 1),
+                'error_count': stats.error_count,
+                'error_rate': stats.error_count / max(total_requests, 1) * 100
             }
 
             # AI模型指标摘要
-            ai_stats = self.db.query(
-                func.count(AIModelMetrics.id).label('total_calls'),
-                func.sum(AIModelMetrics.total_tokens).label('total_tokens'),
-                func.sum(AIModelMetrics.cost).label('total_cost'),
-                func.avg(AIModelMetrics.response_time).label('avg_response_time')
-            ).filter(
-                AIModelMetrics.timestamp >= start_time
-            ).first()
-
             summary['ai'] = {
-                'total_calls': ai_stats.total_calls or 0,
-                'total_tokens': ai_stats.total_tokens or 0,
-                'total_cost': float(ai_stats.total_cost or 0),
-                'avg_response_time': float(ai_stats.avg_response_time or 0)
+                'total_calls': stats.total_calls,
+                'total_tokens': stats.total_tokens,
+                'total_cost': micro_usd_to_usd(stats.total_cost),
+                'avg_response_time': float(stats.ai_avg_response_time)
             }
 
             # 用户活动摘要
-            user_stats = self.db.query(
-                func.count(UserActivityMetrics.id).label('total_activities'),
-                func.count(func.distinct(UserActivityMetrics.user_id)).label('active_users')
-            ).filter(
-                UserActivityMetrics.timestamp >= start_time
-            ).first()
-
             summary['users'] = {
-                'total_activities': user_stats.total_activities or 0,
-                'active_users': user_stats.active_users or 0
+                'total_activities': stats.total_activities,
+                'active_users': stats.active_users
             }
 
-            # 系统指标摘要（最新值）
-            latest_system_metrics = self.db.query(SystemMetrics).filter(
+            # 系统指标摘要（每个指标各取最新值，DISTINCT ON 走 (metric_name, timestamp) 索引）
+            latest_system_metrics = await asyncio.to_thread(self.db.query(
+                SystemMetrics.metric_name,
+                SystemMetrics.metric_value
+            ).filter(
                 SystemMetrics.metric_name.in_([
                     'system.cpu.usage',
                     'system.memory.usage',
@@ -262,7 +496,10 @@ class MonitoringService:
                 ])
             ).filter(
                 SystemMetrics.timestamp >= start_time
-            ).order_by(desc(SystemMetrics.timestamp)).limit(3).all()
+            ).distinct(SystemMetrics.metric_name).order_by(
+                SystemMetrics.metric_name,
+                desc(SystemMetrics.timestamp)
+            ).all)
 
             system_metrics = {}
             for metric in latest_system_metrics:
@@ -281,597 +518,167 @@ class MonitoringService:
         metric_name: str,
         time_range: str = "1h",
         interval: str = "5m"
-    ) -> List[Dict[str, Any]]:
-        """获取时间序列数据"""
+    ) -> Dict[str, List[Any]]:
+        """获取时间序列数据
+
+        按列返回：timestamps、values、counts 三个等长数组，避免每个数据点一个字典
+        """
         try:
             # 计算时间范围
             end_time = datetime.utcnow()
-            if time_range == "1h":
-                start_time = end_time - timedelta(hours=1)
-            elif time_range == "24h":
-                start_time = end_time - timedelta(hours=24)
-            elif time_range == "7d":
-                start_time = end_time - timedelta(days=7)
-            else:
-                start_time = end_time - timedelta(hours=1)
+            start_time = end_time - TIME_SERIES_RANGES.get(time_range, TIME_SERIES_RANGES["1h"])
 
             # 计算间隔
-            if interval == "1m":
-                interval_seconds = 60
-            elif interval == "5m":
-                interval_seconds = 300
-            elif interval == "1h":
-                interval_seconds = 3600
-            else:
-                interval_seconds = 300
+            interval_seconds = TIME_SERIES_INTERVALS.get(interval, TIME_SERIES_INTERVALS["5m"])
 
             # 查询数据
             if metric_name.startswith('api.'):
-                # API指标
-                data = self.db.query(
-                    func.date_trunc('minute', APIMetrics.timestamp).label('time_bucket'),
-                    func.avg(APIMetrics.response_time).label('avg_value'),
-                    func.count(APIMetrics.id).label('count')
+                # API指标（读取分钟级汇总表）
+                query = self.db.query(
+                    _time_bucket(APIMetricsMinute.minute_ts, interval_seconds),
+                    func.coalesce(
+                        func.sum(APIMetricsMinute.response_time_sum)
+                        / func.nullif(func.sum(APIMetricsMinute.request_count), 0),
+                        0
+                    ).label('avg_value'),
+                    func.sum(APIMetricsMinute.request_count).label('count')
                 ).filter(
                     and_(
-                        APIMetrics.timestamp >= start_time,
-                        APIMetrics.endpoint == metric_name.replace('api.', '').split('.')[0]
+                        APIMetricsMinute.minute_ts >= start_time,
+                        APIMetricsMinute.endpoint == metric_name.replace('api.', '').split('.')[0]
                     )
-                ).group_by('time_bucket').order_by('time_bucket').all()
+                ).group_by('time_bucket').order_by('time_bucket')
             else:
                 # 系统指标
-                data = self.db.query(
-                    func.date_trunc('minute', SystemMetrics.timestamp).label('time_bucket'),
-                    func.avg(SystemMetrics.metric_value).label('avg_value'),
+                query = self.db.query(
+                    _time_bucket(SystemMetrics.timestamp, interval_seconds),
+                    func.coalesce(func.avg(SystemMetrics.metric_value), 0).label('avg_value'),
                     func.count(SystemMetrics.id).label('count')
                 ).filter(
                     and_(
                         SystemMetrics.timestamp >= start_time,
                         SystemMetrics.metric_name == metric_name
                     )
-                ).group_by('time_bucket').order_by('time_bucket').all()
-
-            result = []
-            for row in data:
-                result.append({
-                    'timestamp': row.time_bucket.isoformat(),
-                    'value': float(row.avg_value or 0),
-                    'count': row.count
-                })
+                ).group_by('time_bucket').order_by('time_bucket')
+            data = await asyncio.to_thread(query.all)
 
-            return result
+            return {
+                'timestamps': [row.time_bucket.isoformat() for row in data],
+                'values': [float(row.avg_value) for row in data],
+                'counts': [row.count for row in data]
+            }
 
         except Exception as e:
             print(f"获取时间序列数据失败: {e}")
-            return []
-
-    async def _record_metric(
-        self,
-        metric_name: str,
-        metric_value: float,
-        metric_unit: str,
-        metric_type: str,
-        tags: Dict[str, str] = None
-    ):
-        """记录指标"""
-        try:
-            metric = SystemMetrics(
-                metric_name=metric_name,
-                metric_value=metric_value,
-                metric_unit=metric_unit,
-                metric_type=metric_type,
-                tags=tags or {}
-            )
-
-            self.db.add(metric)
-            self.db.commit()
-
-        except Exception as e:
-            print(f"记录指标失败: {e}")
+            return {'timestamps': [], 'values': [], 'counts': []}
 
     async def check_alert_rules(self):
         """检查告警规则"""
+        global _firing_rule_ids, _firing_rule_ids_loaded_at
         try:
             # 获取所有活跃的告警规则
-            active_rules = self.db.query(AlertRule).filter(
+            active_rules = await asyncio.to_thread(self.db.query(AlertRule).filter(
                 AlertRule.is_active == True
-            ).all()
-
-            for rule in active_rules:
-                await self._evaluate_alert_rule(rule)
-
-        except Exception as e:
-            print(f"检查告警规则失败: {e}")
+            ).all)
 
-    async def _evaluate_alert_rule(self, rule: AlertRule):
-        """评估单个告警规则"""
-        try:
-            # 获取最新的指标值
-            latest_metric = self.db.query(SystemMetrics).filter(
-                SystemMetrics.metric_name == rule.metric_name
-            ).order_by(desc(SystemMetrics.timestamp)).first()
-
-            if not latest_metric:
+            if not active_rules:
                 return
 
-            current_value = float(latest_metric.metric_value)
-            threshold = float(rule.threshold)
+            # 本轮评估统一使用同一时间点
+            now = datetime.utcnow()
 
-            # 评估条件
-            should_fire = False
-            if rule.condition == ">":
-                should_fire = current_value > threshold
-            elif rule.condition == "<":
-                should_fire = current_value < threshold
-            elif rule.condition == ">=":
-                should_fire = current_value >= threshold
-            elif rule.condition == "<=":
-                should_fire = current_value <= threshold
-            elif rule.condition == "==":
-                should_fire = current_value == threshold
-            elif rule.condition == "!=":
-                should_fire = current_value != threshold
-
-            # 检查是否已有未解决的告警
-            existing_alert = self.db.query(Alert).filter(
-                and_(
-                    Alert.rule_id == rule.id,
+            # 一次查询取出所有规则涉及指标的最新值（DISTINCT ON 每个指标取时间最新的一行）
+            latest_rows = await asyncio.to_thread(self.db.query(
+                SystemMetrics.metric_name,
+                SystemMetrics.metric_value
+            ).filter(
+                SystemMetrics.metric_name.in_({rule.metric_name for rule in active_rules})
+            ).distinct(SystemMetrics.metric_name).order_by(
+                SystemMetrics.metric_name,
+                desc(SystemMetrics.timestamp)
+            ).all)
+            latest_values = {row.metric_name: row.metric_value for row in latest_rows}
+
+            # 正在告警的规则ID集合缓存在进程内，过期后重新加载
+            if _firing_rule_ids is None or time.monotonic() - _firing_rule_ids_loaded_at > FIRING_RULES_CACHE_TTL:
+                firing_rows = await asyncio.to_thread(self.db.query(Alert.rule_id).filter(
                     Alert.status == "firing"
-                )
-            ).first()
-
-            if should_fire and not existing_alert:
-                # 触发新告警
-                alert = Alert(
-                    rule_id=rule.id,
-                    status="firing",
-                    message=f"{rule.name}: {rule.metric_name} {rule.condition} {threshold} (当前值: {current_value})",
-                    current_value=current_value,
-                    threshold_value=threshold,
-                    severity=rule.severity
-                )
-                self.db.add(alert)
-                self.db.commit()
-
-            elif not should_fire and existing_alert:
-                # 解决告警
-                existing_alert.status = "resolved"
-                existing_alert.resolved_at = datetime.utcnow()
-                self.db.commit()
-
-        except Exception as e:
-            print(f"评估告警规则失败: {e}")
-
-
-def get_monitoring_service(db: Session) -> MonitoringService:
-    """获取监控服务实例"""
-    return MonitoringService(db)
+                ).all)
+                _firing_rule_ids = {row.rule_id for row in firing_rows}
+                _firing_rule_ids_loaded_at = time.monotonic()
 
+            # 在内存中评估全部规则；只有需要解决的告警才回查数据库
+            new_alerts = []
+            resolve_rule_ids = []
+            for rule in active_rules:
+                evaluation = self._evaluate_alert_rule(rule, latest_values.get(rule.metric_name))
+                if evaluation is None:
+                    continue
+                should_fire, current_value, threshold = evaluation
+                is_firing = rule.id in _firing_rule_ids
+
+                if should_fire and not is_firing:
+                    # 触发新告警
+                    new_alerts.append(Alert(
+                        rule_id=rule.id,
+                        status="firing",
+                        message=f"{rule.name}: {rule.metric_name} {rule.condition} {threshold} (当前值: {current_value})",
+                        current_value=current_value,
+                        threshold_value=threshold,
+                        severity=rule.severity
+                    ))
+                elif not should_fire and is_firing:
+                    resolve_rule_ids.append(rule.id)
+
+            if not new_alerts and not resolve_rule_ids:
+                return
 
-class MonitoringService:
-    """监控服务类"""
-    
-    def __init__(self, db: Session):
-        self.db = db
-    
-    async def collect_system_metrics(self) -> Dict[str, Any]:
-        """收集系统指标"""
-        try:
-            # CPU使用率
-            cpu_percent = psutil.cpu_percent(interval=1)
-            await self._record_metric("system.cpu.usage", cpu_percent, "percent", "gauge")
-            
-            # 内存使用情况
-            memory = psutil.virtual_memory()
-            await self._record_metric("system.memory.usage", memory.percent, "percent", "gauge")
-            await self._record_metric("system.memory.available", memory.available / (1024**3), "GB", "gauge")
-            await self._record_metric("system.memory.total", memory.total / (1024**3), "GB", "gauge")
-            
-            # 磁盘使用情况
-            disk = psutil.disk_usage('/')
-            disk_percent = (disk.used / disk.total) * 100
-            await self._record_metric("system.disk.usage", disk_percent, "percent", "gauge")
-            await self._record_metric("system.disk.free", disk.free / (1024**3), "GB", "gauge")
-            
-            # 网络IO
-            network = psutil.net_io_counters()
-            await self._record_metric("system.network.bytes_sent", network.bytes_sent, "bytes", "counter")
-            await self._record_metric("system.network.bytes_recv", network.bytes_recv, "bytes", "counter")
-            
-            # 进程数量
-            process_count = len(psutil.pids())
-            await self._record_metric("system.processes.count", process_count, "count", "gauge")
-            
-            return {
-                "cpu_usage": cpu_percent,
-                "memory_usage": memory.percent,
-                "disk_usage": disk_percent,
-                "process_count": process_count,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            
-        except Exception as e:
-            print(f"收集系统指标失败: {e}")
-            return {}
-    
-    async def record_api_metrics(
-        self,
-        endpoint: str,
-        method: str,
-        status_code: int,
-        response_time: float,
-        request_size: int = 0,
-        response_size: int = 0,
-        user_id: str = None,
-        ip_address: str = None,
-        user_agent: str = None,
-        error_message: str = None
-    ):
-        """记录API调用指标"""
-        try:
-            metric = APIMetrics(
-                endpoint=endpoint,
-                method=method,
-                status_code=status_code,
-                response_time=response_time,
-                request_size=request_size,
-                response_size=response_size,
-                user_id=user_id,
-                ip_address=ip_address,
-                user_agent=user_agent,
-                error_message=error_message
-            )
-            
-            self.db.add(metric)
-            self.db.commit()
-            
-            # 记录聚合指标
-            await self._record_metric(f"api.{endpoint}.response_time", response_time, "seconds", "histogram")
-            await self._record_metric(f"api.{endpoint}.requests", 1, "count", "counter")
-            
-            if status_code >= 400:
-                await self._record_metric(f"api.{endpoint}.errors", 1, "count", "counter")
-            
-        except Exception as e:
-            print(f"记录API指标失败: {e}")
-    
-    async def record_ai_model_metrics(
-        self,
-        model_name: str,
-        provider: str,
-        operation: str,
-        input_tokens: int,
-        output_tokens: int,
-        cost: float,
-        response_time: float,
-        success: bool = True,
-        error_type: str = None,
-        error_message: str = None,
-        user_id: str = None
-    ):
-        """记录AI模型调用指标"""
-        try:
-            total_tokens = input_tokens + output_tokens
-            
-            metric = AIModelMetrics(
-                model_name=model_name,
-                provider=provider,
-                operation=operation,
-                input_tokens=input_tokens,
-                output_tokens=output_tokens,
-                total_tokens=total_tokens,
-                cost=cost,
-                response_time=response_time,
-                success=success,
-                error_type=error_type,
-                error_message=error_message,
-                user_id=user_id
-            )
-            
-            self.db.add(metric)
-            self.db.commit()
-            
-            # 记录聚合指标
-            await self._record_metric(f"ai.{provider}.{model_name}.tokens", total_tokens, "tokens", "counter")
-            await self._record_metric(f"ai.{provider}.{model_name}.cost", cost, "USD", "counter")
-            await self._record_metric(f"ai.{provider}.{model_name}.response_time", response_time, "seconds", "histogram")
-            
-            if not success:
-                await self._record_metric(f"ai.{provider}.{model_name}.errors", 1, "count", "counter")
-            
-        except Exception as e:
-            print(f"记录AI模型指标失败: {e}")
-    
-    async def record_user_activity(
-        self,
-        user_id: str,
-        activity_type: str,
-        activity_detail: str = None,
-        resource_type: str = None,
-        resource_id: str = None,
-        metadata: Dict[str, Any] = None,
-        session_id: str = None,
-        ip_address: str = None
-    ):
-        """记录用户活动"""
-        try:
-            activity = UserActivityMetrics(
-                user_id=user_id,
-                activity_type=activity_type,
-                activity_detail=activity_detail,
-                resource_type=resource_type,
-                resource_id=resource_id,
-                metadata=metadata or {},
-                session_id=session_id,
-                ip_address=ip_address
-            )
-            
-            self.db.add(activity)
-            self.db.commit()
-            
-            # 记录聚合指标
-            await self._record_metric(f"user.activity.{activity_type}", 1, "count", "counter")
-            
-        except Exception as e:
-            print(f"记录用户活动失败: {e}")
-    
-    async def get_metrics_summary(
-        self,
-        time_range: str = "1h",
-        metric_types: List[str] = None
-    ) -> Dict[str, Any]:
-        """获取指标摘要"""
-        try:
-            # 计算时间范围
-            end_time = datetime.utcnow()
-            if time_range == "1h":
-                start_time = end_time - timedelta(hours=1)
-            elif time_range == "24h":
-                start_time = end_time - timedelta(hours=24)
-            elif time_range == "7d":
-                start_time = end_time - timedelta(days=7)
-            elif time_range == "30d":
-                start_time = end_time - timedelta(days=30)
-            else:
-                start_time = end_time - timedelta(hours=1)
-            
-            summary = {}
-            
-            # API指标摘要
-            api_stats = self.db.query(
-                func.count(APIMetrics.id).label('total_requests'),
-                func.avg(APIMetrics.response_time).label('avg_response_time'),
-                func.count(APIMetrics.id).filter(APIMetrics.status_code >= 400).label('error_count')
-            ).filter(
-                APIMetrics.timestamp >= start_time
-            ).first()
-            
-            summary['api'] = {
-                'total_requests': api_stats.total_requests or 0,
-                'avg_response_time': float(api_stats.avg_response_time or 0),
-                'error_count': api_stats.error_count or 0,
-                'error_rate': (api_stats.error_count or 0) / max(api_stats.total_requests or 1, 1) * 100
-            }
-            
-            # AI模型指标摘要
-            ai_stats = self.db.query(
-                func.count(AIModelMetrics.id).label('total_calls'),
-                func.sum(AIModelMetrics.total_tokens).label('total_tokens'),
-                func.sum(AIModelMetrics.cost).label('total_cost'),
-                func.avg(AIModelMetrics.response_time).label('avg_response_time')
-            ).filter(
-                AIModelMetrics.timestamp >= start_time
-            ).first()
-            
-            summary['ai'] = {
-                'total_calls': ai_stats.total_calls or 0,
-                'total_tokens': ai_stats.total_tokens or 0,
-                'total_cost': float(ai_stats.total_cost or 0),
-                'avg_response_time': float(ai_stats.avg_response_time or 0)
-            }
-            
-            # 用户活动摘要
-            user_stats = self.db.query(
-                func.count(UserActivityMetrics.id).label('total_activities'),
-                func.count(func.distinct(UserActivityMetrics.user_id)).label('active_users')
-            ).filter(
-                UserActivityMetrics.timestamp >= start_time
-            ).first()
-            
-            summary['users'] = {
-                'total_activities': user_stats.total_activities or 0,
-                'active_users': user_stats.active_users or 0
-            }
-            
-            # 系统指标摘要（最新值）
-            latest_system_metrics = self.db.query(SystemMetrics).filter(
-                SystemMetrics.metric_name.in_([
-                    'system.cpu.usage',
-                    'system.memory.usage',
-                    'system.disk.usage'
-                ])
-            ).filter(
-                SystemMetrics.timestamp >= start_time
-            ).order_by(desc(SystemMetrics.timestamp)).limit(3).all()
-            
-            system_metrics = {}
-            for metric in latest_system_metrics:
-                system_metrics[metric.metric_name] = float(metric.metric_value)
-            
-            summary['system'] = system_metrics
-            
-            return summary
-            
-        except Exception as e:
-            print(f"获取指标摘要失败: {e}")
-            return {}
-    
-    async def get_time_series_data(
-        self,
-        metric_name: str,
-        time_range: str = "1h",
-        interval: str = "5m"
-    ) -> List[Dict[str, Any]]:
-        """获取时间序列数据"""
-        try:
-            # 计算时间范围
-            end_time = datetime.utcnow()
-            if time_range == "1h":
-                start_time = end_time - timedelta(hours=1)
-            elif time_range == "24h":
-                start_time = end_time - timedelta(hours=24)
-            elif time_range == "7d":
-                start_time = end_time - timedelta(days=7)
-            else:
-                start_time = end_time - timedelta(hours=1)
-            
-            # 计算间隔
-            if interval == "1m":
-                interval_seconds = 60
-            elif interval == "5m":
-                interval_seconds = 300
-            elif interval == "1h":
-                interval_seconds = 3600
-            else:
-                interval_seconds = 300
-            
-            # 查询数据
-            if metric_name.startswith('api.'):
-                # API指标
-                data = self.db.query(
-                    func.date_trunc('minute', APIMetrics.timestamp).label('time_bucket'),
-                    func.avg(APIMetrics.response_time).label('avg_value'),
-                    func.count(APIMetrics.id).label('count')
-                ).filter(
-                    and_(
-                        APIMetrics.timestamp >= start_time,
-                        APIMetrics.endpoint == metric_name.replace('api.', '').split('.')[0]
-                    )
-                ).group_by('time_bucket').order_by('time_bucket').all()
-            else:
-                # 系统指标
-                data = self.db.query(
-                    func.date_trunc('minute', SystemMetrics.timestamp).label('time_bucket'),
-                    func.avg(SystemMetrics.metric_value).label('avg_value'),
-                    func.count(SystemMetrics.id).label('count')
-                ).filter(
+            # 解决告警
+            if resolve_rule_ids:
+                resolving = await asyncio.to_thread(self.db.query(Alert).filter(
                     and_(
-                        SystemMetrics.timestamp >= start_time,
-                        SystemMetrics.metric_name == metric_name
+                        Alert.rule_id.in_(resolve_rule_ids),
+                        Alert.status == "firing"
                     )
-                ).group_by('time_bucket').order_by('time_bucket').all()
-            
-            result = []
-            for row in data:
-                result.append({
-                    'timestamp': row.time_bucket.isoformat(),
-                    'value': float(row.avg_value or 0),
-                    'count': row.count
-                })
-            
-            return result
-            
-        except Exception as e:
-            print(f"获取时间序列数据失败: {e}")
-            return []
-    
-    async def _record_metric(
-        self,
-        metric_name: str,
-        metric_value: float,
-        metric_unit: str,
-        metric_type: str,
-        tags: Dict[str, str] = None
-    ):
-        """记录指标"""
-        try:
-            metric = SystemMetrics(
-                metric_name=metric_name,
-                metric_value=metric_value,
-                metric_unit=metric_unit,
-                metric_type=metric_type,
-                tags=tags or {}
-            )
-            
-            self.db.add(metric)
-            self.db.commit()
-            
-        except Exception as e:
-            print(f"记录指标失败: {e}")
-    
-    async def check_alert_rules(self):
-        """检查告警规则"""
-        try:
-            # 获取所有活跃的告警规则
-            active_rules = self.db.query(AlertRule).filter(
-                AlertRule.is_active == True
-            ).all()
-            
-            for rule in active_rules:
-                await self._evaluate_alert_rule(rule)
-                
+                ).all)
+                for alert in resolving:
+                    alert.status = "resolved"
+                    alert.resolved_at = now
+
+            # 新告警与已解决告警在同一事务中一次提交，提交成功后再更新缓存
+            self.db.add_all(new_alerts)
+            await asyncio.to_thread(self.db.commit)
+            if _firing_rule_ids is not None:  # 等待提交期间可能已被其他检查清空
+                _firing_rule_ids.difference_update(resolve_rule_ids)
+                _firing_rule_ids.update(alert.rule_id for alert in new_alerts)
+
         except Exception as e:
+            self.db.rollback()
+            # 状态不确定，下次检查时重新加载
+            _firing_rule_ids = None
             print(f"检查告警规则失败: {e}")
-    
-    async def _evaluate_alert_rule(self, rule: AlertRule):
-        """评估单个告警规则"""
+
+    def _evaluate_alert_rule(self, rule: AlertRule,
+                             latest_value: Optional[float]) -> Optional[Tuple[bool, float, float]]:
+        """评估单个告警规则（最新指标值由调用方批量查询后传入）
+
+        返回 (是否应触发, 当前值, 阈值)；没有指标数据或评估失败时返回None
+        """
         try:
-            # 获取最新的指标值
-            latest_metric = self.db.query(SystemMetrics).filter(
-                SystemMetrics.metric_name == rule.metric_name
-            ).order_by(desc(SystemMetrics.timestamp)).first()
-            
-            if not latest_metric:
-                return
-            
-            current_value = float(latest_metric.metric_value)
+            if latest_value is None:
+                return None
+
+            current_value = float(latest_value)
             threshold = float(rule.threshold)
-            
-            # 评估条件
-            should_fire = False
-            if rule.condition == ">":
-                should_fire = current_value > threshold
-            elif rule.condition == "<":
-                should_fire = current_value < threshold
-            elif rule.condition == ">=":
-                should_fire = current_value >= threshold
-            elif rule.condition == "<=":
-                should_fire = current_value <= threshold
-            elif rule.condition == "==":
-                should_fire = current_value == threshold
-            elif rule.condition == "!=":
-                should_fire = current_value != threshold
-            
-            # 检查是否已有未解决的告警
-            existing_alert = self.db.query(Alert).filter(
-                and_(
-                    Alert.rule_id == rule.id,
-                    Alert.status == "firing"
-                )
-            ).first()
-            
-            if should_fire and not existing_alert:
-                # 触发新告警
-                alert = Alert(
-                    rule_id=rule.id,
-                    status="firing",
-                    message=f"{rule.name}: {rule.metric_name} {rule.condition} {threshold} (当前值: {current_value})",
-                    current_value=current_value,
-                    threshold_value=threshold,
-                    severity=rule.severity
-                )
-                self.db.add(alert)
-                self.db.commit()
-                
-            elif not should_fire and existing_alert:
-                # 解决告警
-                existing_alert.status = "resolved"
-                existing_alert.resolved_at = datetime.utcnow()
-                self.db.commit()
-                
+
+            # 评估条件（未知条件视为不触发）
+            compare = ALERT_CONDITION_OPS.get(rule.condition)
+            should_fire = compare is not None and compare(current_value, threshold)
+            return should_fire, current_value, threshold
+
         except Exception as e:
             print(f"评估告警规则失败: {e}")
-
+            return None
 
 def get_monitoring_service(db: Session) -> MonitoringService:
     """获取监控服务实例"""
@@ -5,7 +5,7 @@
 import json
 import asyncio
 from typing import Dict, List, Optional, Tuple, Any
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, replace
 from enum import Enum
 import numpy as np
 
@@ -37,6 +37,11 @@ class Impact(Enum):
     MEDIUM = "medium"   # 中等影响
     LOW = "low"         # 低影响
 
+# AI返回值 -> 枚举成员（直接查字典，无法识别的值回退为默认成员）
+SUGGESTION_TYPE_BY_VALUE: Dict[str, SuggestionType] = {member.value: member for member in SuggestionType}
+PRIORITY_BY_VALUE: Dict[int, Priority] = {member.value: member for member in Priority}
+IMPACT_BY_VALUE: Dict[str, Impact] = {member.value: member for member in Impact}
+
 @dataclass
 class OptimizationSuggestion:
     """优化建议数据结构"""
@@ -63,6 +68,123 @@ class OptimizationResult:
     processing_time: float
     model_used: str
 
+# 弱点分析检查的维度及其描述（按检查顺序排列）
+WEAKNESS_METRICS: Tuple[Tuple[str, str], ...] = (
+    ("semantic_clarity", "语义表达不够清晰明确"),
+    ("structural_integrity", "结构组织需要优化"),
+    ("logical_coherence", "逻辑连贯性有待提升"),
+    ("specificity_score", "指令不够具体明确"),
+    ("instruction_clarity", "指令清晰度需要改进"),
+    ("context_completeness", "上下文信息不够完整"),
+)
+# 低于该分数视为弱点；低于严重阈值时严重程度为1，否则为2
+WEAKNESS_THRESHOLD = 70
+CRITICAL_WEAKNESS_THRESHOLD = 50
+
+# 表示提示词中已定义角色的词汇
+ROLE_INDICATORS = frozenset({'you', 'act', 'role', '你', '扮演', '角色'})
+
+# 规则建议模板（模块加载时构建一次，生成建议时用 replace() 复制并填入 id/优先级；
+# expected_improvement、examples 在各副本间共享，只读使用）
+RULE_SUGGESTION_TEMPLATES: Dict[str, OptimizationSuggestion] = {
+    "semantic_clarity": OptimizationSuggestion(
+        id="",
+        type=SuggestionType.CLARITY,
+        priority=Priority.HIGH,
+        impact=Impact.HIGH,
+        title="提升语义清晰度",
+        description="使用更精确、具体的词汇，避免模糊表达",
+        improvement_plan="1. 替换模糊词汇（如'一些'、'很多'）为具体数量\n2. 使用专业术语替代通用词汇\n3. 明确指定期望的输出类型和格式",
+        expected_improvement={"semantic_clarity": 15, "overall_score": 8},
+        examples=[
+            "模糊：'写一些关于AI的内容'",
+            "清晰：'写3个关于AI在医疗领域应用的具体案例，每个案例200字'"
+        ],
+        reasoning="语义清晰度低会导致AI理解偏差，影响输出质量",
+        confidence=0.9
+    ),
+    "structural_integrity": OptimizationSuggestion(
+        id="",
+        type=SuggestionType.STRUCTURE,
+        priority=Priority.HIGH,
+        impact=Impact.MEDIUM,
+        title="优化结构组织",
+        description="改进提示词的逻辑结构和信息组织方式",
+        improvement_plan="1. 使用编号或分点列出要求\n2. 按逻辑顺序组织信息\n3. 分离背景信息和具体指令",
+        expected_improvement={"structural_integrity": 20, "logical_coherence": 10},
+        examples=[
+            "优化前：混合的长段落描述",
+            "优化后：1. 背景 2. 任务 3. 要求 4. 输出格式"
+        ],
+        reasoning="良好的结构有助于AI理解任务层次和优先级",
+        confidence=0.85
+    ),
+    "specificity_score": OptimizationSuggestion(
+        id="",
+        type=SuggestionType.SPECIFICITY,
+        priority=Priority.CRITICAL,
+        impact=Impact.HIGH,
+        title="增强指令具体性",
+        description="提供更具体、明确的指令和要求",
+        improvement_plan="1. 指定具体的数量、长度、格式\n2. 提供详细的质量标准\n3. 明确约束条件和限制",
+        expected_improvement={"specificity_score": 25, "instruction_clarity": 15},
+        examples=[
+            "模糊：'写得好一点'",
+            "具体：'使用专业术语，控制在500字以内，包含3个要点'"
+        ],
+        reasoning="具体的指令能显著提高输出的准确性和相关性",
+        confidence=0.95
+    ),
+    "context_completeness": OptimizationSuggestion(
+        id="",
+        type=SuggestionType.CONTEXT,
+        priority=Priority.MEDIUM,
+        impact=Impact.MEDIUM,
+        title="补充上下文信息",
+        description="提供更完整的背景信息和上下文",
+        improvement_plan="1. 添加任务背景和目标\n2. 说明目标受众和使用场景\n3. 提供相关的参考信息",
+        expected_improvement={"context_completeness": 20, "overall_score": 10},
+        examples=[
+            "缺少上下文：'翻译这段文字'",
+            "完整上下文：'为技术文档翻译这段英文，目标读者是中国的软件工程师'"
+        ],
+        reasoning="充分的上下文帮助AI生成更符合预期的内容",
+        confidence=0.8
+    ),
+}
+
+EXAMPLES_SUGGESTION_TEMPLATE = OptimizationSuggestion(
+    id="",
+    type=SuggestionType.EXAMPLES,
+    priority=Priority.MEDIUM,
+    impact=Impact.MEDIUM,
+    title="添加示例说明",
+    description="提供具体示例来说明期望的输出格式",
+    improvement_plan="1. 添加1-2个输出示例\n2. 展示理想的格式和风格\n3. 说明示例的关键特征",
+    expected_improvement={"instruction_clarity": 15, "overall_score": 8},
+    examples=[
+        "添加示例：'例如：标题：AI的未来\\n内容：人工智能技术正在...'"
+    ],
+    reasoning="示例能直观展示期望输出，减少理解偏差",
+    confidence=0.75
+)
+
+ROLE_SUGGESTION_TEMPLATE = OptimizationSuggestion(
+    id="",
+    type=SuggestionType.ROLE,
+    priority=Priority.LOW,
+    impact=Impact.MEDIUM,
+    title="定义AI角色",
+    description="明确指定AI应该扮演的角色和专业身份",
+    improvement_plan="1. 在开头定义AI的角色\n2. 指定相关的专业背景\n3. 说明角色的能力和限制",
+    expected_improvement={"instruction_clarity": 10, "context_completeness": 10},
+    examples=[
+        "角色定义：'你是一个资深的技术写作专家，擅长将复杂概念简化表达'"
+    ],
+    reasoning="明确的角色定义有助于AI采用合适的语调和视角",
+    confidence=0.7
+)
+
 class OptimizationEngine:
     """优化建议生成引擎"""
     
@@ -101,29 +223,11 @@ class OptimizationEngine:
         metrics = analysis.metrics
         
         # 检查各维度评分，识别需要改进的方面
-        if metrics.semantic_clarity < 70:
-            severity = 1 if metrics.semantic_clarity < 50 else 2
-            weaknesses.append(("semantic_clarity", severity, "语义表达不够清晰明确"))
-        
-        if metrics.structural_integrity < 70:
-            severity = 1 if metrics.structural_integrity < 50 else 2
-            weaknesses.append(("structural_integrity", severity, "结构组织需要优化"))
-        
-        if metrics.logical_coherence < 70:
-            severity = 1 if metrics.logical_coherence < 50 else 2
-            weaknesses.append(("logical_coherence", severity, "逻辑连贯性有待提升"))
-        
-        if metrics.specificity_score < 70:
-            severity = 1 if metrics.specificity_score < 50 else 2
-            weaknesses.append(("specificity_score", severity, "指令不够具体明确"))
-        
-        if metrics.instruction_clarity < 70:
-            severity = 1 if metrics.instruction_clarity < 50 else 2
-            weaknesses.append(("instruction_clarity", severity, "指令清晰度需要改进"))
-        
-        if metrics.context_completeness < 70:
-            severity = 1 if metrics.context_completeness < 50 else 2
-            weaknesses.append(("context_completeness", severity, "上下文信息不够完整"))
+        for metric_name, description in WEAKNESS_METRICS:
+            score = getattr(metrics, metric_name)
+            if score < WEAKNESS_THRESHOLD:
+                severity = 1 if score < CRITICAL_WEAKNESS_THRESHOLD else 2
+                weaknesses.append((metric_name, severity, description))
         
         # 按严重程度排序
         weaknesses.sort(key=lambda x: x[1])
@@ -133,85 +237,24 @@ class OptimizationEngine:
         """基于规则生成优化建议"""
         suggestions = []
         weaknesses = self.analyze_weaknesses(analysis)
-        metrics = analysis.metrics
         details = analysis.analysis_details
         
         suggestion_id = 0
         
         for weakness_type, severity, description in weaknesses:
             suggestion_id += 1
+            template = RULE_SUGGESTION_TEMPLATES.get(weakness_type)
+            if template is None:
+                continue
             
             if weakness_type == "semantic_clarity":
-                suggestions.append(OptimizationSuggestion(
-                    id=f"rule_{suggestion_id}",
-                    type=SuggestionType.CLARITY,
-                    priority=Priority.CRITICAL if severity == 1 else Priority.HIGH,
-                    impact=Impact.HIGH,
-                    title="提升语义清晰度",
-                    description="使用更精确、具体的词汇，避免模糊表达",
-                    improvement_plan="1. 替换模糊词汇（如'一些'、'很多'）为具体数量\n2. 使用专业术语替代通用词汇\n3. 明确指定期望的输出类型和格式",
-                    expected_improvement={"semantic_clarity": 15, "overall_score": 8},
-                    examples=[
-                        "模糊：'写一些关于AI的内容'",
-                        "清晰：'写3个关于AI在医疗领域应用的具体案例，每个案例200字'"
-                    ],
-                    reasoning="语义清晰度低会导致AI理解偏差，影响输出质量",
-                    confidence=0.9
-                ))
-            
-            elif weakness_type == "structural_integrity":
-                suggestions.append(OptimizationSuggestion(
-                    id=f"rule_{suggestion_id}",
-                    type=SuggestionType.STRUCTURE,
-                    priority=Priority.HIGH,
-                    impact=Impact.MEDIUM,
-                    title="优化结构组织",
-                    description="改进提示词的逻辑结构和信息组织方式",
-                    improvement_plan="1. 使用编号或分点列出要求\n2. 按逻辑顺序组织信息\n3. 分离背景信息和具体指令",
-                    expected_improvement={"structural_integrity": 20, "logical_coherence": 10},
-                    examples=[
-                        "优化前：混合的长段落描述",
-                        "优化后：1. 背景 2. 任务 3. 要求 4. 输出格式"
-                    ],
-                    reasoning="良好的结构有助于AI理解任务层次和优先级",
-                    confidence=0.85
-                ))
-            
-            elif weakness_type == "specificity_score":
-                suggestions.append(OptimizationSuggestion(
-                    id=f"rule_{suggestion_id}",
-                    type=SuggestionType.SPECIFICITY,
-                    priority=Priority.CRITICAL,
-                    impact=Impact.HIGH,
-                    title="增强指令具体性",
-                    description="提供更具体、明确的指令和要求",
-                    improvement_plan="1. 指定具体的数量、长度、格式\n2. 提供详细的质量标准\n3. 明确约束条件和限制",
-                    expected_improvement={"specificity_score": 25, "instruction_clarity": 15},
-                    examples=[
-                        "模糊：'写得好一点'",
-                        "具体：'使用专业术语，控制在500字以内，包含3个要点'"
-                    ],
-                    reasoning="具体的指令能显著提高输出的准确性和相关性",
-                    confidence=0.95
-                ))
-            
-            elif weakness_type == "context_completeness":
-                suggestions.append(OptimizationSuggestion(
+                suggestions.append(replace(
+                    template,
                     id=f"rule_{suggestion_id}",
-                    type=SuggestionType.CONTEXT,
-                    priority=Priority.MEDIUM,
-                    impact=Impact.MEDIUM,
-                    title="补充上下文信息",
-                    description="提供更完整的背景信息和上下文",
-                    improvement_plan="1. 添加任务背景和目标\n2. 说明目标受众和使用场景\n3. 提供相关的参考信息",
-                    expected_improvement={"context_completeness": 20, "overall_score": 10},
-                    examples=[
-                        "缺少上下文：'翻译这段文字'",
-                        "完整上下文：'为技术文档翻译这段英文，目标读者是中国的软件工程师'"
-                    ],
-                    reasoning="充分的上下文帮助AI生成更符合预期的内容",
-                    confidence=0.8
+                    priority=Priority.CRITICAL if severity == 1 else Priority.HIGH
                 ))
+            else:
+                suggestions.append(replace(template, id=f"rule_{suggestion_id}"))
         
         # 添加通用建议
         basic_metrics = details.get('basic_metrics', {})
@@ -219,41 +262,13 @@ class OptimizationEngine:
         # 如果没有示例，建议添加
         if not basic_metrics.get('structural_elements', {}).get('has_examples', False):
             suggestion_id += 1
-            suggestions.append(OptimizationSuggestion(
-                id=f"rule_{suggestion_id}",
-                type=SuggestionType.EXAMPLES,
-                priority=Priority.MEDIUM,
-                impact=Impact.MEDIUM,
-                title="添加示例说明",
-                description="提供具体示例来说明期望的输出格式",
-                improvement_plan="1. 添加1-2个输出示例\n2. 展示理想的格式和风格\n3. 说明示例的关键特征",
-                expected_improvement={"instruction_clarity": 15, "overall_score": 8},
-                examples=[
-                    "添加示例：'例如：标题：AI的未来\\n内容：人工智能技术正在...'"
-                ],
-                reasoning="示例能直观展示期望输出，减少理解偏差",
-                confidence=0.75
-            ))
+            suggestions.append(replace(EXAMPLES_SUGGESTION_TEMPLATE, id=f"rule_{suggestion_id}"))
         
         # 如果没有角色定义，建议添加
-        if not any(indicator in analysis.analysis_details.get('basic_metrics', {}).get('word_frequency', {}) 
-                  for indicator in ['you', 'act', 'role', '你', '扮演', '角色']):
+        word_frequency = basic_metrics.get('word_frequency', {})
+        if not (ROLE_INDICATORS & word_frequency.keys()):
             suggestion_id += 1
-            suggestions.append(OptimizationSuggestion(
-                id=f"rule_{suggestion_id}",
-                type=SuggestionType.ROLE,
-                priority=Priority.LOW,
-                impact=Impact.MEDIUM,
-                title="定义AI角色",
-                description="明确指定AI应该扮演的角色和专业身份",
-                improvement_plan="1. 在开头定义AI的角色\n2. 指定相关的专业背景\n3. 说明角色的能力和限制",
-                expected_improvement={"instruction_clarity": 10, "context_completeness": 10},
-                examples=[
-                    "角色定义：'你是一个资深的技术写作专家，擅长将复杂概念简化表达'"
-                ],
-                reasoning="明确的角色定义有助于AI采用合适的语调和视角",
-                confidence=0.7
-            ))
+            suggestions.append(replace(ROLE_SUGGESTION_TEMPLATE, id=f"rule_{suggestion_id}"))
         
         return suggestions[:5]  # 最多返回5个建议
 
@@ -314,9 +329,9 @@ class OptimizationEngine:
                 for i, sugg in enumerate(ai_suggestions.get('suggestions', ai_suggestions)[:5]):
                     suggestions.append(OptimizationSuggestion(
                         id=f"ai_{i+1}",
-                        type=SuggestionType(sugg.get('type', 'clarity')),
-                        priority=Priority(sugg.get('priority', 3)),
-                        impact=Impact(sugg.get('impact', 'medium')),
+                        type=SUGGESTION_TYPE_BY_VALUE.get(sugg.get('type'), SuggestionType.CLARITY),
+                        priority=PRIORITY_BY_VALUE.get(sugg.get('priority'), Priority.MEDIUM),
+                        impact=IMPACT_BY_VALUE.get(sugg.get('impact'), Impact.MEDIUM),
                         title=sugg.get('title', '优化建议'),
                         description=sugg.get('description', ''),
                         improvement_plan=sugg.get('improvement_plan', ''),
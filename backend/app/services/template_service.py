@@ -4,14 +4,57 @@
 
 import asyncio
 from typing import List, Dict, Optional, Any, Tuple
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func, desc, asc
+from sqlalchemy.orm import Session, defer, raiseload, selectinload
+from sqlalchemy import and_, or_, func, desc, asc, select
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
 import re
 
-from app.models.template import Template, TemplateRating, TemplateUsage, TemplateCollection, TemplateCategory, TemplateTag
+from app.models.template import Template, TemplateRating, TemplateCollection, TemplateCategory, TemplateTag, TemplateTagMap
 from app.models.user import User
+from app.services.template_usage import record_template_usage
+
+# 列表查询只输出摘要字段：不加载正文，标签批量预加载，其余关系禁止懒加载以避免 N+1
+LIST_LOAD_OPTIONS = (defer(Template.content), selectinload(Template.tag_objects), raiseload("*"))
+
+
+def _has_aggregate_triggers(db: Session) -> bool:
+    """聚合触发器只在 PostgreSQL 上安装（见 app.models.template）"""
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def sync_rating_aggregate(db: Session, template_id) -> None:
+    """没有 trg_template_rating_agg 的数据库上，在应用侧重算模板评分聚合（调用方负责提交）"""
+    if _has_aggregate_triggers(db):
+        return
+    
+    db.flush()
+    rating_sum, rating_count = db.query(
+        func.coalesce(func.sum(TemplateRating.rating), 0),
+        func.count(TemplateRating.id)
+    ).filter(TemplateRating.template_id == template_id).one()
+    
+    db.query(Template).filter(Template.id == template_id).update({
+        Template.rating_sum: rating_sum,
+        Template.rating_count: rating_count,
+        # 与触发器一致：评分×100，四舍五入
+        Template.rating: int(rating_sum * 100 / rating_count + 0.5) if rating_count else 0
+    }, synchronize_session=False)
+
+
+def sync_tag_usage(db: Session, tags: List[TemplateTag]) -> None:
+    """没有 trg_template_tag_usage 的数据库上，在应用侧重算标签使用次数（调用方负责提交）"""
+    if not tags or _has_aggregate_triggers(db):
+        return
+    
+    db.flush()
+    counts = dict(
+        db.query(TemplateTagMap.tag_id, func.count())
+        .filter(TemplateTagMap.tag_id.in_({tag.id for tag in tags}))
+        .group_by(TemplateTagMap.tag_id)
+    )
+    for tag in tags:
+        tag.usage_count = counts.get(tag.id, 0)
 
 
 class TemplateService:
@@ -42,22 +85,20 @@ class TemplateService:
                 content=content,
                 description=description,
                 category=category,
-                tags=tags or [],
+                tag_objects=self.resolve_tags(tags or []),
                 industry=industry,
                 use_case=use_case,
                 difficulty_level=difficulty_level,
                 is_public=is_public,
-                metadata=metadata or {}
+                meta=metadata or {}
             )
             
+            # 标签使用次数由 trg_template_tag_usage 触发器维护
             self.db.add(template)
+            sync_tag_usage(self.db, template.tag_objects)
             self.db.commit()
             self.db.refresh(template)
             
-            # 更新标签使用统计
-            if tags:
-                await self._update_tag_usage(tags)
-            
             return template
             
         except IntegrityError as e:
@@ -98,6 +139,13 @@ class TemplateService:
         if not template:
             return None
         
+        # 标签通过关联表更新
+        changed_tags = []
+        if 'tags' in updates:
+            changed_tags = list(template.tag_objects)
+            template.tag_objects = self.resolve_tags(updates.pop('tags') or [])
+            changed_tags.extend(template.tag_objects)
+        
         # 更新字段
         for key, value in updates.items():
             if hasattr(template, key):
@@ -106,13 +154,10 @@ class TemplateService:
         template.updated_at = datetime.utcnow()
         
         try:
+            sync_tag_usage(self.db, changed_tags)
             self.db.commit()
             self.db.refresh(template)
             
-            # 如果更新了标签，更新标签统计
-            if 'tags' in updates:
-                await self._update_tag_usage(updates['tags'])
-            
             return template
             
         except IntegrityError as e:
@@ -132,7 +177,9 @@ class TemplateService:
             return False
         
         try:
+            tags = list(template.tag_objects)
             self.db.delete(template)
+            sync_tag_usage(self.db, tags)
             self.db.commit()
             return True
             
@@ -160,7 +207,7 @@ class TemplateService:
         """搜索模板"""
         
         # 基础查询
-        base_query = self.db.query(Template)
+        base_query = self.db.query(Template).options(*LIST_LOAD_OPTIONS)
         
         # 权限过滤
         if user_id:
@@ -186,10 +233,17 @@ class TemplateService:
         if category:
             base_query = base_query.filter(Template.category == category)
         
-        # 标签过滤
+        # 标签过滤（需包含全部标签）
         if tags:
-            for tag in tags:
-                base_query = base_query.filter(Template.tags.contains([tag]))
+            tag_names = set(tags)
+            tagged = (
+                select(TemplateTagMap.template_id)
+                .join(TemplateTag, TemplateTag.id == TemplateTagMap.tag_id)
+                .where(TemplateTag.name.in_(tag_names))
+                .group_by(TemplateTagMap.template_id)
+                .having(func.count() == len(tag_names))
+            )
+            base_query = base_query.filter(Template.id.in_(tagged))
         
         # 行业过滤
         if industry:
@@ -245,7 +299,7 @@ class TemplateService:
     
     async def get_popular_templates(self, limit: int = 10) -> List[Template]:
         """获取热门模板"""
-        return self.db.query(Template).filter(
+        return self.db.query(Template).options(*LIST_LOAD_OPTIONS).filter(
             Template.is_public == True
         ).order_by(
             desc(Template.usage_count),
@@ -254,7 +308,7 @@ class TemplateService:
     
     async def get_featured_templates(self, limit: int = 10) -> List[Template]:
         """获取推荐模板"""
-        return self.db.query(Template).filter(
+        return self.db.query(Template).options(*LIST_LOAD_OPTIONS).filter(
             and_(
                 Template.is_public == True,
                 Template.is_featured == True
@@ -263,31 +317,19 @@ class TemplateService:
     
     async def get_recent_templates(self, limit: int = 10) -> List[Template]:
         """获取最新模板"""
-        return self.db.query(Template).filter(
+        return self.db.query(Template).options(*LIST_LOAD_OPTIONS).filter(
             Template.is_public == True
         ).order_by(desc(Template.created_at)).limit(limit).all()
     
     async def use_template(self, template_id: str, user_id: str) -> bool:
         """使用模板（记录使用统计）"""
-        try:
-            # 记录使用记录
-            usage = TemplateUsage(
-                template_id=template_id,
-                user_id=user_id
-            )
-            self.db.add(usage)
-            
-            # 更新使用计数
-            template = self.db.query(Template).filter(Template.id == template_id).first()
-            if template:
-                template.usage_count += 1
-            
-            self.db.commit()
-            return True
-            
-        except Exception as e:
-            self.db.rollback()
+        exists = self.db.query(Template.id).filter(Template.id == template_id).first()
+        if not exists:
             return False
+        
+        # 使用记录与计数由后台任务批量写入
+        record_template_usage(template_id, user_id)
+        return True
     
     async def rate_template(
         self,
@@ -324,9 +366,8 @@ class TemplateService:
                 )
                 self.db.add(new_rating)
             
-            # 重新计算平均评分
-            await self._recalculate_template_rating(template_id)
-            
+            # 平均评分由 trg_template_rating_agg 触发器维护
+            sync_rating_aggregate(self.db, template_id)
             self.db.commit()
             return True
             
@@ -334,28 +375,23 @@ class TemplateService:
             self.db.rollback()
             raise ValueError(f"评分失败: {str(e)}")
     
-    async def _recalculate_template_rating(self, template_id: str):
-        """重新计算模板平均评分"""
-        result = self.db.query(
-            func.avg(TemplateRating.rating).label('avg_rating'),
-            func.count(TemplateRating.rating).label('rating_count')
-        ).filter(TemplateRating.template_id == template_id).first()
+    def resolve_tags(self, names: List[str]) -> List[TemplateTag]:
+        """按名称获取标签，不存在的标签自动创建（保持输入顺序并去重）"""
+        names = list(dict.fromkeys(name for name in names if name))
+        if not names:
+            return []
         
-        template = self.db.query(Template).filter(Template.id == template_id).first()
-        if template and result:
-            template.rating = result.avg_rating or 0.0
-            template.rating_count = result.rating_count or 0
-    
-    async def _update_tag_usage(self, tags: List[str]):
-        """更新标签使用统计"""
-        for tag_name in tags:
-            tag = self.db.query(TemplateTag).filter(TemplateTag.name == tag_name).first()
-            if tag:
-                tag.usage_count += 1
-            else:
-                # 创建新标签
-                new_tag = TemplateTag(name=tag_name, usage_count=1)
-                self.db.add(new_tag)
+        existing = {
+            tag.name: tag
+            for tag in self.db.query(TemplateTag).filter(TemplateTag.name.in_(names))
+        }
+        for name in names:
+            if name not in existing:
+                tag = TemplateTag(name=name, usage_count=0)
+                self.db.add(tag)
+                existing[name] = tag
+        
+        return [existing[name] for name in names]
 
 
 def get_template_service(db: Session) -> TemplateService:
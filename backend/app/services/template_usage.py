@@ -0,0 +1,90 @@
+"""
+模板使用记录批量写入
+
+每次使用模板只把事件放入内存缓冲区，后台任务按批（最多 USAGE_BATCH_SIZE 条
+或每 USAGE_FLUSH_INTERVAL 秒）用 Core 多行 INSERT 写入 template_usage，
+并按模板聚合后一次性更新 usage_count。写入前剔除引用已删除模板或用户的记录，
+避免一条外键冲突导致整批丢失。
+"""
+
+import logging
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Iterable, List, Set
+
+from sqlalchemy import Table, bindparam, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from config.database import SessionLocal
+from app.models.template import Template, TemplateUsage
+from app.models.user import User
+from app.services.batch_buffer import BatchBuffer
+
+logger = logging.getLogger(__name__)
+
+USAGE_QUEUE_SIZE = 10000
+USAGE_BATCH_SIZE = 1000
+USAGE_FLUSH_INTERVAL = 0.5
+
+
+def _as_uuid(value) -> uuid.UUID:
+    """统一为UUID，入队的ID可能是UUID或路径参数中的字符串"""
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
+
+def _lock_existing_ids(db: Session, table: Table, ids: Iterable) -> Set[uuid.UUID]:
+    """查询仍存在的ID，并加 FOR KEY SHARE 锁防止提交前被删除"""
+    return set(db.execute(
+        select(table.c.id).where(table.c.id.in_(set(ids))).with_for_update(key_share=True)
+    ).scalars())
+
+
+def _write_batch(batch: List[dict]):
+    """单个事务写入一批使用记录并累加使用计数"""
+    templates = Template.__table__
+
+    db = SessionLocal()
+    try:
+        template_ids = _lock_existing_ids(db, templates, (_as_uuid(item["template_id"]) for item in batch))
+        user_ids = _lock_existing_ids(db, User.__table__, (_as_uuid(item["user_id"]) for item in batch))
+        rows = [
+            item for item in batch
+            if _as_uuid(item["template_id"]) in template_ids and _as_uuid(item["user_id"]) in user_ids
+        ]
+        if len(rows) < len(batch):
+            logger.warning(f"丢弃{len(batch) - len(rows)}条引用已删除模板或用户的使用记录")
+        if rows:
+            counts = Counter(_as_uuid(item["template_id"]) for item in rows)
+            db.execute(insert(TemplateUsage), rows)
+            db.connection().execute(
+                update(templates)
+                .where(templates.c.id == bindparam("tid"))
+                .values(usage_count=func.coalesce(templates.c.usage_count, 0) + bindparam("n")),
+                [{"tid": template_id, "n": n} for template_id, n in counts.items()]
+            )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"写入模板使用记录失败（{len(batch)}条）: {e}")
+    finally:
+        db.close()
+
+
+usage_buffer = BatchBuffer(
+    "template_usage", USAGE_QUEUE_SIZE, USAGE_FLUSH_INTERVAL, _write_batch, USAGE_BATCH_SIZE
+)
+
+
+def record_template_usage(template_id, user_id):
+    """记录一次模板使用（仅入队，由后台任务批量写入）"""
+    usage_buffer.append({
+        "template_id": template_id,
+        "user_id": user_id,
+        "used_at": datetime.now(timezone.utc)
+    })
+
+
+def get_usage_queue_stats() -> dict:
+    """获取使用记录缓冲区状态"""
+    return usage_buffer.stats()
@@ -4,6 +4,7 @@
 
 import os
 from sqlalchemy import create_engine, MetaData, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
@@ -29,13 +30,22 @@ if DATABASE_URL.startswith("sqlite"):
     )
 else:
     # PostgreSQL配置
+    # psycopg2 下批量 UPDATE/DELETE（executemany）改用 execute_batch 分页发送，
+    # 批量 INSERT 仍由 insertmanyvalues 合并为多行 VALUES
+    _psycopg2_executemany_options = (
+        {"executemany_mode": "values_plus_batch", "executemany_batch_page_size": 500}
+        if make_url(DATABASE_URL).get_driver_name() == "psycopg2" else {}
+    )
     engine = create_engine(
         DATABASE_URL,
         pool_pre_ping=True,
         pool_recycle=300,
         pool_size=10,
         max_overflow=20,
-        echo=os.getenv("DEBUG", "false").lower() == "true"
+        query_cache_size=2000,  # 编译语句缓存（默认500）
+        insertmanyvalues_page_size=1000,  # 多行INSERT每批行数
+        echo=os.getenv("DEBUG", "false").lower() == "true",
+        **_psycopg2_executemany_options
     )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
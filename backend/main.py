@@ -5,12 +5,20 @@ Enhance Prompt Engineer - 主应用入口
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from contextlib import asynccontextmanager
+import threading
 import uvicorn
 import os
 from datetime import datetime
 
+# orjson 可用时默认用其序列化响应（datetime/UUID 原生支持，速度远快于标准库 json）
+try:
+    import orjson  # noqa: F401
+    DefaultResponse = ORJSONResponse
+except ImportError:
+    DefaultResponse = JSONResponse
+
 # 导入配置和数据库
 try:
     from config.database import check_db_connection, check_redis_connection, init_db
@@ -56,6 +64,23 @@ async def lifespan(app: FastAPI):
     else:
         print("⚠️ Redis连接失败，但应用继续运行")
 
+    # 在后台守护线程中预加载Claude分词器（首次需从Hugging Face下载），启动不等待；
+    # 加载完成前Claude模型的token数按字符数估算。不放入默认线程池，避免关闭时等待下载结束
+    try:
+        from app.services.ai_client import load_claude_tokenizer
+        threading.Thread(target=load_claude_tokenizer, name="claude-tokenizer", daemon=True).start()
+        print("✅ Claude分词器后台加载中")
+    except Exception as e:
+        print(f"⚠️ Claude分词器加载失败: {e}")
+
+    # 在当前事件循环上启动批量写入缓冲区的后台任务
+    try:
+        from app.services import template_usage, metrics_buffer, monitoring_service  # noqa: F401  导入即注册缓冲区
+        from app.services.batch_buffer import start_batch_buffers
+        start_batch_buffers()
+    except Exception as e:
+        print(f"⚠️ 批量写入任务启动失败: {e}")
+
     print("✅ 数据库连接正常")
     print(f"📝 API文档: http://localhost:8000/docs")
     print(f"🔍 健康检查: http://localhost:8000/health")
@@ -65,6 +90,21 @@ async def lifespan(app: FastAPI):
     # 关闭时执行
     print("🛑 Enhance Prompt Engineer API 正在关闭...")
 
+    # 停止批量写入任务，并写入尚未落库的模板使用记录、系统指标和请求指标
+    try:
+        from app.services.batch_buffer import stop_batch_buffers
+        await stop_batch_buffers()
+    except Exception as e:
+        print(f"⚠️ 缓冲区数据写入失败: {e}")
+
+    # 关闭共享的AI客户端HTTP连接池（仅在本进程创建过客户端时）
+    try:
+        from app.services.ai_client import get_ai_client
+        if get_ai_client.cache_info().currsize:
+            await get_ai_client().http_client.aclose()
+    except Exception as e:
+        print(f"⚠️ AI客户端连接池关闭失败: {e}")
+
 # 创建FastAPI应用实例
 app = FastAPI(
     title="Enhance Prompt Engineer API",
@@ -72,7 +112,8 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=DefaultResponse
 )
 
 # CORS中间件配置
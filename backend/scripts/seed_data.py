@@ -9,6 +9,7 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from sqlalchemy.orm import Session
 from config.database import SessionLocal, engine
 from app.models import User, UserPreference, Prompt, Template, AnalysisResult, OptimizationSuggestion
+from app.services.template_service import TemplateService, sync_tag_usage
 import uuid
 from datetime import datetime
 import hashlib
@@ -105,6 +106,7 @@ def create_test_templates(db: Session, users: list):
         }
     ]
     
+    template_service = TemplateService(db)
     created_templates = []
     for i, template_data in enumerate(templates_data):
         template = Template(
@@ -113,13 +115,15 @@ def create_test_templates(db: Session, users: list):
             description=template_data["description"],
             content=template_data["content"],
             category=template_data["category"],
-            tags=template_data["tags"],
+            tag_objects=template_service.resolve_tags(template_data["tags"]),
             usage_count=0,
-            rating=4.5,
+            rating=450,  # 百分制（4.50分）
             is_featured=i == 0,  # 第一个设为推荐
             is_public=True
         )
         db.add(template)
+        db.flush()  # 后续模板按名称查询标签时能查到本次新建的标签
+        sync_tag_usage(db, template.tag_objects)
         created_templates.append(template)
         print(f"创建模板: {template.name}")
     
@@ -12,24 +12,24 @@ import pytest
 import pytest_asyncio
 from fastapi.testclient import TestClient
 from httpx import AsyncClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
-from app.core.config import get_settings
-from app.core.database import Base, get_db
-from app.main import app
+from config.database import Base, get_db
+from main import app
 from app.models.user import User
-from app.models.prompt import Prompt
+from app.models.prompt import Prompt, AnalysisResult
 from app.models.template import Template
-from app.models.analysis import Analysis
-from app.services.auth_service import AuthService
 
 
 # 测试数据库配置
 TEST_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 TEST_SYNC_DATABASE_URL = "sqlite:///./test.db"
+# 依赖PostgreSQL特性（触发器、JSONB、CITEXT等）的测试使用的数据库；
+# 未设置 TEST_POSTGRES_URL 时，使用 pg_engine/pg_session 的测试全部跳过
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
 
 
 @pytest.fixture(scope="session")
@@ -148,16 +148,16 @@ async def test_admin_user(db_session: AsyncSession) -> User:
 @pytest.fixture
 def auth_headers(test_user: User) -> dict:
     """创建认证头"""
-    auth_service = AuthService()
-    token = auth_service.create_access_token(data={"sub": test_user.username})
+    from app.api.v1.endpoints.auth import create_access_token
+    token = create_access_token(data={"sub": test_user.username})
     return {"Authorization": f"Bearer {token}"}
 
 
 @pytest.fixture
 def admin_auth_headers(test_admin_user: User) -> dict:
     """创建管理员认证头"""
-    auth_service = AuthService()
-    token = auth_service.create_access_token(data={"sub": test_admin_user.username})
+    from app.api.v1.endpoints.auth import create_access_token
+    token = create_access_token(data={"sub": test_admin_user.username})
     return {"Authorization": f"Bearer {token}"}
 
 
@@ -206,7 +206,7 @@ async def test_template(db_session: AsyncSession, test_user: User) -> Template:
 
 
 @pytest.fixture
-async def test_analysis(db_session: AsyncSession, test_user: User, test_prompt: Prompt) -> Analysis:
+async def test_analysis(db_session: AsyncSession, test_user: User, test_prompt: Prompt) -> AnalysisResult:
     """创建测试分析结果"""
     analysis_data = {
         "prompt_id": test_prompt.id,
@@ -233,7 +233,7 @@ async def test_analysis(db_session: AsyncSession, test_user: User, test_prompt:
         "processing_time_ms": 1500
     }
     
-    analysis = Analysis(**analysis_data)
+    analysis = AnalysisResult(**analysis_data)
     db_session.add(analysis)
     await db_session.commit()
     await db_session.refresh(analysis)
@@ -241,6 +241,52 @@ async def test_analysis(db_session: AsyncSession, test_user: User, test_prompt:
     return analysis
 
 
+@pytest.fixture(scope="session")
+def pg_engine():
+    """创建PostgreSQL测试引擎，与应用 init_db 一样用 create_all 建表（建表时安装触发器）"""
+    if not TEST_POSTGRES_URL:
+        pytest.skip("未配置TEST_POSTGRES_URL")
+    
+    engine = create_engine(TEST_POSTGRES_URL)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS citext"))
+    Base.metadata.create_all(bind=engine)
+    
+    yield engine
+    
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def pg_session(pg_engine):
+    """创建PostgreSQL同步会话，测试结束后清空所有表"""
+    session = sessionmaker(bind=pg_engine)()
+    
+    yield session
+    
+    session.close()
+    table_names = ", ".join(table.name for table in Base.metadata.sorted_tables)
+    with pg_engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {table_names} CASCADE"))
+
+
+@pytest.fixture
+def pg_user_factory(pg_session):
+    """在PostgreSQL测试库中创建用户"""
+    def _create_user(username: str = "pguser") -> User:
+        user = User(
+            username=username,
+            email=f"{username}@example.com",
+            password_hash="$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW"
+        )
+        pg_session.add(user)
+        pg_session.commit()
+        return user
+    
+    return _create_user
+
+
 @pytest.fixture
 def mock_openai_client():
     """模拟OpenAI客户端"""
@@ -0,0 +1,91 @@
+"""
+批量写入缓冲区测试
+"""
+
+import asyncio
+
+import pytest
+
+from app.services import batch_buffer
+from app.services.batch_buffer import BatchBuffer
+
+
+@pytest.fixture
+def make_buffer(monkeypatch):
+    """创建不注册到全局列表的缓冲区，写入的批次记录在 batches 中"""
+    monkeypatch.setattr(batch_buffer, "_buffers", [])
+
+    def _make(maxlen: int = 100, batch_size: int = 10, flush_interval: float = 0.01):
+        batches = []
+        buffer = BatchBuffer("test", maxlen, flush_interval, batches.append, batch_size)
+        return buffer, batches
+
+    return _make
+
+
+class TestBatchBuffer:
+    """批量写入缓冲区测试"""
+
+    def test_full_buffer_drops_oldest(self, make_buffer):
+        """测试写满时淘汰最旧的记录并计入丢弃数"""
+        buffer, _ = make_buffer(maxlen=3)
+
+        for i in range(5):
+            buffer.append(i)
+
+        assert list(buffer._queue) == [2, 3, 4]
+        assert buffer.stats() == {"size": 3, "capacity": 3, "usage": 1.0, "dropped": 2}
+
+    @pytest.mark.asyncio
+    async def test_drain_writes_in_batches(self, make_buffer):
+        """测试后台任务按 batch_size 分批写入"""
+        buffer, batches = make_buffer(batch_size=2)
+        buffer.start()
+
+        for i in range(5):
+            buffer.append(i)
+        await asyncio.sleep(0.1)
+        await buffer.stop()
+
+        assert batches == [[0, 1], [2, 3], [4]]
+
+    @pytest.mark.asyncio
+    async def test_stop_flushes_remaining_items(self, make_buffer):
+        """测试停止时取消任务并写入剩余记录"""
+        buffer, batches = make_buffer(flush_interval=60)
+        buffer.start()
+        await asyncio.sleep(0)
+
+        buffer.append("pending")
+        await buffer.stop()
+
+        assert batches == [["pending"]]
+        assert buffer._task is None
+
+    def test_restart_on_new_event_loop(self, make_buffer):
+        """测试停止后可在新的事件循环上重新启动"""
+        buffer, batches = make_buffer()
+
+        async def run_once(item):
+            buffer.start()
+            buffer.append(item)
+            await buffer.stop()
+
+        asyncio.run(run_once("first"))
+        asyncio.run(run_once("second"))
+
+        assert batches == [["first"], ["second"]]
+
+    @pytest.mark.asyncio
+    async def test_start_and_stop_all_buffers(self, make_buffer):
+        """测试统一启停所有已注册的缓冲区"""
+        first, first_batches = make_buffer(flush_interval=60)
+        second, second_batches = make_buffer(flush_interval=60)
+
+        batch_buffer.start_batch_buffers()
+        first.append(1)
+        second.append(2)
+        await batch_buffer.stop_batch_buffers()
+
+        assert first_batches == [[1]]
+        assert second_batches == [[2]]
@@ -0,0 +1,112 @@
+"""
+模板聚合字段测试
+
+评分聚合与标签使用次数由 create_all 建表时安装的触发器维护，
+验证按应用自身的建表方式建出的库上聚合值会随写入更新。
+
+需要 PostgreSQL：未设置 TEST_POSTGRES_URL 环境变量时本模块的测试全部跳过。
+"""
+
+import pytest
+
+from app.models.template import TemplateRating, TemplateTag
+from app.services.template_service import TemplateService
+
+
+@pytest.mark.database
+@pytest.mark.template
+class TestTemplateRatingAggregate:
+    """模板评分聚合测试"""
+
+    @pytest.mark.asyncio
+    async def test_new_ratings_update_aggregate(self, pg_session, pg_user_factory):
+        """测试新增评分后平均分、评分人数、评分总和同步更新"""
+        creator = pg_user_factory("creator")
+        rater = pg_user_factory("rater")
+        service = TemplateService(pg_session)
+        template = await service.create_template(creator.id, "评分模板", "内容")
+
+        await service.rate_template(template.id, creator.id, 5)
+        await service.rate_template(template.id, rater.id, 4)
+        pg_session.refresh(template)
+
+        assert template.rating_count == 2
+        assert template.rating_sum == 9
+        assert template.rating == 450
+        assert template.to_dict()["rating"] == 4.5
+
+    @pytest.mark.asyncio
+    async def test_changed_rating_replaces_previous(self, pg_session, pg_user_factory):
+        """测试同一用户重新评分时替换原评分而不是累加"""
+        user = pg_user_factory()
+        service = TemplateService(pg_session)
+        template = await service.create_template(user.id, "评分模板", "内容")
+
+        await service.rate_template(template.id, user.id, 5)
+        await service.rate_template(template.id, user.id, 2)
+        pg_session.refresh(template)
+
+        assert template.rating_count == 1
+        assert template.rating_sum == 2
+        assert template.rating == 200
+
+    @pytest.mark.asyncio
+    async def test_deleted_rating_is_removed_from_aggregate(self, pg_session, pg_user_factory):
+        """测试删除评分后聚合值回退"""
+        user = pg_user_factory()
+        service = TemplateService(pg_session)
+        template = await service.create_template(user.id, "评分模板", "内容")
+        await service.rate_template(template.id, user.id, 3)
+
+        pg_session.query(TemplateRating).filter(TemplateRating.template_id == template.id).delete()
+        pg_session.commit()
+        pg_session.refresh(template)
+
+        assert template.rating_count == 0
+        assert template.rating_sum == 0
+        assert template.rating == 0
+
+
+def _tag_usage(session) -> dict:
+    """读取各标签的使用次数"""
+    session.expire_all()
+    return {tag.name: tag.usage_count for tag in session.query(TemplateTag)}
+
+
+@pytest.mark.database
+@pytest.mark.template
+class TestTemplateTagUsage:
+    """标签使用次数测试"""
+
+    @pytest.mark.asyncio
+    async def test_create_template_counts_tags(self, pg_session, pg_user_factory):
+        """测试创建模板后标签使用次数增加"""
+        user = pg_user_factory()
+        service = TemplateService(pg_session)
+
+        await service.create_template(user.id, "模板一", "内容", tags=["写作", "营销"])
+        await service.create_template(user.id, "模板二", "内容", tags=["写作"])
+
+        assert _tag_usage(pg_session) == {"写作": 2, "营销": 1}
+
+    @pytest.mark.asyncio
+    async def test_update_template_tags_moves_counts(self, pg_session, pg_user_factory):
+        """测试修改标签后旧标签减少、新标签增加"""
+        user = pg_user_factory()
+        service = TemplateService(pg_session)
+        template = await service.create_template(user.id, "模板", "内容", tags=["写作", "营销"])
+
+        await service.update_template(template.id, user.id, tags=["营销", "编程"])
+
+        assert _tag_usage(pg_session) == {"写作": 0, "营销": 1, "编程": 1}
+
+    @pytest.mark.asyncio
+    async def test_delete_template_releases_tags(self, pg_session, pg_user_factory):
+        """测试删除模板后标签使用次数回退"""
+        user = pg_user_factory()
+        service = TemplateService(pg_session)
+        template = await service.create_template(user.id, "模板", "内容", tags=["写作"])
+
+        await service.delete_template(template.id, user.id)
+
+        assert _tag_usage(pg_session) == {"写作": 0}
@@ -0,0 +1,95 @@
+"""
+模板列表查询数回归测试
+
+列表接口使用 LIST_LOAD_OPTIONS：标签批量预加载，其余关系禁止懒加载，
+查询条数应与返回的模板数量无关。
+
+需要 PostgreSQL：未设置 TEST_POSTGRES_URL 环境变量时本模块的测试全部跳过。
+"""
+
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import InvalidRequestError
+
+from app.services.template_service import TemplateService
+
+
+@contextmanager
+def count_queries(engine):
+    """统计代码块内发往数据库的SQL语句"""
+    statements = []
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", _before_cursor_execute)
+
+
+async def _create_templates(service: TemplateService, creator_id, count: int):
+    """创建带标签的公开模板"""
+    for i in range(count):
+        await service.create_template(
+            creator_id=creator_id,
+            name=f"模板{i}",
+            content=f"模板内容{i}",
+            tags=["写作", f"标签{i}"]
+        )
+
+
+@pytest.mark.database
+@pytest.mark.template
+class TestTemplateListQueries:
+    """模板列表查询数测试"""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("template_count", [1, 10])
+    async def test_popular_templates_query_count(self, pg_session, pg_user_factory, template_count):
+        """测试热门模板：模板一次 + 标签一次，不随模板数量增长"""
+        user = pg_user_factory()
+        service = TemplateService(pg_session)
+        await _create_templates(service, user.id, template_count)
+        pg_session.expunge_all()
+
+        with count_queries(pg_session.get_bind()) as statements:
+            templates = await service.get_popular_templates(limit=50)
+            payload = [template.to_dict(include_content=False) for template in templates]
+
+        assert len(payload) == template_count
+        assert all("写作" in item["tags"] for item in payload)
+        assert len(statements) == 2
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("template_count", [1, 10])
+    async def test_search_templates_query_count(self, pg_session, pg_user_factory, template_count):
+        """测试模板搜索：总数、列表、标签各一次，不随模板数量增长"""
+        user = pg_user_factory()
+        service = TemplateService(pg_session)
+        await _create_templates(service, user.id, template_count)
+        pg_session.expunge_all()
+
+        with count_queries(pg_session.get_bind()) as statements:
+            templates, total = await service.search_templates(tags=["写作"], page_size=50)
+            payload = [template.to_dict(include_content=False) for template in templates]
+
+        assert total == template_count
+        assert len(payload) == template_count
+        assert len(statements) == 3
+
+    @pytest.mark.asyncio
+    async def test_list_query_blocks_lazy_relationships(self, pg_session, pg_user_factory):
+        """测试列表结果上访问未预加载的关系会直接报错，而不是逐条懒加载"""
+        user = pg_user_factory()
+        service = TemplateService(pg_session)
+        await _create_templates(service, user.id, 1)
+        pg_session.expunge_all()
+
+        templates = await service.get_popular_templates()
+
+        with pytest.raises(InvalidRequestError):
+            templates[0].creator